@@ -0,0 +1,158 @@
+"""
+Samples per second of the SessionDataset loader (recorders/dataset.py), for sequential and shuffled access.
+
+Every mode reads the same windows for --epochs epochs and reports samples/s of the first epoch (cold cache) and of
+the later ones, the decoded chunk cache hit rate and its size:
+- direct: a Session per sample query (Session.frames_at / audio), no chunk cache, no prefetch. The baseline.
+- sequential, shuffled: the SessionDataset with its cache and prefetch threads.
+- shuffled, no cache: the SessionDataset with cache_bytes=0, every window decodes its chunks again.
+
+With --check-export, the windows are also exported as shards by a ShardExporter with the same parameters (see
+recorders/export.py) first, and every exported window is compared to the dataset's item: both must give the same
+frames, samples and events.
+
+Without session directories, a synthetic session (screen, webcam, microphone and mouse from recorders/sources.py)
+is recorded into a temporary directory first.
+
+Usage:
+    python -m benchmarks.dataset --record 30
+    python -m benchmarks.dataset data/20240101-120000 --frame-size 320 180 --workers 8 --samples 500
+    python -m benchmarks.dataset --record 10 --check-export --epochs 1
+"""
+
+import argparse
+import atexit
+import tempfile
+import time
+import numpy as np
+from pathlib import Path
+
+from recorders import ScreenRecorder, WebcamRecorder, MircophoneRecorder, MouseListener, SessionClock, Session, SessionDataset, ShardExporter
+from recorders.sources import SyntheticScreenSource, SyntheticCamera, SyntheticAudio, SyntheticInputStorm
+
+
+def record_session(output_dir, duration):
+    clock = SessionClock()
+    storm = SyntheticInputStorm(mouse_rate=200, key_rate=0)
+    recorders = [ScreenRecorder(output_file=str(output_dir / 'screens.mp4'), fps=10, clock=clock, source=SyntheticScreenSource(1280, 720)),
+                 WebcamRecorder(output_file=str(output_dir / 'webcam.mp4'), fps=30, clock=clock, capture=SyntheticCamera(640, 480, fps=30)),
+                 MircophoneRecorder(str(output_dir / 'microphone.wav'), clock=clock, audio=SyntheticAudio()),
+                 MouseListener(bin_file=output_dir / 'mouse.bin', controller=storm.mouse_controller(), listener=storm.mouse_listener, clock=clock)]
+    for recorder in recorders:
+        recorder.start()
+    time.sleep(duration)
+    for recorder in recorders:
+        recorder.stop()
+    atexit.unregister(recorders[2].stop)  # already stopped, and the directory is gone at exit
+    recorders[3].bin_file.close()
+
+
+def direct(dataset, order):
+    # The same windows through plain Session queries
+    sessions = {}
+    for i in order:
+        number, start_time = int(dataset.window_sessions[i]), float(dataset.window_starts[i])
+        if number not in sessions:
+            sessions[number] = Session(dataset.session_dirs[number])
+        session = sessions[number]
+        for kind, name in dataset.sessions[number][0]:
+            if kind == 'video':
+                session.frames_at(start_time + dataset.frame_offsets, name)
+            elif kind == 'audio':
+                session.audio(start_time, start_time + dataset.window, name)
+            elif kind == 'mouse':
+                session.mouse(start_time, start_time + dataset.window)
+        yield i
+    for session in sessions.values():
+        session.close()
+
+
+def check_export(dataset, output_dir, args):
+    # The exported shards and the dataset items of the same windows must be equal; returns the number of windows checked
+    exporter = ShardExporter(output_dir, window=args.window, video_fps=args.video_fps, frame_size=args.frame_size, max_workers=2)
+    exporter.export(dataset.session_dirs)
+    checked = 0
+    for number, session_dir in enumerate(dataset.session_dirs):
+        items = np.flatnonzero(dataset.window_sessions == number)
+        shards = [np.load(path) for path in sorted((Path(output_dir) / Path(session_dir).name).glob('shard_*.npz'))]
+        windows = [(shard, j) for shard in shards for j in range(len(shard['window_start']))]
+        assert len(windows) == len(items), f"{session_dir}: {len(windows)} exported windows, {len(items)} dataset windows"
+        for i, (shard, j) in zip(items, windows):
+            item = dataset[i]
+            assert shard['window_start'][j] == item['start_time'], f"window {i}: starts at {shard['window_start'][j]}, not {item['start_time']}"
+            for kind, name in dataset.sessions[number][0]:
+                if kind == 'video':
+                    expected = {name: shard[name][j], f'{name}_mask': shard[f'{name}_mask'][j]}
+                elif kind == 'audio':
+                    expected = {name: shard[name][j]}
+                elif kind == 'mouse':
+                    expected = {'mouse': shard['mouse'][shard['mouse_offsets'][j]:shard['mouse_offsets'][j + 1]]}
+                else:
+                    begin, end = shard['keyboard_offsets'][j], shard['keyboard_offsets'][j + 1]
+                    expected = {f'keyboard_{field}': shard[f'keyboard_{field}'][begin:end] for field in ('event', 'key', 'time')}
+                for key, value in expected.items():
+                    assert np.array_equal(value, item[key]), f"window {i} of {session_dir}: {key} differs between the shard and the dataset"
+            checked += 1
+    return checked
+
+
+def measure(name, epoch, epochs, num_samples, cache=None):
+    # samples/s of the first epoch (cold cache) and of the later ones
+    rates = []
+    for number in range(epochs):
+        start = time.perf_counter()
+        count = 0
+        for _ in epoch(number):
+            count += 1
+            if count == num_samples:
+                break
+        rates.append(count / (time.perf_counter() - start))
+    later = np.mean(rates[1:]) if len(rates) > 1 else float('nan')
+    hit_rate = cache.hits / max(1, cache.hits + cache.misses) if cache is not None else float('nan')
+    size = cache.size / 2 ** 20 if cache is not None else float('nan')
+    print(f"{name:20s} {rates[0]:10.1f} {later:10.1f} {hit_rate:10.1%} {size:10.1f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('sessions', nargs='*', help='session directories; a synthetic session if none')
+    parser.add_argument('--record', type=float, default=30, help='seconds of synthetic session to record')
+    parser.add_argument('--window', type=float, default=1.0)
+    parser.add_argument('--video-fps', type=float, default=4)
+    parser.add_argument('--frame-size', type=int, nargs=2, default=(320, 180))
+    parser.add_argument('--chunk-duration', type=float, default=10.0)
+    parser.add_argument('--cache-mb', type=float, default=1024)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--samples', type=int, default=None, help='windows per epoch, default all')
+    parser.add_argument('--epochs', type=int, default=3)
+    parser.add_argument('--check-export', action='store_true', help='check that exported shards equal the dataset items first')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temporary_dir:
+        sessions = args.sessions
+        if not sessions:
+            print(f"Recording a {args.record:g} s synthetic session...")
+            record_session(Path(temporary_dir), args.record)
+            sessions = [temporary_dir]
+
+        def dataset(cache_mb=args.cache_mb):
+            return SessionDataset(sessions, window=args.window, video_fps=args.video_fps, frame_size=args.frame_size,
+                                  chunk_duration=args.chunk_duration, cache_bytes=int(cache_mb * 2 ** 20), workers=args.workers)
+
+        base = dataset()
+        if args.check_export:
+            with tempfile.TemporaryDirectory() as shard_dir:
+                print(f"Exported shards equal the dataset items: {check_export(base, shard_dir, args)} windows checked")
+        num_samples = args.samples or len(base)
+        print(f"{len(base)} windows of {args.window:g} s, {num_samples} per epoch, {args.epochs} epochs")
+        print(f"{'mode':20s} {'epoch 1/s':>10s} {'later/s':>10s} {'cache hits':>10s} {'cache MiB':>10s}")
+
+        def shuffled(number):
+            return np.random.default_rng(number).permutation(len(base))
+
+        measure('direct sequential', lambda number: direct(base, range(len(base))), args.epochs, num_samples)
+        measure('direct shuffled', lambda number: direct(base, shuffled(number)), args.epochs, num_samples)
+        for name, cache_mb, shuffle in (('sequential', args.cache_mb, False), ('shuffled', args.cache_mb, True), ('shuffled, no cache', 0, True)):
+            loader = dataset(cache_mb)
+            measure(name, lambda number: loader.iterate(shuffle=shuffle, seed=number), args.epochs, num_samples, loader.cache)
+            loader.close()
@@ -0,0 +1,79 @@
+"""
+Compare the video encoder backends (recorders/encoders.py) on synthetic screen-like frames.
+
+For each backend this reports the encode speed (frames per second written, including the time to finalize the file)
+and the output size in bytes per minute of recording at the given fps.
+
+Usage:
+    python -m benchmarks.encoders --width 1920 --height 1080 --frames 300 --fps 4
+    python -m benchmarks.encoders --backends opencv ffmpeg:libx264:veryfast:23 ffmpeg:libx264:ultrafast:28
+    python -m benchmarks.encoders --backends opencv tiles tiles:32 tiles:64:lz4  # tiles is lossless, the others are not
+"""
+
+import argparse
+import tempfile
+import time
+import numpy as np
+from pathlib import Path
+
+from recorders.encoders import create_encoder
+from recorders.tile_codec import tile_index_path
+
+
+def synthetic_frames(width, height, num_frames, seed=0):
+    # A mostly static "desktop" with a few small changing regions (typing, a moving cursor), like a real screen recording
+    rng = np.random.default_rng(seed)
+    background = np.tile(np.linspace(30, 220, width, dtype=np.uint8)[None, :, None], (height, 1, 3))
+    background[::24] = 255  # text lines
+    frames = []
+    for i in range(num_frames):
+        frame = background.copy()
+        x, y = (i * 13) % (width - 32), (i * 7) % (height - 32)
+        frame[y:y + 32, x:x + 32] = rng.integers(0, 256, (32, 32, 3), dtype=np.uint8)
+        frames.append(frame)
+    return frames
+
+
+def parse_backend(spec):
+    # 'opencv', 'opencv:<fourcc>', 'ffmpeg:<codec>:<preset>:<crf>' or 'tiles:<tile_size>:<compression>'
+    name, *params = spec.split(':')
+    if name == 'opencv':
+        return name, ({'fourcc': params[0]} if params else {})
+    if name == 'tiles':
+        return name, dict(zip(('tile_size', 'compression'), params[:1] and [int(params[0])] + params[1:]))
+    options = {}
+    for key, value in zip(('codec', 'preset', 'crf'), params):
+        options[key] = value
+    return name, options
+
+
+def benchmark(backend, options, frames, fps, output_dir):
+    height, width = frames[0].shape[:2]
+    suffix = '.tiles' if backend == 'tiles' else '.mp4'
+    output_file = Path(output_dir) / f"{backend}_{'_'.join(str(v) for v in options.values()) or 'default'}{suffix}"
+    start = time.perf_counter()
+    out = create_encoder(output_file, fps, (width, height), backend=backend, **options)
+    for frame in frames:
+        out.write(frame)
+    out.release()
+    elapsed = time.perf_counter() - start
+    size = sum(path.stat().st_size for path in (output_file, tile_index_path(output_file)) if path.exists())  # including the tile index
+    return len(frames) / elapsed, size / (len(frames) / fps) * 60
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--width', type=int, default=1920)
+    parser.add_argument('--height', type=int, default=1080)
+    parser.add_argument('--frames', type=int, default=120)
+    parser.add_argument('--fps', type=float, default=4)
+    parser.add_argument('--backends', nargs='+', default=['opencv', 'ffmpeg:libx264:veryfast:23'])
+    args = parser.parse_args()
+
+    frames = synthetic_frames(args.width, args.height, args.frames)
+    with tempfile.TemporaryDirectory() as output_dir:
+        print(f"{'backend':40s} {'encode fps':>12s} {'MB/minute':>12s}")
+        for spec in args.backends:
+            backend, options = parse_backend(spec)
+            encode_fps, bytes_per_minute = benchmark(backend, options, frames, args.fps, output_dir)
+            print(f"{spec:40s} {encode_fps:12.1f} {bytes_per_minute / 1e6:12.2f}")
@@ -0,0 +1,124 @@
+"""
+Headless throughput benchmark of the recorders, driven by the synthetic capture backends (recorders/sources.py),
+so it runs on CI boxes and servers without a display, camera, sound card or input devices.
+
+Each recorder runs alone for --duration seconds, writing into a temporary directory, and reports:
+- rate: achieved frames (events, samples) per second, from the written timestamps.
+- jitter: standard deviation of the interval between consecutive frames (audio: chunk reads), in ms.
+- drops: frames dropped by the pipeline (screen), events/samples generated but not written (input, audio).
+- cpu/item: process CPU time per frame (event, chunk) in ms. This includes generating the synthetic data.
+- bytes/s: bytes written to disk per second.
+
+Usage:
+    python -m benchmarks.recorders --duration 10
+    python -m benchmarks.recorders --only screen webcam --screen-size 2560 1440 --screen-fps 30
+"""
+
+import argparse
+import atexit
+import tempfile
+import time
+import numpy as np
+from pathlib import Path
+
+from recorders import ScreenRecorder, WebcamRecorder, MircophoneRecorder, MouseListener, KeyboardListener
+from recorders.sources import SyntheticScreenSource, SyntheticCamera, SyntheticAudio, SyntheticInputStorm
+from recorders.timestamp_index import load_timestamp_index, AUDIO_INDEX_DTYPE
+from recorders.mouse_reader import MouseLogReader
+from recorders.keyboard_log import KeyboardLogReader
+
+
+def run(recorder, duration):
+    # Run the recorder for `duration` seconds, return (cpu seconds, wall seconds)
+    cpu_start, wall_start = time.process_time(), time.monotonic()
+    recorder.start()
+    time.sleep(duration)
+    recorder.stop()
+    return time.process_time() - cpu_start, time.monotonic() - wall_start
+
+
+def directory_size(path):
+    return sum(f.stat().st_size for f in Path(path).iterdir() if f.is_file())
+
+
+def interval_stats(times):
+    if len(times) < 2:
+        return 0.0, 0.0
+    intervals = np.diff(times)
+    return (len(times) - 1) / (times[-1] - times[0]), intervals.std() * 1000
+
+
+def bench_screen(output_dir, args):
+    width, height = args.screen_size
+    recorder = ScreenRecorder(output_file=output_dir / 'screens.mp4', fps=args.screen_fps, source=SyntheticScreenSource(width, height, change_every=args.change_every))
+    cpu, wall = run(recorder, args.duration)
+    times = load_timestamp_index(recorder.timestamps_path)['time']
+    rate, jitter = interval_stats(times)
+    return rate, jitter, recorder.dropped_frames, cpu / max(1, len(times)) * 1000, directory_size(output_dir) / wall
+
+
+def bench_webcam(output_dir, args):
+    width, height = args.webcam_size
+    recorder = WebcamRecorder(output_file=str(output_dir / 'webcam.mp4'), fps=args.webcam_fps, capture=SyntheticCamera(width, height, fps=args.webcam_fps))
+    cpu, wall = run(recorder, args.duration)
+    times = load_timestamp_index(recorder.timestamps_path)['time']
+    rate, jitter = interval_stats(times)
+    drops = max(0, int(wall * args.webcam_fps) - len(times))
+    return rate, jitter, drops, cpu / max(1, len(times)) * 1000, directory_size(output_dir) / wall
+
+
+def bench_audio(output_dir, args):
+    recorder = MircophoneRecorder(str(output_dir / 'microphone.wav'), sample_rate=args.sample_rate, audio=SyntheticAudio())
+    cpu, wall = run(recorder, args.duration)
+    atexit.unregister(recorder.stop)  # already stopped, and the output directory is gone by then
+    index = load_timestamp_index(recorder.timestamps_path, dtype=AUDIO_INDEX_DTYPE)
+    _, jitter = interval_stats(index['arrival_time'])
+    rate = recorder.sample_count / wall
+    drops = max(0, int(wall * args.sample_rate) - recorder.sample_count - recorder.CHUNK)  # the last chunk may still be in flight
+    return rate, jitter, drops, cpu / max(1, len(index)) * 1000, directory_size(output_dir) / wall
+
+
+def bench_mouse(output_dir, args):
+    storm = SyntheticInputStorm(mouse_rate=args.mouse_rate)
+    recorder = MouseListener(bin_file=output_dir / 'mouse.bin', controller=storm.mouse_controller(), listener=storm.mouse_listener)
+    cpu, wall = run(recorder, args.duration)
+    recorder.bin_file.close()
+    times = MouseLogReader(output_dir / 'mouse.bin').events['time']
+    rate, jitter = interval_stats(times)
+    drops = storm.generated['mouse'] - len(times)
+    return rate, jitter, drops, cpu / max(1, len(times)) * 1000, directory_size(output_dir) / wall
+
+
+def bench_keyboard(output_dir, args):
+    storm = SyntheticInputStorm(key_rate=args.key_rate)
+    recorder = KeyboardListener(bin_file=output_dir / 'keyboard.bin', hook=storm.keyboard_hook())
+    cpu, wall = run(recorder, args.duration)
+    recorder.bin_file.close()
+    times = KeyboardLogReader(output_dir / 'keyboard.bin').events['time']
+    rate, jitter = interval_stats(times)
+    drops = storm.generated['keyboard'] - len(times)
+    return rate, jitter, drops, cpu / max(1, len(times)) * 1000, directory_size(output_dir) / wall
+
+
+BENCHMARKS = {'screen': bench_screen, 'webcam': bench_webcam, 'audio': bench_audio, 'mouse': bench_mouse, 'keyboard': bench_keyboard}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--duration', type=float, default=5.0)
+    parser.add_argument('--only', nargs='+', choices=list(BENCHMARKS), default=list(BENCHMARKS))
+    parser.add_argument('--screen-size', type=int, nargs=2, default=(1920, 1080))
+    parser.add_argument('--screen-fps', type=float, default=10)
+    parser.add_argument('--change-every', type=int, default=1, help='synthetic screen changes every N grabs (0: idle screen)')
+    parser.add_argument('--webcam-size', type=int, nargs=2, default=(640, 480))
+    parser.add_argument('--webcam-fps', type=float, default=30)
+    parser.add_argument('--sample-rate', type=int, default=16000)
+    parser.add_argument('--mouse-rate', type=float, default=1000)
+    parser.add_argument('--key-rate', type=float, default=20)
+    args = parser.parse_args()
+
+    print(f"{'recorder':10s} {'rate':>10s} {'jitter ms':>10s} {'drops':>8s} {'cpu/item ms':>12s} {'bytes/s':>12s}")
+    for name in args.only:
+        with tempfile.TemporaryDirectory() as output_dir:
+            rate, jitter, drops, cpu_per_item, bytes_per_second = BENCHMARKS[name](Path(output_dir), args)
+        print(f"{name:10s} {rate:10.1f} {jitter:10.2f} {drops:8d} {cpu_per_item:12.3f} {bytes_per_second:12.0f}")
@@ -0,0 +1,87 @@
+"""
+Compare the mouse move compression modes (recorders/trajectory.py) on recorded or synthetic traces.
+
+For every max_error this reports how many move events the TrajectorySimplifier keeps, the bytes saved in mouse.bin,
+and the reconstruction error (distance between every original sample and the linear interpolation of the kept
+samples at its timestamp, in pixels). For comparison, the delta_time throttle is run at the same average rate of kept
+events (delta_time = duration / kept moves), which keeps fewer events when the trace has pauses.
+
+Usage:
+    python -m benchmarks.trajectory                       # synthetic trace: slow drags, fast flicks and pauses
+    python -m benchmarks.trajectory data/*/mouse.bin --max-errors 1 2 4 8
+"""
+
+import argparse
+import numpy as np
+
+from recorders.mouse_reader import MouseLogReader, MOUSE_EVENT_DTYPE
+from recorders.trajectory import simplify_trajectory
+
+
+def synthetic_trace(seconds=60, rate=250, seed=0):
+    # A trace sampled at `rate` Hz: slow drags with hand tremor, fast minimum-jerk flicks and pauses
+    rng = np.random.default_rng(seed)
+    xs, ys, times = [], [], []
+    t, position = 0.0, np.array([960.0, 540.0])
+    while t < seconds:
+        kind = rng.choice(['drag', 'flick', 'pause'], p=[0.4, 0.4, 0.2])
+        if kind == 'pause':
+            t += rng.uniform(0.2, 1.5)  # no events while the mouse rests
+            continue
+        target = rng.uniform([0, 0], [1920, 1080])
+        duration = rng.uniform(1.0, 4.0) if kind == 'drag' else rng.uniform(0.08, 0.25)
+        s = np.arange(1, int(duration * rate) + 1) / (duration * rate)
+        s = s if kind == 'drag' else 10 * s ** 3 - 15 * s ** 4 + 6 * s ** 5  # minimum jerk profile
+        path = position + s[:, None] * (target - position) + rng.normal(0, 0.7 if kind == 'drag' else 0.3, (len(s), 2))
+        xs.extend(path[:, 0])
+        ys.extend(path[:, 1])
+        times.extend(t + np.arange(1, len(s) + 1) / rate)
+        t += duration
+        position = target
+    xs, ys = np.round(xs).astype(np.int64), np.round(ys).astype(np.int64)
+    keep = np.ones(len(xs), dtype=bool)
+    keep[1:] = (np.diff(xs) != 0) | (np.diff(ys) != 0)  # MouseListener only records actual moves
+    return np.asarray(times)[keep], xs[keep], ys[keep]
+
+
+def throttle(times, delta_time):
+    # Indexes kept by MouseListener's delta_time throttle
+    kept, previous = [], -np.inf
+    for i, t in enumerate(times):
+        if t - previous >= delta_time:
+            kept.append(i)
+            previous = t
+    return np.array(kept, dtype=np.int64)
+
+
+def reconstruction_error(times, xs, ys, kept):
+    x = np.interp(times, times[kept], xs[kept])
+    y = np.interp(times, times[kept], ys[kept])
+    return np.hypot(x - xs, y - ys)
+
+
+def report(name, times, xs, ys, max_errors):
+    record_size = MOUSE_EVENT_DTYPE.itemsize
+    print(f"{name}: {len(times)} moves, {times[-1] - times[0]:.1f} s, {len(times) * record_size} bytes")
+    print(f"{'mode':>22s} {'kept':>8s} {'saved':>8s} {'mean err':>9s} {'p99 err':>9s} {'max err':>9s}")
+    for max_error in max_errors:
+        kept = simplify_trajectory(times, xs, ys, max_error=max_error)
+        delta_time = (times[-1] - times[0]) / len(kept)
+        for mode, indexes in ((f'max_error={max_error:g}', kept), (f'delta_time={delta_time:.3f}', throttle(times, delta_time))):
+            error = reconstruction_error(times, xs, ys, indexes)
+            saved = 1 - len(indexes) / len(times)
+            print(f"{mode:>22s} {len(indexes):8d} {saved:8.1%} {error.mean():9.2f} {np.percentile(error, 99):9.2f} {error.max():9.2f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('bin_files', nargs='*', help='recorded mouse logs; a synthetic trace if none')
+    parser.add_argument('--max-errors', type=float, nargs='+', default=[0.5, 1, 2, 4, 8])
+    args = parser.parse_args()
+
+    if not args.bin_files:
+        report('synthetic', *synthetic_trace(), args.max_errors)
+    for bin_file in args.bin_files:
+        events = np.asarray(MouseLogReader(bin_file).events)
+        moves = events[events['event_id'] == 0]
+        report(bin_file, moves['time'], moves['x'].astype(np.int64), moves['y'].astype(np.int64), args.max_errors)
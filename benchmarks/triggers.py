@@ -0,0 +1,89 @@
+"""
+Input-triggered screen capture (ScreenRecorder with activity, see recorders/activity.py) against a fixed frame rate.
+
+Both modes record a synthetic screen while a SyntheticInputStorm clicks and types for the first half of --duration
+seconds, and nothing happens in the second half. Per mode:
+- captures: number of grabs, in the active and the idle half.
+- input delay: time from a click or key press (from the mouse and keyboard logs) to the next grab, p50/p90/max in ms.
+    This is what a model looking at the frames after an input has to wait for.
+- trigger latency: the recorder's own trigger_latency metric (input event published -> grab done), p50/p99 in ms.
+
+Usage:
+    python -m benchmarks.triggers --duration 20 --fps 4 --burst-fps 15 --idle-fps 0.5
+"""
+
+import argparse
+import tempfile
+import time
+import numpy as np
+from pathlib import Path
+
+from recorders import ScreenRecorder, MouseListener, KeyboardListener, SessionClock
+from recorders.sources import SyntheticScreenSource, SyntheticInputStorm
+from recorders.timestamp_index import load_timestamp_index
+from recorders.mouse_reader import MouseLogReader
+from recorders.keyboard_log import KeyboardLogReader
+
+
+def record(output_dir, args, triggered):
+    clock = SessionClock()
+    storm = SyntheticInputStorm(mouse_rate=args.mouse_rate, key_rate=args.key_rate, click_every=args.click_every, scroll_every=0)
+    mouse = MouseListener(bin_file=output_dir / 'mouse.bin', controller=storm.mouse_controller(), listener=storm.mouse_listener, clock=clock)
+    keyboard = KeyboardListener(bin_file=output_dir / 'keyboard.bin', hook=storm.keyboard_hook(), clock=clock)
+    options = {}
+    if triggered:
+        options = dict(activity=[mouse.activity, keyboard.activity], burst_fps=args.burst_fps, burst_duration=args.burst_duration,
+                       idle_fps=args.idle_fps, idle_after=args.idle_after)
+    screen = ScreenRecorder(output_file=output_dir / 'screens.mp4', fps=args.fps, clock=clock,
+                            source=SyntheticScreenSource(*args.screen_size), **options)
+    screen.start()
+    mouse.start()
+    keyboard.start()
+    time.sleep(args.duration / 2)
+    mouse.stop()
+    keyboard.stop()
+    idle_start = clock.time()
+    time.sleep(args.duration / 2)
+    screen.stop()
+    mouse.bin_file.close()
+    keyboard.bin_file.close()
+
+    grabs = load_timestamp_index(screen.timestamps_path)['time']
+    mouse_events = MouseLogReader(output_dir / 'mouse.bin').events
+    clicks = mouse_events['time'][(mouse_events['event_id'] >= 1) & (mouse_events['event_id'] <= 4)]
+    key_events = KeyboardLogReader(output_dir / 'keyboard.bin').events
+    presses = key_events['time'][key_events['event'] == 0]
+    inputs = np.sort(np.concatenate([clicks, presses]))
+    following = np.searchsorted(grabs, inputs)  # the first grab at or after every input
+    delays = (grabs[following[following < len(grabs)]] - inputs[following < len(grabs)]) * 1000
+    return grabs, idle_start, delays, screen.stats()
+
+
+def milliseconds(values, q):
+    return np.percentile(values, q) if len(values) else float('nan')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--duration', type=float, default=20.0)
+    parser.add_argument('--fps', type=float, default=4)
+    parser.add_argument('--burst-fps', type=float, default=15)
+    parser.add_argument('--burst-duration', type=float, default=1.0)
+    parser.add_argument('--idle-fps', type=float, default=0.5)
+    parser.add_argument('--idle-after', type=float, default=2.0)
+    parser.add_argument('--screen-size', type=int, nargs=2, default=(1280, 720))
+    parser.add_argument('--mouse-rate', type=float, default=50, help='synthetic mouse events per second')
+    parser.add_argument('--click-every', type=int, default=30, help='a click (press or release) every N mouse events')
+    parser.add_argument('--key-rate', type=float, default=3, help='synthetic key events (presses and releases) per second')
+    args = parser.parse_args()
+
+    print(f"{'mode':10s} {'active':>8s} {'idle':>8s} {'inputs':>8s} {'delay p50':>10s} {'p90':>8s} {'max':>8s} {'trigger p50':>12s} {'p99':>8s}")
+    for mode in ('fixed', 'triggered'):
+        with tempfile.TemporaryDirectory() as output_dir:
+            grabs, idle_start, delays, stats = record(Path(output_dir), args, mode == 'triggered')
+        latency = stats.get('trigger_latency', {})
+        trigger_p50 = latency.get('p50', float('nan')) * 1000 if latency.get('count') else float('nan')
+        trigger_p99 = latency.get('p99', float('nan')) * 1000 if latency.get('count') else float('nan')
+        print(f"{mode:10s} {np.sum(grabs < idle_start):8d} {np.sum(grabs >= idle_start):8d} {len(delays):8d} "
+              f"{milliseconds(delays, 50):10.1f} {milliseconds(delays, 90):8.1f} {np.max(delays) if len(delays) else float('nan'):8.1f} "
+              f"{trigger_p50:12.2f} {trigger_p99:8.2f}")
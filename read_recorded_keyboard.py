@@ -2,34 +2,36 @@
 import numpy as np
 import matplotlib.pyplot as plt
 from pathlib import Path
-import pandas as pd
 
-def read_keyboard_events(data_dir='data', timestamp='latest'):
-    csv_file = f'{data_dir}/{timestamp}/keyboard_events.csv' if timestamp != 'latest' else sorted(Path(data_dir).iterdir())[-1] / 'keyboard_events.csv'
+from recorders.keyboard_log import KeyboardLogReader, key_rows, convert_keyboard_csv
 
-    # load the data
-    data = pd.read_csv(csv_file)
+def read_keyboard_events(data_dir='data', timestamp='latest'):
+    session_dir = Path(data_dir) / timestamp if timestamp != 'latest' else sorted(Path(data_dir).iterdir())[-1]
+    bin_file = session_dir / 'keyboard.bin'
+    if not bin_file.exists():
+        bin_file = convert_keyboard_csv(session_dir / 'keyboard.csv')  # session recorded with the old csv log
 
-    event_ids = data['event'].to_numpy()
-    keys = data['key'].to_numpy()
-    times = data['time'].to_numpy()
+    # load the data (memory-mapped)
+    reader = KeyboardLogReader(bin_file)
+    event_ids = reader.events['event']
+    times = reader.events['time']
 
     # Make the time column relative to the first timestamp
     times = times - times[0]
 
-    # convert key names to a consistent format
-    keys = np.array([key.lower() for key in keys])
+    # one row per key, with key names in a consistent format (lowercase)
+    rows, labels = key_rows(reader, lowercase=True)
 
     # plot the data
     fig, ax = plt.subplots()
     ax.set_xlim(0, times[-1])
-    ax.set_ylim(0, len(set(keys)))
+    ax.set_ylim(-1, len(labels))
 
-    scatter = ax.scatter(times, [list(set(keys)).index(k) for k in keys], c=event_ids, cmap='viridis', alpha=0.5)
+    ax.scatter(times, rows, c=event_ids, cmap='viridis', alpha=0.5)
 
-    # add annotations
-    for i, txt in enumerate(keys):
-        ax.annotate(txt, (times[i], list(set(keys)).index(keys[i])))
+    # label the rows instead of annotating every event
+    ax.set_yticks(np.arange(len(labels)))
+    ax.set_yticklabels(labels)
 
     plt.show()
 
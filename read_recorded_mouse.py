@@ -1,37 +1,18 @@
 # read_recorded_mouse.py
-import struct
-import numpy as np
 import matplotlib.pyplot as plt
-from matplotlib.animation import FuncAnimation
 
 from pathlib import Path
 
+from recorders.mouse_reader import MouseLogReader
+
 def read_mouse_events(data_dir='data', timestamp='latest'):
-    format = 'bhhd'
     bin_file = f'{data_dir}/{timestamp}/mouse_events.bin' if timestamp != 'latest' else sorted(Path(data_dir).iterdir())[-1] / 'mouse_events.bin'
 
-    # load the data
-    record_size = struct.calcsize(format)
-    binary_data = Path(bin_file).read_bytes()
-    num_records = len(binary_data)//record_size
-    num_bytes = num_records*record_size
-    binary_data = binary_data[:num_bytes]  # remove last incomplete record if there is one, for example when the program was terminated while recording
-
-    # convert the data to a numpy array
-    event_ids = []
-    xs, ys = [], []
-    times = []
-    for i in range(num_records):
-        record = binary_data[i*record_size:(i+1)*record_size]
-        event_id, x, y, time = struct.unpack(format, record)
-        event_ids.append(event_id)
-        xs.append(x)
-        ys.append(y)
-        times.append(time)
-    event_ids_np = np.array(event_ids)
-    xs_np = np.array(xs)
-    ys_np = np.array(ys)
-    times_np = np.array(times)
+    # load the data (memory-mapped, the last incomplete record is dropped if the program was terminated while recording)
+    events = MouseLogReader(bin_file).events
+    xs_np = events['x']
+    ys_np = events['y']
+    times_np = events['time']
 
     # plot the data
     fig, ax = plt.subplots()
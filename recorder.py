@@ -9,7 +9,12 @@ thus making the user's experience more enjoyable.
 import os
 import time
 import numpy as np
-from recorders import MouseListener, MircophoneRecorder, SpeakerRecorder, ScreenRecorder, KeyboardListener, WebcamRecorder
+from recorders import MouseListener, MircophoneRecorder, SpeakerRecorder, ScreenRecorder, KeyboardListener, WebcamRecorder, SessionClock
+from recorders.process import Supervisor
+from recorders.metrics import MetricsLogger
+from recorders.adaptive import AdaptiveController
+
+import argparse
 
 import signal
 import sys
@@ -21,6 +26,8 @@ import subprocess
 def signal_handler(sig, frame):
     print('You pressed Ctrl+C!')
     # Call cleanup functions here
+    if controller is not None:
+        controller.stop()  # no more quality changes while the recorders stop
     # Stop recording
     screen_recorder.stop()
     webcam_recorder_0.stop()
@@ -29,10 +36,14 @@ def signal_handler(sig, frame):
     # speaker_recorder.stop()
     mouse_listener.stop()
     keyboard_listener.stop()
-    #mouseview_recorder.stop()
+    if metrics_logger is not None:
+        metrics_logger.stop()
+    if supervisor is not None:
+        supervisor.shutdown()
     sys.exit(0)
 
 signal.signal(signal.SIGINT, signal_handler)
+signal.signal(signal.SIGTERM, signal_handler)  # pkill from stop.sh: finalize the open segments too
 
 
 def create_socket_io(url, handle):
@@ -52,37 +63,82 @@ def handle_audio_results(data):
 
 
 
+supervisor = None  # only used with --processes
+metrics_logger = None
+controller = None  # only used with --adaptive
+
+
+def create_recorder(recorder_class, *args, **kwargs):
+    # In process mode every recorder runs in its own process, behind a proxy with the same start/stop/fetch_* API
+    if supervisor is not None:
+        return supervisor.add(recorder_class, *args, **kwargs)
+    return recorder_class(*args, **kwargs)
+
+
+
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--processes', action='store_true', help='run every recorder in its own process (see recorders/process.py)')
+    parser.add_argument('--segment-duration', type=float, default=600, help='seconds per video/audio file, 0 for one file (see recorders/segments.py)')
+    parser.add_argument('--input-triggers', action='store_true', help='capture the screen right after clicks and key presses, '
+                        'fast for a second, slowly while idle (see recorders/activity.py); not with --processes')
+    parser.add_argument('--adaptive', action='store_true', help='lower the fps and resolution of the video streams under load (see recorders/adaptive.py); not with --processes')
+    args = parser.parse_args()
+    if args.processes:
+        supervisor = Supervisor()
+    segment_duration = args.segment_duration or None
+
     timestamp = time.strftime("%Y%m%d-%H%M%S")
     data_dir = f'data/{timestamp}'
 
     # Create a new directory for this interaction
     os.makedirs(data_dir, exist_ok=True)
+    clock = SessionClock()  # one timeline for all the recorders
 
-    keyboard_listener = KeyboardListener(csv_file=f'{data_dir}/keyboard.csv')  # Add this line
+    keyboard_listener = create_recorder(KeyboardListener, bin_file=f'{data_dir}/keyboard.bin', clock=clock)  # Add this line
     keyboard_listener.start()  # Start keyboard listener
 
-    microphone_recorder = MircophoneRecorder(f'{data_dir}/microphone.wav')
+    microphone_recorder = create_recorder(MircophoneRecorder, f'{data_dir}/microphone.wav', clock=clock, segment_duration=segment_duration)
     microphone_recorder.start()
 
-    screen_recorder = ScreenRecorder(output_file=f'{data_dir}/screens.mp4', fps=4, downscale_factor=1, capture_radius=(5000,3000))
+    delta_time = None#0.03
+    mouse_listener = create_recorder(MouseListener, delta_time=delta_time, bin_file=f'{data_dir}/mouse.bin', clock=clock)
+    mouse_listener.start()
+
+    triggers = {}
+    if args.input_triggers and supervisor is None:  # the listeners' activity events don't cross processes
+        triggers = dict(activity=[mouse_listener.activity, keyboard_listener.activity], burst_fps=10, burst_duration=1.0, idle_fps=0.5, idle_after=10.0)
+    screen_recorder = create_recorder(ScreenRecorder, output_file=f'{data_dir}/screens.mp4', fps=4, downscale_factor=1, capture_radius=(5000,3000), clock=clock, segment_duration=segment_duration, **triggers)
     screen_recorder.start()  # start recording
 
     fps = 15
-    webcam_recorder_0 = WebcamRecorder(output_file=f'{data_dir}/webcam_0.mp4', camera_index=0, fps=fps)  # Add this line
+    webcam_recorder_0 = create_recorder(WebcamRecorder, output_file=f'{data_dir}/webcam_0.mp4', camera_index=0, fps=fps, clock=clock, segment_duration=segment_duration)  # Add this line
     webcam_recorder_0.start()  # Start webcam recording
-    webcam_recorder_1 = WebcamRecorder(output_file=f'{data_dir}/webcam_1.mp4', camera_index=2, fps=fps)  # Add this line
+    webcam_recorder_1 = create_recorder(WebcamRecorder, output_file=f'{data_dir}/webcam_1.mp4', camera_index=2, fps=fps, clock=clock, segment_duration=segment_duration)  # Add this line
     webcam_recorder_1.start()  # Start webcam recording
 
-    delta_time = None#0.03
-    mouse_listener = MouseListener(delta_time=delta_time, bin_file=f'{data_dir}/mouse.bin')
-    mouse_listener.start()
-
-    # speaker_recorder = SpeakerRecorder(f'{data_dir}/speaker_audio.wav')
+    # speaker_recorder = create_recorder(SpeakerRecorder, f'{data_dir}/speaker_audio.wav', clock=clock)
     # speaker_recorder.start()
 
-    # mouseview_recorder = ScreenRecorder(output_file=f'{data_dir}/mouseview.mp4', fps=10, downscale_factor=2, capture_radius=(100,40))
-    # mouseview_recorder.start()  # start recording
+    # A detailed view around the mouse is best recorded as a second stream of the screen recorder (one grab for both):
+    # screen_recorder = create_recorder(ScreenRecorder, streams=[dict(output_file=f'{data_dir}/screens.mp4', fps=4),
+    #                                                            dict(output_file=f'{data_dir}/mouseview.mp4', fps=10, downscale_factor=2, capture_radius=(100,40))], clock=clock)
+
+    if supervisor is not None:
+        supervisor.start_monitoring()
+
+    # Rates, latencies, queue depths and drops of every recorder, see recorders/metrics.py
+    metrics_logger = MetricsLogger(f'{data_dir}/metrics.jsonl', [screen_recorder, webcam_recorder_0, webcam_recorder_1,
+                                                                 microphone_recorder, mouse_listener, keyboard_listener], interval=10)
+    metrics_logger.start()
+
+    if args.adaptive and supervisor is None:
+        # The screen degrades last; a camera may go down to 5 fps at a quarter of the resolution
+        controller = AdaptiveController(interval=5.0)
+        controller.add(screen_recorder, min_fps=1, max_downscale=2, priority=1)
+        controller.add(webcam_recorder_0, min_fps=5, max_downscale=4)
+        controller.add(webcam_recorder_1, min_fps=5, max_downscale=4)
+        controller.start()
 
 
     while True:
@@ -96,6 +152,5 @@ if __name__ == '__main__':
     mouse_listener.stop()
     keyboard_listener.stop()
     # speaker_recorder.stop()
-    #mouseview_recorder.stop()
 
     sio.disconnect()
@@ -9,7 +9,7 @@ thus making the user's experience more enjoyable.
 import os
 import time
 import numpy as np
-from recorders import MouseListener, MircophoneRecorder, SpeakerRecorder, ScreenRecorder, KeyboardListener, WebcamRecorder
+from recorders import MouseListener, MircophoneRecorder, SpeakerRecorder, ScreenRecorder, KeyboardListener, WebcamRecorder, SessionClock, StreamingASR, CommandMatcher, DeviceController
 
 import signal
 import sys
@@ -22,6 +22,8 @@ def signal_handler(sig, frame):
     print('You pressed Ctrl+C!')
     # Call cleanup functions here
     # Stop recording
+    if 'asr_stage' in globals():  # created after the recorders, a Ctrl+C can come before it exists
+        asr_stage.stop()
     screen_recorder.stop()
     webcam_recorder_0.stop()
     webcam_recorder_1.stop()
@@ -29,7 +31,6 @@ def signal_handler(sig, frame):
     # speaker_recorder.stop()
     mouse_listener.stop()
     keyboard_listener.stop()
-    #mouseview_recorder.stop()
     sys.exit(0)
 
 signal.signal(signal.SIGINT, signal_handler)
@@ -64,85 +65,83 @@ if __name__ == '__main__':
 
     # Create a new directory for this interaction
     os.makedirs(data_dir, exist_ok=True)
+    clock = SessionClock()  # one timeline for all the recorders
 
-    keyboard_listener = KeyboardListener(csv_file=f'{data_dir}/keyboard.csv')  # Add this line
+    keyboard_listener = KeyboardListener(bin_file=f'{data_dir}/keyboard.bin', clock=clock)  # Add this line
     keyboard_listener.start()  # Start keyboard listener
 
-    microphone_recorder = MircophoneRecorder(f'{data_dir}/microphone.wav')
+    microphone_recorder = MircophoneRecorder(f'{data_dir}/microphone.wav', clock=clock)
     microphone_recorder.start()
 
-    screen_recorder = ScreenRecorder(output_file=f'{data_dir}/screens.mp4', fps=4, downscale_factor=1, capture_radius=(5000,3000))
+    screen_recorder = ScreenRecorder(output_file=f'{data_dir}/screens.mp4', fps=4, downscale_factor=1, capture_radius=(5000,3000), clock=clock)
     screen_recorder.start()  # start recording
 
     fps = 15
-    webcam_recorder_0 = WebcamRecorder(output_file=f'{data_dir}/webcam_0.mp4', camera_index=0, fps=fps)  # Add this line
+    webcam_recorder_0 = WebcamRecorder(output_file=f'{data_dir}/webcam_0.mp4', camera_index=0, fps=fps, clock=clock)  # Add this line
     webcam_recorder_0.start()  # Start webcam recording
-    webcam_recorder_1 = WebcamRecorder(output_file=f'{data_dir}/webcam_1.mp4', camera_index=2, fps=fps)  # Add this line
+    webcam_recorder_1 = WebcamRecorder(output_file=f'{data_dir}/webcam_1.mp4', camera_index=2, fps=fps, clock=clock)  # Add this line
     webcam_recorder_1.start()  # Start webcam recording
 
     delta_time = None#0.03
-    mouse_listener = MouseListener(delta_time=delta_time, bin_file=f'{data_dir}/mouse.bin')
+    mouse_listener = MouseListener(delta_time=delta_time, bin_file=f'{data_dir}/mouse.bin', clock=clock)
     mouse_listener.start()
 
-    # speaker_recorder = SpeakerRecorder(f'{data_dir}/speaker_audio.wav')
+    # speaker_recorder = SpeakerRecorder(f'{data_dir}/speaker_audio.wav', clock=clock)
     # speaker_recorder.start()
 
-    # mouseview_recorder = ScreenRecorder(output_file=f'{data_dir}/mouseview.mp4', fps=10, downscale_factor=2, capture_radius=(100,40))
-    # mouseview_recorder.start()  # start recording
+    # A detailed view around the mouse is best recorded as a second stream of the screen recorder (one grab for both):
+    # screen_recorder = ScreenRecorder(streams=[ScreenStream(f'{data_dir}/screens.mp4', fps=4),
+    #                                           ScreenStream(f'{data_dir}/mouseview.mp4', fps=10, downscale_factor=2, capture_radius=(100,40))], clock=clock)
 
     # Assistant - START
     from whisper_streaming.whisper_online import *
     asr = FasterWhisperASR("en", "large-v2")
     online = OnlineASRProcessor(asr)
+    asr_stage = StreamingASR(microphone_recorder, online)  # skips silence, runs the ASR in its own thread
+    asr_stage.start()
     # import ollama
     # messages = []
-    import requests
-    import time
     jetson_nano_url = 'http://192.168.0.24:5000'  # Replace with the actual IP address
+    lamp = DeviceController(jetson_nano_url, timeout=2.0, verbose=True)  # requests are sent from a worker thread
+    commands = CommandMatcher({'turn it on': 'on', 'turn it off': 'off'})
     user_text = ''
     lamp_state = 'off'
-    def control_lamp(signal, verbose=False):
+    def control_lamp(command):
         global lamp_state
-        response = requests.post(f'{jetson_nano_url}/control', json={'signal': signal})
-        lamp_state = signal
-        if verbose: print(response.text)
+        lamp.post('/control', json={'signal': command})
+        lamp_state = command
     # Assistant - END
 
     while True:
-        time.sleep(0.2)
-
-        # Fetch raw audio data
-        raw_audio = microphone_recorder.fetch_audio_data()
-        audio_np = np.frombuffer(raw_audio, dtype=np.int16)
-        if raw_audio:
-            online.insert_audio_chunk(audio_np)
-            _,_,o = online.process_iter()
-            if len(o) > 0:
-                current_user_text = "User: " + o
-                user_text = user_text + o
-                print(current_user_text)
-                print(current_user_text, file=conversational_training_data_file, flush=False)
-                #print(user_text)
-                # Ollama - START
-                if user_text.lower().replace('.', '').replace('?', '').replace('!', '').endswith('turn it on'):
-                    control_lamp('on', verbose=True)
-                elif user_text.lower().replace('.', '').replace('?', '').replace('!', '').endswith('turn it off'):
-                    control_lamp('off', verbose=True)
-                response = 'Assistant: ' + ''
-                print(response)
-                print(response, file=conversational_training_data_file, flush=False)
-                # Ollama - END
-
-            #     # send to ollama and receive results - START [TOBELABELLED]
-            #     response = ollama.chat(model='mistral', messages=messages)
-            #     response_text = response['message']['content']
-            #     # send to ollama and receive results - END
-            #     # make example of running all this and having the ASR results and label them with what we want mistral to say to each request. - START
-
-            #     # make example of running all this and having the ASR results and label them with what we want mistral to say to each request. - END
-                # Ollama - END
+        # Wait for the next ASR result
+        transcript = asr_stage.transcripts.get()
+        o = transcript.text
+        if len(o) > 0:
+            current_user_text = "User: " + o
+            user_text = user_text + o
+            print(current_user_text)
+            print(current_user_text, file=conversational_training_data_file, flush=False)
+            #print(user_text)
+            # Ollama - START
+            for command in commands.feed(o):
+                control_lamp(command)
+            response = 'Assistant: ' + ''
+            print(response)
+            print(response, file=conversational_training_data_file, flush=False)
+            # Ollama - END
+
+        #     # send to ollama and receive results - START [TOBELABELLED]
+        #     response = ollama.chat(model='mistral', messages=messages)
+        #     response_text = response['message']['content']
+        #     # send to ollama and receive results - END
+        #     # make example of running all this and having the ASR results and label them with what we want mistral to say to each request. - START
+
+        #     # make example of running all this and having the ASR results and label them with what we want mistral to say to each request. - END
+            # Ollama - END
     
     # Stop recording
+    asr_stage.stop()
+    lamp.close()
     screen_recorder.stop()
     webcam_recorder_0.stop()
     webcam_recorder_1.stop()
@@ -150,6 +149,5 @@ if __name__ == '__main__':
     mouse_listener.stop()
     keyboard_listener.stop()
     # speaker_recorder.stop()
-    #mouseview_recorder.stop()
 
     sio.disconnect()
\ No newline at end of file
@@ -9,7 +9,7 @@ thus making the user's experience more enjoyable.
 import os
 import time
 import numpy as np
-from recorders import MouseListener, MircophoneRecorder, SpeakerRecorder, ScreenRecorder, KeyboardListener, WebcamRecorder
+from recorders import MouseListener, MircophoneRecorder, SpeakerRecorder, ScreenRecorder, KeyboardListener, WebcamRecorder, SessionClock
 
 import signal
 import sys
@@ -29,7 +29,6 @@ def signal_handler(sig, frame):
     # speaker_recorder.stop()
     mouse_listener.stop()
     keyboard_listener.stop()
-    #mouseview_recorder.stop()
     sys.exit(0)
 
 signal.signal(signal.SIGINT, signal_handler)
@@ -64,31 +63,33 @@ if __name__ == '__main__':
 
     # Create a new directory for this interaction
     os.makedirs(data_dir, exist_ok=True)
+    clock = SessionClock()  # one timeline for all the recorders
 
-    keyboard_listener = KeyboardListener(csv_file=f'{data_dir}/keyboard.csv')  # Add this line
+    keyboard_listener = KeyboardListener(bin_file=f'{data_dir}/keyboard.bin', clock=clock)  # Add this line
     keyboard_listener.start()  # Start keyboard listener
 
-    microphone_recorder = MircophoneRecorder(f'{data_dir}/microphone.wav')
+    microphone_recorder = MircophoneRecorder(f'{data_dir}/microphone.wav', clock=clock)
     microphone_recorder.start()
 
-    screen_recorder = ScreenRecorder(output_file=f'{data_dir}/screens.mp4', fps=4, downscale_factor=1, capture_radius=(5000,3000))
+    screen_recorder = ScreenRecorder(output_file=f'{data_dir}/screens.mp4', fps=4, downscale_factor=1, capture_radius=(5000,3000), clock=clock)
     screen_recorder.start()  # start recording
 
     fps = 15
-    webcam_recorder_0 = WebcamRecorder(output_file=f'{data_dir}/webcam_0.mp4', camera_index=0, fps=fps)  # Add this line
+    webcam_recorder_0 = WebcamRecorder(output_file=f'{data_dir}/webcam_0.mp4', camera_index=0, fps=fps, clock=clock)  # Add this line
     webcam_recorder_0.start()  # Start webcam recording
-    webcam_recorder_1 = WebcamRecorder(output_file=f'{data_dir}/webcam_1.mp4', camera_index=2, fps=fps)  # Add this line
+    webcam_recorder_1 = WebcamRecorder(output_file=f'{data_dir}/webcam_1.mp4', camera_index=2, fps=fps, clock=clock)  # Add this line
     webcam_recorder_1.start()  # Start webcam recording
 
     delta_time = None#0.03
-    mouse_listener = MouseListener(delta_time=delta_time, bin_file=f'{data_dir}/mouse.bin')
+    mouse_listener = MouseListener(delta_time=delta_time, bin_file=f'{data_dir}/mouse.bin', clock=clock)
     mouse_listener.start()
 
-    # speaker_recorder = SpeakerRecorder(f'{data_dir}/speaker_audio.wav')
+    # speaker_recorder = SpeakerRecorder(f'{data_dir}/speaker_audio.wav', clock=clock)
     # speaker_recorder.start()
 
-    # mouseview_recorder = ScreenRecorder(output_file=f'{data_dir}/mouseview.mp4', fps=10, downscale_factor=2, capture_radius=(100,40))
-    # mouseview_recorder.start()  # start recording
+    # A detailed view around the mouse is best recorded as a second stream of the screen recorder (one grab for both):
+    # screen_recorder = ScreenRecorder(streams=[ScreenStream(f'{data_dir}/screens.mp4', fps=4),
+    #                                           ScreenStream(f'{data_dir}/mouseview.mp4', fps=10, downscale_factor=2, capture_radius=(100,40))], clock=clock)
 
     # Assistant - START
 
@@ -122,6 +123,5 @@ if __name__ == '__main__':
     mouse_listener.stop()
     keyboard_listener.stop()
     # speaker_recorder.stop()
-    #mouseview_recorder.stop()
 
     sio.disconnect()
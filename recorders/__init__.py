@@ -1,6 +1,30 @@
 from .mouse import MouseListener
 from .microphone import MircophoneRecorder
 from .speakers import SpeakerRecorder
-from .screen import ScreenRecorder
+from .screen import ScreenRecorder, ScreenStream
 from .keyboard import KeyboardListener
-from .webcam import WebcamRecorder
\ No newline at end of file
+from .webcam import WebcamRecorder
+from .frame_buffer import FrameRingBuffer
+from .mouse_reader import MouseLogReader
+from .change_detector import FrameChangeDetector
+from .pipeline import BoundedQueue
+from .encoders import OpenCVEncoder, FFmpegEncoder, create_encoder
+from .timestamp_index import TimestampIndexWriter, load_timestamp_index, convert_timestamps_csv
+from .batch_writer import BatchWriter
+from .audio_buffer import AudioRingBuffer, AudioCursor
+from .session_clock import SessionClock, SampleClock
+from .session import Session
+from .process import RecorderProcess, Supervisor
+from .frame_bus import FrameBusPublisher, FrameBusSubscriber
+from .sources import MSSScreenSource, SyntheticScreenSource, SyntheticCamera, SyntheticAudio, SyntheticInputStorm
+from .asr import EnergyVAD, StreamingASR, Transcript
+from .commands import CommandMatcher, DeviceController
+from .keyboard_log import KeyboardLogReader, convert_keyboard_csv
+from .trajectory import TrajectorySimplifier, simplify_trajectory
+from .tile_codec import TileEncoder, TileDecoder
+from .segments import VideoSegmentWriter, AudioSegmentWriter, read_manifest
+from .export import ShardExporter
+from .dataset import SessionDataset, DecodedCache
+from .metrics import RecorderMetrics, MetricsLogger
+from .adaptive import AdaptiveController
+from .activity import ActivityPublisher
\ No newline at end of file
@@ -0,0 +1,51 @@
+"""
+Lightweight input-activity events for recorders that react to the user, e.g. a ScreenRecorder that grabs the screen
+right after a click instead of waiting for its next tick (see the activity parameter of ScreenRecorder).
+
+MouseListener and KeyboardListener each have an ActivityPublisher (their `activity` attribute) and publish every
+input event they handle as (kind, time, perf_time):
+- kind: 'move', 'click' (press or release), 'scroll' or 'key' (press).
+- time: time of the input event on the session timeline (SessionClock.time()).
+- perf_time: time.perf_counter() when it was published, to measure the latency of whatever it triggers.
+
+Subscribers are called synchronously in the listener's callback thread (pynput's or pyxhook's), so a subscriber has
+to be cheap: note the event and wake its own thread, never do the work in the callback. Publishing without subscribers
+costs an attribute read, and subscribe()/unsubscribe() replace the subscriber tuple instead of modifying it,
+so publish() takes no lock.
+
+Usage:
+    mouse_listener = MouseListener(bin_file='data/mouse.bin')
+    keyboard_listener = KeyboardListener(bin_file='data/keyboard.bin')
+    screen_recorder = ScreenRecorder(output_file='data/screens.mp4', fps=4, activity=[mouse_listener.activity, keyboard_listener.activity])
+
+    mouse_listener.activity.subscribe(lambda kind, time, perf_time: print(kind, time))
+
+Methods:
+- subscribe(callback), unsubscribe(callback): Add or remove a callback(kind, time, perf_time).
+- publish(kind, time): Call the subscribers.
+"""
+
+import threading
+from time import perf_counter  # publish's `time` argument shadows the module
+
+
+class ActivityPublisher:
+    def __init__(self):
+        self.subscribers = ()
+        self.lock = threading.Lock()  # serializes subscribe/unsubscribe only
+
+    def subscribe(self, callback):
+        with self.lock:
+            self.subscribers = self.subscribers + (callback,)
+
+    def unsubscribe(self, callback):
+        with self.lock:
+            self.subscribers = tuple(subscriber for subscriber in self.subscribers if subscriber != callback)
+
+    def publish(self, kind, time):
+        subscribers = self.subscribers
+        if not subscribers:
+            return
+        perf_time = perf_counter()
+        for callback in subscribers:
+            callback(kind, time, perf_time)
@@ -0,0 +1,217 @@
+"""
+Load-aware adaptive frame rate and resolution for the video recorders (ScreenRecorder streams and WebcamRecorder).
+
+At a fixed fps and resolution, a recorder that can't keep up just falls behind: captures overrun their slot, the queues
+drop frames, and under CPU pressure every stream degrades in its own unpredictable way. An AdaptiveController sheds
+load on purpose instead. Every `interval` seconds it measures:
+- the system load: the CPU utilisation if psutil is installed, otherwise the 1 minute load average per CPU (os.getloadavg).
+- the cost of every stream: the seconds its frames spent being converted and encoded per second
+    (from the recorder's metrics, see recorders/metrics.py), i.e. how busy it keeps its encode thread.
+- missed frames: late captures and frames dropped by the queues since the previous step.
+and then changes at most one stream by one step:
+- overloaded (system load above `high_load`, a stream costing more than `high_load`, or missed frames): the stream with the
+    lowest priority that can still go down (among equal priorities the most expensive one) divides its fps by `fps_factor`
+    down to min_fps, and then increases its downscale_factor by one up to max_downscale (or the other way around with
+    degrade='resolution').
+- underloaded (system load below `low_load`, no stream above it and nothing missed for `recover_steps` steps in a row):
+    the stream with the highest priority below its configured settings takes a step back up, in the reverse order.
+After a change the controller waits `cooldown` steps, so that the next decision sees its effect.
+
+The recorders apply an fps change from the next frame on (their capture schedules are incremental). A video file has one
+frame size, so a downscale_factor change needs a segmented recording (segment_duration or segment_size): the frames at
+the new size go to a new segment (see recorders/segments.py). For a recording that isn't segmented only the fps adapts.
+Every change is logged by the recorder in the stream's settings index, <name>_settings.bin next to its timestamps
+(frame_number from which it applies, time, fps, downscale_factor; see recorders/timestamp_index.py and Session.settings),
+and kept in `controller.changes`.
+
+Usage:
+    screen = ScreenRecorder(streams=[ScreenStream('data/screens.mp4', fps=4), ScreenStream('data/mouseview.mp4', fps=15, capture_radius=(200, 100))],
+                            segment_duration=600)
+    webcam = WebcamRecorder('data/webcam.mp4', fps=30, segment_duration=600)
+    controller = AdaptiveController(interval=2.0)
+    controller.add(screen, screen.streams[1], min_fps=5, priority=2)  # the last to degrade
+    controller.add(screen, screen.streams[0], min_fps=1, max_downscale=2, priority=1)
+    controller.add(webcam, min_fps=5, max_downscale=4)
+    screen.start(); webcam.start(); controller.start()
+    ...
+    controller.stop(); screen.stop(); webcam.stop()
+    print(controller.changes)
+
+Parameters (AdaptiveController):
+- interval: seconds between two measurements. Default is 2.0.
+- high_load, low_load: load (0-1) above which streams are degraded, and below which they recover. Defaults are 0.85 and 0.5.
+- fps_factor: factor of an fps step. Default is 1.5.
+- degrade: what a stream gives up first, 'fps' (default) or 'resolution'.
+- cooldown: steps without a change after a change. Default is 1.
+- recover_steps: consecutive underloaded steps before a stream recovers. Default is 3.
+- system_load: function returning the current system load (0-1), or None if unknown. Default is None, meaning psutil or os.getloadavg.
+
+Parameters (add):
+- recorder: a ScreenRecorder or WebcamRecorder.
+- stream: the ScreenStream of a ScreenRecorder to adapt. Default is None, meaning the first (the webcam has only one).
+- min_fps, max_fps: bounds of the fps. Defaults are 1 and the stream's fps.
+- min_downscale, max_downscale: bounds of the downscale_factor. Defaults are the stream's downscale_factor and min_downscale
+    (a fixed resolution).
+- priority: streams with a higher priority degrade last and recover first. Default is 0.
+
+Methods:
+- add(recorder, stream=None, ...): Adapt a stream within the given bounds.
+- start(), stop(): Run the controller in a thread (stop() leaves the streams at their current settings).
+- step(): Measure and change at most one stream; returns the change (a dict) or None.
+"""
+
+import os
+import threading
+import time
+from pathlib import Path
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+
+def default_system_load():
+    # CPU utilisation of the whole machine (0-1), or None where neither psutil nor os.getloadavg is available
+    if psutil is not None:
+        return psutil.cpu_percent(interval=None) / 100  # since the previous call
+    if hasattr(os, 'getloadavg'):
+        return os.getloadavg()[0] / (os.cpu_count() or 1)
+    return None
+
+
+class AdaptiveStream:
+    def __init__(self, recorder, stream, min_fps, max_fps, min_downscale, max_downscale, priority):
+        self.recorder = recorder
+        self.stream = stream
+        self.target = stream if stream is not None else recorder  # the object holding fps and downscale_factor
+        self.name = Path(self.target.output_file).stem
+        self.min_fps = min_fps
+        self.max_fps = max_fps
+        self.min_downscale = min_downscale
+        self.max_downscale = max_downscale if recorder.segmented else min_downscale  # see the module docstring
+        self.priority = priority
+        self.last_cost = None  # stream_cost() at the previous step
+        self.cost = 0.0  # busy seconds per second over the last interval
+
+    def degraded(self, fps_first, fps_factor):
+        # The next lower (fps, downscale_factor), or None at the floor
+        fps, downscale_factor = self.target.fps, self.target.downscale_factor
+        can_fps, can_resolution = fps > self.min_fps, downscale_factor < self.max_downscale
+        if can_fps and (fps_first or not can_resolution):
+            return max(self.min_fps, round(fps / fps_factor, 2)), downscale_factor
+        if can_resolution:
+            return fps, downscale_factor + 1
+        return None
+
+    def recovered(self, fps_first, fps_factor):
+        # The next higher (fps, downscale_factor), undoing the degrade steps in reverse order, or None at the configured settings
+        fps, downscale_factor = self.target.fps, self.target.downscale_factor
+        can_fps, can_resolution = fps < self.max_fps, downscale_factor > self.min_downscale
+        if can_resolution and (fps_first or not can_fps):
+            return fps, downscale_factor - 1
+        if can_fps:
+            return min(self.max_fps, round(fps * fps_factor, 2)), downscale_factor
+        return None
+
+
+class AdaptiveController:
+    def __init__(self, interval=2.0, high_load=0.85, low_load=0.5, fps_factor=1.5, degrade='fps', cooldown=1, recover_steps=3,
+                 system_load=None):
+        if degrade not in ('fps', 'resolution'):
+            raise ValueError(f"degrade must be 'fps' or 'resolution', not {degrade!r}")
+        self.interval = interval
+        self.high_load = high_load
+        self.low_load = low_load
+        self.fps_factor = fps_factor
+        self.fps_first = degrade == 'fps'
+        self.cooldown = cooldown
+        self.recover_steps = recover_steps
+        self.system_load = system_load if system_load is not None else default_system_load
+        self.streams = []
+        self.changes = []  # every change: time, stream, fps, downscale_factor, reason
+        self.last_missed = {}  # recorder -> missed_frames() at the previous step
+        self.last_time = None
+        self.wait_steps = 0  # remaining cooldown
+        self.calm_steps = 0  # consecutive underloaded steps
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def add(self, recorder, stream=None, min_fps=1, max_fps=None, min_downscale=None, max_downscale=None, priority=0):
+        if stream is None and hasattr(recorder, 'streams'):
+            stream = recorder.streams[0]
+        target = stream if stream is not None else recorder
+        max_fps = max_fps if max_fps is not None else target.fps
+        min_downscale = min_downscale if min_downscale is not None else target.downscale_factor
+        max_downscale = max_downscale if max_downscale is not None else min_downscale
+        entry = AdaptiveStream(recorder, stream, min(min_fps, max_fps), max_fps, min_downscale, max(min_downscale, max_downscale), priority)
+        self.streams.append(entry)
+        return entry
+
+    def start(self):
+        self.stop_event.clear()
+        self.system_load()  # psutil measures the utilisation since the previous call
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        if self.thread is None:
+            return
+        self.stop_event.set()
+        self.thread.join()
+        self.thread = None
+
+    def _run(self):
+        while not self.stop_event.wait(self.interval):
+            self.step()
+
+    def _measure(self):
+        # Update the cost of every stream; returns (system load, missed frames) since the previous step
+        now = time.monotonic()
+        elapsed = now - self.last_time if self.last_time is not None else None
+        self.last_time = now
+        for entry in self.streams:
+            cost = entry.recorder.stream_cost(entry.stream)
+            if entry.last_cost is not None and elapsed:
+                entry.cost = max(0.0, cost - entry.last_cost) / elapsed  # negative after a restart of the recorder (new metrics)
+            entry.last_cost = cost
+        missed = 0
+        for recorder in {id(entry.recorder): entry.recorder for entry in self.streams}.values():
+            count = recorder.missed_frames()
+            missed += max(0, count - self.last_missed.get(id(recorder), count))
+            self.last_missed[id(recorder)] = count
+        return self.system_load(), missed
+
+    def step(self):
+        load, missed = self._measure()
+        busiest = max((entry.cost for entry in self.streams), default=0.0)
+        overloaded = missed > 0 or busiest > self.high_load or (load is not None and load > self.high_load)
+        underloaded = not overloaded and busiest < self.low_load and (load is None or load < self.low_load)
+        self.calm_steps = self.calm_steps + 1 if underloaded else 0
+        if self.wait_steps > 0:
+            self.wait_steps -= 1
+            return None
+
+        recording = [entry for entry in self.streams if entry.recorder.recording]
+        if overloaded:
+            # The lowest priority first, and among equal priorities the most expensive
+            for entry in sorted(recording, key=lambda entry: (entry.priority, -entry.cost)):
+                settings = entry.degraded(self.fps_first, self.fps_factor)
+                if settings is not None:
+                    reason = f'missed {missed} frames' if missed else f'load {max(load or 0.0, busiest):.2f}'
+                    return self._apply(entry, settings, reason)
+        elif self.calm_steps >= self.recover_steps:
+            for entry in sorted(recording, key=lambda entry: (-entry.priority, entry.cost)):
+                settings = entry.recovered(self.fps_first, self.fps_factor)
+                if settings is not None:
+                    self.calm_steps = 0
+                    return self._apply(entry, settings, f'load {max(load or 0.0, busiest):.2f}')
+        return None
+
+    def _apply(self, entry, settings, reason):
+        fps, downscale_factor = settings
+        entry.recorder.set_quality(fps=fps, downscale_factor=downscale_factor, stream=entry.stream)
+        self.wait_steps = self.cooldown
+        change = {'time': time.time(), 'stream': entry.name, 'fps': fps, 'downscale_factor': downscale_factor, 'reason': reason}
+        self.changes.append(change)
+        return change
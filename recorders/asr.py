@@ -0,0 +1,219 @@
+"""
+A streaming speech recognition stage that runs next to the microphone recorder instead of in the main loop.
+
+A StreamingASR object reads the microphone's ring buffer through its own cursor from a background thread,
+woken as soon as new audio arrives (no polling). An energy-based voice activity detector (EnergyVAD, vectorized
+over 30 ms frames) gates the audio, so silence never reaches the ASR model. Speech is collected per segment
+(with a short pre-roll so word onsets aren't cut) and given to the model in batches of at least `min_chunk` seconds;
+the end of a segment flushes it. The model keeps running across segments, so its committed text stays the prompt
+context of the next segment, as with a continuous feed. Every result is emitted as a Transcript with its start and end time on the
+session timeline, through the `transcripts` queue and the optional on_transcript callback.
+
+The ASR model is anything with the interface of whisper_streaming's OnlineASRProcessor:
+insert_audio_chunk(float32 audio in [-1, 1]), process_iter() and finish() returning (begin, end, text)
+in seconds of audio since init(), and chunk_at(time), which drops the audio buffer up to `time` but keeps the committed
+text. It's initialized once, in start(). At the end of a segment the remaining speech is transcribed, the segment's
+audio is dropped with chunk_at() and the uncommitted rest of it is flushed with finish().
+
+Usage:
+    from whisper_streaming.whisper_online import FasterWhisperASR, OnlineASRProcessor
+
+    microphone_recorder = MircophoneRecorder('data/microphone.wav', clock=clock)
+    microphone_recorder.start()
+    asr_stage = StreamingASR(microphone_recorder, OnlineASRProcessor(FasterWhisperASR('en', 'large-v2')))
+    asr_stage.start()
+
+    while True:
+        transcript = asr_stage.transcripts.get()  # blocks until the next result
+        print(transcript.start_time, transcript.text)
+
+    asr_stage.stop()
+
+Parameters:
+- recorder: the MircophoneRecorder (or SpeakerRecorder) to transcribe. Its sample rate must be the one the model expects (16 kHz for Whisper).
+- processor: the streaming ASR model, see above.
+- on_transcript: function called with every Transcript, from the ASR thread. Default is None.
+- vad: the voice activity detector. Default is None, meaning EnergyVAD(recorder.SAMPLERATE).
+- min_chunk: minimum seconds of new speech per inference call. Default is 1.0.
+- preroll: seconds of audio before the detected speech onset that are included in a segment. Default is 0.2.
+
+EnergyVAD parameters:
+- sample_rate: sample rate in Hz. Default is 16000.
+- frame_duration: length of the analysis frames in seconds. Default is 0.03.
+- threshold_db: RMS level (dB relative to full scale) above which a frame counts as speech. Default is -35.
+- hangover: seconds a segment stays open after the last speech frame, to bridge pauses between words. Default is 0.3.
+
+Methods:
+- start(), stop(): Start/stop the ASR thread. stop() flushes the current segment.
+- transcripts: queue.Queue of Transcript(start_time, end_time, text, final); `final` marks the last result of a segment.
+- speech_samples, skipped_samples: number of samples given to the model / skipped as silence so far.
+"""
+
+import bisect
+import queue
+import threading
+from collections import namedtuple
+import numpy as np
+
+
+Transcript = namedtuple('Transcript', ['start_time', 'end_time', 'text', 'final'])
+
+
+class EnergyVAD:
+    def __init__(self, sample_rate=16000, frame_duration=0.03, threshold_db=-35.0, hangover=0.3):
+        self.frame_length = int(sample_rate * frame_duration)
+        self.threshold = 32768 * 10 ** (threshold_db / 20)  # RMS in int16 units
+        self.hangover_frames = int(round(hangover / frame_duration))
+        self.frames_since_speech = self.hangover_frames + 1  # the stream starts in silence
+
+    def process(self, samples):
+        # Per-frame activity of mono int16 samples (length a multiple of frame_length), continuing from the previous call
+        frames = samples.reshape(-1, self.frame_length).astype(np.float32)
+        rms = np.sqrt(np.mean(frames * frames, axis=1))
+        speech = rms > self.threshold
+        n = len(speech)
+        if n == 0:
+            return speech
+        positions = np.arange(n)
+        last_speech = np.maximum.accumulate(np.where(speech, positions, -self.frames_since_speech))
+        self.frames_since_speech = n - last_speech[-1]
+        return positions - last_speech <= self.hangover_frames
+
+    def reset(self):
+        self.frames_since_speech = self.hangover_frames + 1
+
+
+class StreamingASR:
+    def __init__(self, recorder, processor, on_transcript=None, vad=None, min_chunk=1.0, preroll=0.2):
+        self.recorder = recorder
+        self.processor = processor
+        self.on_transcript = on_transcript
+        self.sample_rate = recorder.SAMPLERATE
+        self.vad = vad if vad is not None else EnergyVAD(self.sample_rate)
+        self.min_chunk_samples = int(min_chunk * self.sample_rate)
+        self.preroll_samples = int(preroll * self.sample_rate)
+        self.transcripts = queue.Queue()
+
+        self.cursor = None
+        self.remainder = np.empty(0, dtype=np.int16)  # samples of an incomplete VAD frame
+        self.next_index = None  # sample index the next read should start at
+        self.preroll = np.empty(0, dtype=np.int16)  # latest silent samples, prepended to the next segment
+        self.segment_start = None  # sample index where the current speech segment starts, None in silence
+        self.pending = []  # speech not given to the model yet
+        self.pending_samples = 0
+        self.inserted_samples = 0  # given to the model since init(): the model's timeline, speech only
+        self.segment_offsets = []  # inserted_samples at the start of every segment, to map the model's times back
+        self.segment_starts = []  # and the sample index where the segment starts
+        self.speech_samples = 0
+        self.skipped_samples = 0
+
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        self.cursor = self.recorder.cursor()
+        self.processor.init()
+        self.inserted_samples = 0
+        self.segment_offsets, self.segment_starts = [], []
+        self.running = True
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        if self.segment_start is not None:
+            self._end_segment()
+
+    def _run(self):
+        while self.running:
+            if not self.cursor.wait(timeout=0.5):
+                continue
+            samples, start_index = self.cursor.read()
+            if samples.shape[1] > 1:
+                samples = samples.mean(axis=1).astype(np.int16)
+            else:
+                samples = samples[:, 0]
+            self._process(samples, start_index)
+
+    def _process(self, samples, start_index):
+        if start_index != self.next_index:
+            # First read, or the cursor lost samples (overrun): start over
+            if self.segment_start is not None:
+                self._end_segment()
+            self.remainder = self.remainder[:0]
+            self.preroll = self.preroll[:0]
+            self.vad.reset()
+        else:
+            start_index -= len(self.remainder)
+        samples = np.concatenate([self.remainder, samples])
+        self.next_index = start_index + len(samples)
+
+        frame_length = self.vad.frame_length
+        num_frames = len(samples) // frame_length
+        self.remainder = samples[num_frames * frame_length:]
+        active = self.vad.process(samples[:num_frames * frame_length])
+
+        # Handle the runs of active and silent frames
+        boundaries = [0, *(np.flatnonzero(np.diff(active.astype(np.int8))) + 1), num_frames]
+        for first, last in zip(boundaries[:-1], boundaries[1:]):
+            if first == last:
+                continue
+            chunk = samples[first * frame_length:last * frame_length]
+            if active[first]:
+                if self.segment_start is None:
+                    self.segment_start = start_index + first * frame_length - len(self.preroll)
+                    self.segment_offsets.append(self.inserted_samples)
+                    self.segment_starts.append(self.segment_start)
+                    self._add_speech(self.preroll)
+                    self.preroll = self.preroll[:0]
+                self._add_speech(chunk)
+            else:
+                if self.segment_start is not None:
+                    self._end_segment()
+                self.skipped_samples += len(chunk)
+                self.preroll = np.concatenate([self.preroll, chunk])[-self.preroll_samples:] if self.preroll_samples else self.preroll
+
+        if self.pending_samples >= self.min_chunk_samples:
+            self._infer(final=False)
+
+    def _add_speech(self, samples):
+        if len(samples):
+            self.pending.append(samples)
+            self.pending_samples += len(samples)
+            self.speech_samples += len(samples)
+
+    def _infer(self, final):
+        if self.pending:
+            audio = np.concatenate(self.pending).astype(np.float32) / 32768
+            self.pending = []
+            self.pending_samples = 0
+            self.processor.insert_audio_chunk(audio)
+            self.inserted_samples += len(audio)
+        self._emit(self.processor.process_iter(), final=False)
+        if final:
+            # The segment's audio won't grow anymore: drop it, and flush what the model hasn't committed of it
+            self.processor.chunk_at(self.inserted_samples / self.sample_rate)
+            self._emit(self.processor.finish(), final=True)
+
+    def _sample_index(self, model_time):
+        # Sample index of a time on the model's timeline (seconds of speech since init()), in the segment it falls in
+        offset = int(model_time * self.sample_rate)
+        segment = max(0, bisect.bisect_right(self.segment_offsets, offset) - 1)
+        return self.segment_starts[segment] + offset - self.segment_offsets[segment]
+
+    def _emit(self, result, final):
+        begin, end, text = result
+        if text:
+            start_time = float(self.recorder.time_at(self._sample_index(begin)))
+            end_time = float(self.recorder.time_at(self._sample_index(end)))
+            transcript = Transcript(start_time, end_time, text, final)
+            self.transcripts.put(transcript)
+            if self.on_transcript is not None:
+                self.on_transcript(transcript)
+
+    def _end_segment(self):
+        self._infer(final=True)
+        self.segment_start = None
@@ -0,0 +1,118 @@
+"""
+An AudioRingBuffer object keeps the most recent audio samples in a preallocated int16 NumPy array,
+with a monotonically increasing sample index, and lets any number of independent consumers
+(ASR, a socket streamer, VAD, ...) each read "everything since my cursor" without copying.
+
+The storage is mirrored (every sample is written twice, at i and i + capacity), so any range of
+up to `capacity` samples is a contiguous slice and read() can always return a view.
+For audio rates that's a negligible amount of extra copying.
+
+If a consumer falls behind by more than `capacity` samples the oldest unread samples are lost;
+instead of happening silently, the lost samples are added to the cursor's `overruns` counter.
+A view returned by read() stays valid until the writer has written another `capacity` samples;
+copy it (or pass copy=True) if you keep it longer than that.
+
+Usage:
+    buffer = AudioRingBuffer(capacity=16000 * 30, channels=1)  # 30 s at 16 kHz
+    asr_cursor = buffer.cursor()
+    vad_cursor = buffer.cursor()
+
+    buffer.write(np.frombuffer(data, dtype=np.int16))  # from the recording thread
+
+    samples, start_index = asr_cursor.read()  # from the consumers, each at its own pace
+    print(asr_cursor.overruns)
+
+Parameters:
+- capacity: number of samples (per channel) kept in memory.
+- channels: number of interleaved channels. Default is 1.
+
+Methods:
+- write(samples): Append int16 samples (1-d interleaved or (n, channels)).
+- cursor(from_start=False): Create a consumer cursor; by default it starts at the current write position.
+- wait(index, timeout=None): Block until more than `index` samples have been written (or timeout), returns the write index.
+- latest(num_samples): Return a view of the last num_samples samples.
+- overruns(): Number of samples lost by all of its cursors together.
+
+AudioCursor:
+- read(max_samples=None, copy=False): Return (samples, start_index) of everything since the cursor and advance it.
+- wait(timeout=None): Block until new samples are available; returns True if there are.
+- overruns: Number of samples this consumer lost because it fell too far behind.
+"""
+
+import threading
+import weakref
+import numpy as np
+
+
+class AudioRingBuffer:
+    def __init__(self, capacity, channels=1):
+        self.capacity = capacity
+        self.channels = channels
+        self.data = np.zeros((2 * capacity, channels), dtype=np.int16)  # mirrored storage
+        self.write_index = 0  # total number of samples written so far
+        self.condition = threading.Condition()
+        self.cursors = weakref.WeakSet()  # for overruns(), without keeping abandoned cursors alive
+
+    def write(self, samples):
+        samples = np.asarray(samples, dtype=np.int16).reshape(-1, self.channels)
+        skipped = max(0, len(samples) - self.capacity)  # nobody could read those anyway
+        samples = samples[skipped:]
+        with self.condition:
+            position = (self.write_index + skipped) % self.capacity
+            first = min(len(samples), self.capacity - position)
+            for offset in (position, position + self.capacity):
+                self.data[offset:offset + first] = samples[:first]
+            rest = len(samples) - first
+            if rest:
+                self.data[:rest] = samples[first:]
+                self.data[self.capacity:self.capacity + rest] = samples[first:]
+            self.write_index += skipped + len(samples)
+            self.condition.notify_all()
+
+    def _view(self, start, stop):
+        position = start % self.capacity
+        return self.data[position:position + (stop - start)]
+
+    def latest(self, num_samples):
+        with self.condition:
+            start = max(0, self.write_index - min(num_samples, self.capacity))
+            return self._view(start, self.write_index)
+
+    def wait(self, index, timeout=None):
+        with self.condition:
+            self.condition.wait_for(lambda: self.write_index > index, timeout=timeout)
+            return self.write_index
+
+    def cursor(self, from_start=False):
+        cursor = AudioCursor(self, 0 if from_start else self.write_index)
+        self.cursors.add(cursor)
+        return cursor
+
+    def overruns(self):
+        return sum(cursor.overruns for cursor in list(self.cursors))
+
+
+class AudioCursor:
+    def __init__(self, buffer, index):
+        self.buffer = buffer
+        self.index = index  # sample index of the next sample to read
+        self.overruns = 0
+
+    def read(self, max_samples=None, copy=False):
+        buffer = self.buffer
+        with buffer.condition:
+            oldest = buffer.write_index - buffer.capacity
+            if self.index < oldest:
+                self.overruns += oldest - self.index
+                self.index = oldest
+            stop = buffer.write_index if max_samples is None else min(buffer.write_index, self.index + max_samples)
+            start = self.index
+            samples = buffer._view(start, stop)
+            self.index = stop
+        return (samples.copy() if copy else samples), start
+
+    def available(self):
+        return min(self.buffer.write_index - self.index, self.buffer.capacity)
+
+    def wait(self, timeout=None):
+        return self.buffer.wait(self.index, timeout=timeout) > self.index
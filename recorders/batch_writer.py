@@ -0,0 +1,108 @@
+"""
+A BatchWriter object appends small binary records to a file from a latency sensitive thread
+(e.g. a pynput or pyxhook callback) without making a write() syscall per record.
+
+Records are copied into a preallocated bytearray; a background thread writes a batch out whenever
+a buffer fills up or `flush_interval` seconds have passed since the last write, whichever comes first.
+Full buffers are handed over and recycled (a small pool), so write() is O(1) and doesn't allocate in steady state.
+If the process crashes, at most the last `flush_interval` seconds of records are lost
+(plus a truncated last record, which the readers ignore).
+
+Usage:
+    writer = BatchWriter('data/mouse.bin', buffer_size=64 * 1024, flush_interval=0.5)
+    writer.write(struct.pack('bhhd', 0, x, y, time.time()))
+    writer.close()  # writes what is left
+
+Parameters:
+- path: path of the output file (overwritten).
+- buffer_size: size of each batch buffer in bytes. Default is 64 KiB.
+- flush_interval: maximum time in seconds a record can wait in memory before it's written. Default is 0.5.
+- fsync: also fsync after every batch, so the data survives an OS crash or power loss, not just a crash of the program. Default is False.
+
+Methods:
+- write(data): Queue the bytes for writing.
+- flush(): Block until everything written so far is on disk (in the OS).
+- close(): Write everything that is left and stop the background thread.
+- bytes_written: Number of bytes written to the file so far.
+"""
+
+import os
+import threading
+
+
+class BatchWriter:
+    def __init__(self, path, buffer_size=64 * 1024, flush_interval=0.5, fsync=False):
+        self.file = open(path, 'wb', 0)
+        self.buffer_size = buffer_size
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+
+        self.free_buffers = [bytearray(buffer_size) for _ in range(2)]
+        self.buffer = bytearray(buffer_size)  # the buffer that write() currently fills
+        self.offset = 0
+        self.full_buffers = []  # (buffer, length) waiting for the background thread
+        self.pending_writes = 0  # batches handed over but not written yet
+        self.bytes_written = 0
+        self.condition = threading.Condition()
+        self.closed = False
+
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def write(self, data):
+        size = len(data)
+        with self.condition:
+            if self.offset + size > self.buffer_size:
+                self._swap()
+                self.condition.notify_all()
+            self.buffer[self.offset:self.offset + size] = data
+            self.offset += size
+
+    def _swap(self):
+        # Hand the current buffer over to the background thread (the lock must be held)
+        if self.offset == 0:
+            return
+        self.full_buffers.append((self.buffer, self.offset))
+        self.pending_writes += 1
+        self.buffer = self.free_buffers.pop() if self.free_buffers else bytearray(self.buffer_size)
+        self.offset = 0
+
+    def _run(self):
+        while True:
+            with self.condition:
+                if not self.full_buffers and not self.closed:
+                    self.condition.wait(timeout=self.flush_interval)
+                if not self.full_buffers:
+                    self._swap()  # time threshold: write the partially filled buffer
+                batches, self.full_buffers = self.full_buffers, []
+                closed = self.closed
+
+            for buffer, length in batches:
+                self.file.write(memoryview(buffer)[:length])
+                self.bytes_written += length
+            if batches and self.fsync:
+                os.fsync(self.file.fileno())
+
+            with self.condition:
+                self.free_buffers.extend(buffer for buffer, _ in batches)
+                self.pending_writes -= len(batches)
+                self.condition.notify_all()
+                if closed and not self.full_buffers and self.offset == 0:
+                    break
+
+    def flush(self):
+        with self.condition:
+            self._swap()
+            self.condition.notify_all()
+            while self.pending_writes > 0 and self.thread.is_alive():
+                self.condition.wait()
+
+    def close(self):
+        with self.condition:
+            if self.closed:
+                return
+            self.closed = True
+            self._swap()
+            self.condition.notify_all()
+        self.thread.join()
+        self.file.close()
@@ -0,0 +1,57 @@
+"""
+A FrameChangeDetector object is a cheap test for "did the screen change since the last frame we kept?".
+
+Instead of a structural similarity over the full resolution frame it compares small grayscale thumbnails:
+every frame is area-downsampled by `downsample` (so every pixel still contributes to a thumbnail pixel,
+and a few changed characters of text are not averaged away completely) and compared with the thumbnail
+of the last frame that was reported as changed. Comparing against the last kept frame, rather than the previous
+captured one, means slow changes (a fade, a progress bar) still add up and eventually trigger a new frame.
+
+Usage:
+    detector = FrameChangeDetector(threshold=2.0)
+    if detector.update(frame):
+        out.write(frame)
+
+Parameters:
+- threshold: minimum absolute difference of a thumbnail pixel (0-255 grayscale) to count as changed. Default is 2.0.
+- downsample: thumbnail downscale factor. Default is 8.
+- min_changed_pixels: number of thumbnail pixels that have to change for the frame to count as changed. Default is 1.
+
+Methods:
+- update(frame): Return True if the frame differs from the last kept frame (the first frame always does),
+    in which case it becomes the new reference.
+- reset(): Forget the reference frame, so the next frame is always reported as changed.
+"""
+
+import cv2
+import numpy as np
+
+
+class FrameChangeDetector:
+    def __init__(self, threshold=2.0, downsample=8, min_changed_pixels=1):
+        self.threshold = threshold
+        self.downsample = downsample
+        self.min_changed_pixels = min_changed_pixels
+        self.reference = None  # thumbnail of the last kept frame
+
+    def thumbnail(self, frame):
+        height, width = frame.shape[:2]
+        size = (max(1, width // self.downsample), max(1, height // self.downsample))
+        small = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+        if small.ndim == 3:
+            small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        return small.astype(np.int16)
+
+    def update(self, frame):
+        thumbnail = self.thumbnail(frame)
+        if self.reference is None or self.reference.shape != thumbnail.shape:
+            self.reference = thumbnail
+            return True
+        changed_pixels = np.count_nonzero(np.abs(thumbnail - self.reference) > self.threshold)
+        if changed_pixels < self.min_changed_pixels:
+            return False
+        self.reference = thumbnail
+        return True
+
+    def reset(self):
+        self.reference = None
@@ -0,0 +1,165 @@
+"""
+Voice commands: match spoken phrases in the stream of ASR results and control devices without blocking.
+
+A CommandMatcher holds the phrases in a token trie and keeps the set of partial matches that are still alive
+("turn", "turn it", ...). Every ASR result is normalized (lowercase, punctuation removed) and its words advance
+those states, so the cost per result depends on its number of words, not on the length of the session, and a
+phrase split over two results ("turn it" + " on.") is still found. Any number of phrases can be registered;
+every phrase that is completed fires, including phrases that end inside a longer one.
+
+A DeviceController sends HTTP requests to one device from a worker thread, over a requests.Session that keeps
+the connection open between commands, with a timeout. post() returns immediately with a Future.
+With the default single worker, commands reach the device in the order they were given.
+
+Usage:
+    commands = CommandMatcher({'turn it on': 'on', 'turn it off': 'off', 'lights out': 'off'})
+    lamp = DeviceController('http://192.168.0.24:5000', timeout=2.0)
+
+    for transcript in ...:
+        for signal in commands.feed(transcript.text):
+            lamp.post('/control', {'signal': signal})
+
+    lamp.close()
+
+CommandMatcher parameters:
+- phrases: dict of phrase -> value returned by feed() when the phrase is spoken.
+
+CommandMatcher methods:
+- add(phrase, value): Register another phrase.
+- feed(text): Advance the matcher with an ASR result (whole words); returns the values of the completed phrases.
+- reset(): Forget the partial matches, e.g. after a long pause.
+
+DeviceController parameters:
+- base_url: URL of the device, e.g. 'http://192.168.0.24:5000'.
+- timeout: seconds to wait for the device (connect and read). Default is 2.0.
+- max_workers: number of requests in flight at once. Default is 1, which keeps the commands in order.
+- verbose: print the responses. Default is False. Errors are always printed.
+
+DeviceController methods:
+- post(path, json): Send a POST request in the background, returns a concurrent.futures.Future of the response.
+- close(): Wait for the pending requests and close the connection.
+
+Example:
+    At the bottom of this file is an example against a local stand-in for the device.
+"""
+
+import string
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import requests
+except ImportError:  # only needed by DeviceController
+    requests = None
+
+
+PUNCTUATION = str.maketrans('', '', string.punctuation)
+
+
+def normalize(text):
+    return text.lower().translate(PUNCTUATION).split()
+
+
+class CommandMatcher:
+    def __init__(self, phrases=None):
+        self.root = {}  # token -> child node; the value of a completed phrase is stored under the key None
+        self.active = []  # trie nodes of the phrases matched partially so far
+        for phrase, value in (phrases or {}).items():
+            self.add(phrase, value)
+
+    def add(self, phrase, value):
+        node = self.root
+        for token in normalize(phrase):
+            node = node.setdefault(token, {})
+        node[None] = value
+
+    def feed(self, text):
+        matches = []
+        for token in normalize(text):
+            active = []
+            for node in [self.root, *self.active]:
+                child = node.get(token)
+                if child is not None:
+                    if None in child:
+                        matches.append(child[None])
+                    if len(child) > 1 or None not in child:
+                        active.append(child)  # longer phrases continue from here
+            self.active = active
+        return matches
+
+    def reset(self):
+        self.active = []
+
+
+class DeviceController:
+    def __init__(self, base_url, timeout=2.0, max_workers=1, verbose=False):
+        if requests is None:
+            raise ImportError('DeviceController needs the requests package')
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.verbose = verbose
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=max_workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='DeviceController')
+        self.lock = threading.Lock()
+        self.errors = 0
+
+    def _post(self, path, json):
+        response = self.session.post(self.base_url + path, json=json, timeout=self.timeout)
+        response.raise_for_status()
+        return response
+
+    def _done(self, future):
+        error = future.exception()
+        if error is not None:
+            with self.lock:
+                self.errors += 1
+            print(f'Error controlling {self.base_url}: {error}')
+        elif self.verbose:
+            print(future.result().text)
+
+    def post(self, path, json=None):
+        future = self.executor.submit(self._post, path, json)
+        future.add_done_callback(self._done)
+        return future
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        self.session.close()
+
+
+if __name__ == '__main__':
+    import json
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    # A local stand-in for the lamp on the Jetson Nano
+    received = []
+
+    class LampHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'  # keep-alive, like the real server
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+            received.append(body['signal'])
+            reply = f"Lamp turned {body['signal']}".encode()
+            self.send_response(200)
+            self.send_header('Content-Length', str(len(reply)))
+            self.end_headers()
+            self.wfile.write(reply)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), LampHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    commands = CommandMatcher({'turn it on': 'on', 'turn it off': 'off', 'lights out': 'off'})
+    lamp = DeviceController(f'http://127.0.0.1:{server.server_port}', verbose=True)
+    for text in [' Could you', ' turn it', ' on?', ' Thanks. Now turn', ' it off.', ' Lights out!']:
+        for signal in commands.feed(text):
+            lamp.post('/control', {'signal': signal})
+    lamp.close()
+    server.shutdown()
+    print('The lamp received:', received)
@@ -0,0 +1,334 @@
+"""
+Random-access training samples straight from recorded sessions: aligned windows of every stream, decoded on demand.
+
+A SessionDataset enumerates the same windows as the ShardExporter (see recorders/export.py): `window` seconds,
+every `stride` seconds from the start of each session, over the time every stream has covered. dataset[i] returns
+window i as a dict:
+    'session', 'start_time'
+    <video>, <video>_mask   (frames, height, width, 3) uint8 at `video_fps`, and (frames,) bool: False where there was no frame
+    <audio>                 (samples, channels) int16, zero-padded where nothing was recorded
+    'mouse'                 the mouse events of the window (MOUSE_EVENT_DTYPE)
+    'keyboard_event', 'keyboard_key', 'keyboard_time': the key events of the window
+
+Decoding a frame means decoding from the closest keyframe before it, so sampling windows at random through
+cv2.VideoCapture would decode most of a GOP for every frame. Instead the streams are decoded in chunks of
+`chunk_duration` seconds: the frames of all windows in the chunk (the sample times are known up front) in one
+forward pass that only converts those frames, resized to frame_size. Audio is chunked by sample index instead
+(chunk_duration seconds' worth of samples from Session.sample_at), and a window takes the samples from the index of its
+start time on, exactly like the ShardExporter, so both give the same samples for a window. The chunks are kept
+in a DecodedCache: an LRU cache bounded to `cache_bytes` and shared by all threads. Windows that fall in a cached chunk
+cost no decoding at all, e.g. the other windows of the chunk in sequential order, or most windows once the cache holds
+the whole (downscaled) dataset. The mouse and keyboard logs are memory-mapped and read directly.
+
+Iterating over the dataset decodes ahead at chunk granularity: the chunks the coming windows need are handed to a pool
+of `workers` threads (OpenCV decodes without holding the GIL), up to `prefetch` chunks ahead of the window being
+assembled, so different chunks decode in parallel while the current one is consumed. The windows themselves are
+assembled in the iterating thread from the decoded chunks. The pool lives as long as the dataset (until close()),
+and every thread has its own Session objects because the video decoders aren't thread-safe.
+
+Usage:
+    dataset = SessionDataset(['data/20240101-120000'], window=2.0, video_fps=4, frame_size=(320, 180), cache_bytes=2 << 30)
+    sample = dataset[123]  # random access
+    for sample in dataset.iterate(shuffle=True, seed=0):  # prefetched
+        train(sample['screens'], sample['microphone'])
+    print(dataset.cache.hits, dataset.cache.misses)
+    dataset.close()
+
+    python -m benchmarks.dataset  # samples per second, sequential and shuffled
+
+Parameters:
+- session_dirs: the session directories (data/<timestamp>/).
+- window, stride, video_fps, frame_size, streams, finished: as for ShardExporter.
+- chunk_duration: seconds of every stream decoded and cached as one unit. Default is 10.0.
+- cache_bytes: maximum size of the decoded chunks kept in memory. Default is 1 GiB; 0 disables the cache.
+- workers: number of prefetch threads. Default is 4; 0 decodes in the iterating thread.
+- prefetch: number of chunks decoded ahead of the iteration. Default is 16.
+
+Methods:
+- __len__(), __getitem__(i): Number of windows / window i.
+- iterate(shuffle=False, seed=None): Iterate over the windows in order or shuffled, prefetching.
+- close(): Stop the prefetch threads, release the decoders of all threads and clear the cache.
+"""
+
+import math
+import threading
+import cv2
+import numpy as np
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from .export import session_coverage, count_windows
+from .session import Session
+
+
+class DecodedCache:
+    # Size-bounded LRU cache, safe to share between threads; a missing key is loaded once even if requested concurrently
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # key -> (value, size), least recently used first
+        self.loading = {}  # key -> threading.Event set when the key is loaded
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key, load):
+        # load() returns (value, size in bytes)
+        while True:
+            with self.lock:
+                if key in self.entries:
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return self.entries[key][0]
+                event = self.loading.get(key)
+                if event is None:
+                    event = self.loading[key] = threading.Event()
+                    self.misses += 1
+                    break
+            event.wait()  # being loaded by another thread; if it wasn't kept (too large), load it here
+
+        try:
+            value, size = load()
+            with self.lock:
+                if size <= self.max_bytes:
+                    self.entries[key] = (value, size)
+                    self.size += size
+                    while self.size > self.max_bytes:
+                        _, (_, evicted_size) = self.entries.popitem(last=False)
+                        self.size -= evicted_size
+        finally:
+            with self.lock:
+                del self.loading[key]
+            event.set()
+        return value
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+
+class SessionDataset:
+    def __init__(self, session_dirs, window=2.0, stride=None, video_fps=4, frame_size=None, streams=None,
+                 chunk_duration=10.0, cache_bytes=1 << 30, workers=4, prefetch=16, finished=False):
+        self.session_dirs = [str(session_dir) for session_dir in session_dirs]
+        self.window = window
+        self.stride = stride if stride is not None else window
+        self.frame_offsets = np.arange(max(1, round(window * video_fps))) / video_fps
+        self.frame_size = tuple(frame_size) if frame_size is not None else None
+        self.chunk_duration = chunk_duration
+        self.workers = workers
+        self.prefetch = prefetch
+        self.cache = DecodedCache(cache_bytes)
+
+        # Streams, start time, audio formats and first samples of every session, and the (session number, start time)
+        # and position in its session of every window
+        self.sessions = []
+        window_sessions, window_starts, window_positions = [], [], []
+        for number, session_dir in enumerate(self.session_dirs):
+            session = Session(session_dir)
+            try:
+                session.build_indexes()
+                session_streams, start_time, end_time = session_coverage(session, streams, finished)
+                audio_formats = {name: session.audio_format(name) for kind, name in session_streams if kind == 'audio'}
+                num_windows = count_windows(start_time, end_time, window, self.stride)
+                starts = start_time + np.arange(num_windows) * self.stride if num_windows else np.empty(0)
+                first_samples = {name: [session.sample_at(start, name) for start in starts] for name in audio_formats}
+            finally:
+                session.close()
+            self.sessions.append((session_streams, start_time, audio_formats, first_samples))
+            window_sessions.append(np.full(num_windows, number, dtype=np.int64))
+            window_starts.append(starts)
+            window_positions.append(np.arange(num_windows))
+        self.window_sessions = np.concatenate(window_sessions) if window_sessions else np.empty(0, dtype=np.int64)
+        self.window_starts = np.concatenate(window_starts) if window_starts else np.empty(0)
+        self.window_positions = np.concatenate(window_positions) if window_positions else np.empty(0, dtype=np.int64)
+        # The times any window takes a frame at, per session: only those frames are decoded
+        self.sample_times = [np.unique((starts[:, None] + self.frame_offsets).ravel()) for starts in window_starts]
+
+        self.local = threading.local()  # Session objects of the current thread
+        self.open_sessions = []  # of all threads, for close()
+        self.open_lock = threading.Lock()
+        self.executor = None  # the prefetch threads, created by the first iterate()
+
+    def __len__(self):
+        return len(self.window_starts)
+
+    def _session(self, number):
+        sessions = getattr(self.local, 'sessions', None)
+        if sessions is None:
+            sessions = self.local.sessions = {}
+        if number not in sessions:
+            sessions[number] = Session(self.session_dirs[number])
+            with self.open_lock:
+                self.open_sessions.append(sessions[number])
+        return sessions[number]
+
+    def _chunk_start(self, number, chunk):
+        return self.sessions[number][1] + chunk * self.chunk_duration
+
+    def _chunks(self, number, start_time, end_time):
+        origin = self.sessions[number][1]
+        first = math.floor((start_time - origin) / self.chunk_duration)
+        last = math.floor((end_time - origin) / self.chunk_duration)
+        return range(first, last + 1)
+
+    def _resize(self, frame):
+        if self.frame_size is None or (frame.shape[1], frame.shape[0]) == self.frame_size:
+            return frame
+        return cv2.resize(frame, self.frame_size, interpolation=cv2.INTER_AREA)
+
+    def _load_video_chunk(self, number, name, chunk):
+        # (times, frames) at the sample times of all windows that fall in the chunk, decoded in one forward pass
+        chunk_start = self._chunk_start(number, chunk)
+        times = self.sample_times[number]
+        times = times[(times >= chunk_start) & (times < chunk_start + self.chunk_duration)]
+        resized = {}  # times showing the same (unchanged) frame share it, resize it once
+        frames = []
+        for frame in self._session(number).frames_at(times, name):
+            if frame is not None and id(frame) not in resized:
+                resized[id(frame)] = self._resize(frame)
+            frames.append(resized[id(frame)] if frame is not None else None)
+        return (times, frames), sum(frame.nbytes for frame in resized.values())
+
+    def _chunk_samples(self, number, name):
+        return round(self.chunk_duration * self.sessions[number][2][name][0])
+
+    def _audio_chunks(self, number, name, first_sample):
+        # The chunks holding the samples of a window from first_sample on
+        chunk_samples = self._chunk_samples(number, name)
+        window_samples = round(self.window * self.sessions[number][2][name][0])
+        return range(first_sample // chunk_samples, (first_sample + window_samples - 1) // chunk_samples + 1)
+
+    def _load_audio_chunk(self, number, name, chunk):
+        chunk_samples = self._chunk_samples(number, name)
+        samples = self._session(number).samples(chunk * chunk_samples, chunk_samples, name)
+        return samples, samples.nbytes
+
+    def _load_chunk(self, key):
+        kind, number, name, chunk = key
+        if kind == 'video':
+            return self._load_video_chunk(number, name, chunk)
+        return self._load_audio_chunk(number, name, chunk)
+
+    def _chunk(self, key, prefetched=None):
+        # A decoded chunk: from its prefetch future if there is one (which holds it even if the cache doesn't), else the cache
+        future = prefetched.get(key) if prefetched is not None else None
+        if future is not None:
+            return future.result()
+        return self.cache.get(key, lambda: self._load_chunk(key))
+
+    def _chunk_keys(self, i):
+        # The chunks window i needs
+        number, start_time = int(self.window_sessions[i]), float(self.window_starts[i])
+        keys = []
+        for kind, name in self.sessions[number][0]:
+            if kind == 'video':
+                chunks = self._chunks(number, start_time, start_time + self.frame_offsets[-1])
+            elif kind == 'audio':
+                first_sample = self.sessions[number][3][name][self.window_positions[i]]
+                chunks = self._audio_chunks(number, name, first_sample) if first_sample is not None else []
+            else:
+                continue
+            keys += [(kind, number, name, chunk) for chunk in chunks]
+        return keys
+
+    def _video(self, number, name, start_time, prefetched=None):
+        times = start_time + self.frame_offsets
+        frames = None
+        mask = np.zeros(len(times), dtype=bool)
+        for chunk in self._chunks(number, times[0], times[-1]):
+            chunk_times, chunk_frames = self._chunk(('video', number, name, chunk), prefetched)
+            chunk_start = self._chunk_start(number, chunk)
+            selected = np.flatnonzero((times >= chunk_start) & (times < chunk_start + self.chunk_duration))
+            picks = np.searchsorted(chunk_times, times[selected], side='right') - 1
+            for i, pick in zip(selected, picks):
+                if pick < 0 or chunk_frames[pick] is None:
+                    continue
+                frame = chunk_frames[pick]
+                if frames is None:
+                    frames = np.zeros((len(times), *frame.shape), dtype=np.uint8)
+                elif frame.shape != frames.shape[1:]:
+                    frame = cv2.resize(frame, (frames.shape[2], frames.shape[1]), interpolation=cv2.INTER_AREA)  # the resolution was adapted during the recording
+                frames[i] = frame
+                mask[i] = True
+        if frames is None:
+            width, height = self.frame_size if self.frame_size is not None else (0, 0)
+            frames = np.zeros((len(times), height, width, 3), dtype=np.uint8)
+        return frames, mask
+
+    def _audio(self, number, name, first_sample, prefetched=None):
+        sample_rate, channels = self.sessions[number][2][name]
+        window_samples = round(self.window * sample_rate)
+        audio = np.zeros((window_samples, channels), dtype=np.int16)
+        if first_sample is None:
+            return audio
+        chunk_samples = self._chunk_samples(number, name)
+        for chunk in self._audio_chunks(number, name, first_sample):
+            samples = self._chunk(('audio', number, name, chunk), prefetched)
+            offset = chunk * chunk_samples - first_sample  # of the chunk in the window
+            begin, end = max(0, offset), min(window_samples, offset + chunk_samples)
+            audio[begin:end] = samples[begin - offset:end - offset]
+        return audio
+
+    def __getitem__(self, i):
+        return self._sample(i)
+
+    def _sample(self, i, prefetched=None):
+        number, start_time = int(self.window_sessions[i]), float(self.window_starts[i])
+        sample = {'session': self.session_dirs[number], 'start_time': start_time}
+        for kind, name in self.sessions[number][0]:
+            if kind == 'video':
+                sample[name], sample[f'{name}_mask'] = self._video(number, name, start_time, prefetched)
+            elif kind == 'audio':
+                sample[name] = self._audio(number, name, self.sessions[number][3][name][self.window_positions[i]], prefetched)
+            elif kind == 'mouse':
+                sample['mouse'] = np.asarray(self._session(number).mouse(start_time, start_time + self.window))
+            else:
+                events = self._session(number).keyboard(start_time, start_time + self.window)
+                for field in ('event', 'key', 'time'):
+                    sample[f'keyboard_{field}'] = np.asarray(events[field])
+        return sample
+
+    def __iter__(self):
+        return self.iterate()
+
+    def iterate(self, shuffle=False, seed=None):
+        order = np.arange(len(self))
+        if shuffle:
+            np.random.default_rng(seed).shuffle(order)
+        if self.workers == 0:
+            for i in order:
+                yield self[i]
+            return
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(max_workers=self.workers)
+        prefetched = {}  # chunk key -> future of the decoded chunk, for the windows up to `ahead`
+        last_use = {}  # chunk key -> position in `order` of the last window so far that needs it
+        ahead = 0  # position of the next window whose chunks are submitted
+        try:
+            for position, i in enumerate(order):
+                # Submit the chunks of the coming windows, at least those of this window, up to `prefetch` chunks held
+                while ahead < len(order) and (ahead <= position or len(prefetched) < self.prefetch):
+                    for key in self._chunk_keys(order[ahead]):
+                        if key not in prefetched:
+                            prefetched[key] = self.executor.submit(self._chunk, key)
+                        last_use[key] = ahead
+                    ahead += 1
+                yield self._sample(i, prefetched)
+                for key in [key for key, last in last_use.items() if last == position]:
+                    del prefetched[key], last_use[key]  # the chunk stays in the cache if it fits
+        finally:
+            for future in prefetched.values():
+                future.cancel()  # the iteration was stopped early
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=True, cancel_futures=True)
+            self.executor = None
+        with self.open_lock:
+            for session in self.open_sessions:
+                session.close()
+            self.open_sessions = []
+        self.local = threading.local()
+        self.cache.clear()
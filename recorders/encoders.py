@@ -0,0 +1,98 @@
+"""
+Video encoder backends used by ScreenRecorder and WebcamRecorder.
+
+All backends share the small part of the cv2.VideoWriter interface the recorders use:
+write(frame) with a BGR uint8 frame of the configured size, isOpened() and release().
+
+- OpenCVEncoder: cv2.VideoWriter with a fourcc (default 'mp4v', i.e. MPEG-4 Part 2, which every OpenCV build can write).
+- FFmpegEncoder: pipes the raw frames to a local `ffmpeg` process, so we get H.264 (or H.265, AV1, ...)
+    without needing an OpenCV build with FFMPEG support. Codec, preset, CRF, output pixel format
+    and thread count are configurable; x264 at the same visual quality is several times smaller than mp4v.
+- TileEncoder ('tiles'): lossless tile-delta format for pixel-exact screen recordings, see recorders/tile_codec.py.
+
+Use create_encoder() to pick one by name; 'ffmpeg' falls back to OpenCV when no ffmpeg binary is found.
+
+Usage:
+    out = create_encoder('data/screen.mp4', fps=30, frame_size=(1920, 1080), backend='ffmpeg',
+                         codec='libx264', preset='veryfast', crf=23)
+    out.write(frame)
+    out.release()
+
+Parameters (FFmpegEncoder):
+- codec: ffmpeg video encoder name. Default is 'libx264'.
+- preset: encoder speed/size trade-off ('ultrafast' ... 'veryslow' for x264/x265). Default is 'veryfast'.
+- crf: constant rate factor, lower is better quality. Default is 23.
+- pix_fmt: output pixel format. Default is 'yuv420p' (playable everywhere; odd frame sizes are padded to even).
+- threads: encoder threads, 0 lets ffmpeg decide. Default is 0.
+- ffmpeg: path of the ffmpeg binary. Default is 'ffmpeg'.
+
+The benchmark comparing the backends is in benchmarks/encoders.py.
+"""
+
+import shutil
+import subprocess
+import cv2
+import numpy as np
+
+from .tile_codec import TileEncoder
+
+ENCODER_BACKENDS = ('opencv', 'ffmpeg', 'tiles')
+
+
+class OpenCVEncoder:
+    def __init__(self, output_file, fps, frame_size, fourcc='mp4v'):
+        self.frame_size = tuple(frame_size)
+        self.writer = cv2.VideoWriter(str(output_file), cv2.VideoWriter_fourcc(*fourcc), fps, self.frame_size)
+
+    def isOpened(self):
+        return self.writer.isOpened()
+
+    def write(self, frame):
+        self.writer.write(frame)
+
+    def release(self):
+        self.writer.release()
+
+
+class FFmpegEncoder:
+    def __init__(self, output_file, fps, frame_size, codec='libx264', preset='veryfast', crf=23, pix_fmt='yuv420p', threads=0, ffmpeg='ffmpeg'):
+        self.frame_size = tuple(frame_size)
+        width, height = self.frame_size
+        command = [ffmpeg, '-hide_banner', '-loglevel', 'error', '-y',
+                   '-f', 'rawvideo', '-pix_fmt', 'bgr24', '-s', f'{width}x{height}', '-r', str(fps), '-i', '-',
+                   '-c:v', codec, '-pix_fmt', pix_fmt, '-threads', str(threads)]
+        if preset is not None:
+            command += ['-preset', preset]
+        if crf is not None:
+            command += ['-crf', str(crf)]
+        if '420' in pix_fmt and (width % 2 or height % 2):
+            command += ['-vf', 'pad=ceil(iw/2)*2:ceil(ih/2)*2']  # chroma subsampled formats need even dimensions
+        command.append(str(output_file))
+        self.process = subprocess.Popen(command, stdin=subprocess.PIPE)
+
+    def isOpened(self):
+        return self.process.poll() is None
+
+    def write(self, frame):
+        if (frame.shape[1], frame.shape[0]) != self.frame_size:
+            raise ValueError(f"Frame size {frame.shape[1]}x{frame.shape[0]} doesn't match the encoder's {self.frame_size[0]}x{self.frame_size[1]}")
+        self.process.stdin.write(np.ascontiguousarray(frame).data)
+
+    def release(self):
+        if self.process.stdin.closed:
+            return
+        self.process.stdin.close()
+        self.process.wait()
+
+
+def create_encoder(output_file, fps, frame_size, backend='opencv', **options):
+    if backend not in ENCODER_BACKENDS:
+        raise ValueError(f"Unknown encoder backend: {backend} (expected one of {ENCODER_BACKENDS})")
+    if backend == 'tiles':
+        return TileEncoder(output_file, fps, frame_size, **options)
+    if backend == 'ffmpeg':
+        if shutil.which(options.get('ffmpeg', 'ffmpeg')) is not None:
+            return FFmpegEncoder(output_file, fps, frame_size, **options)
+        print("Warning: ffmpeg not found, falling back to the OpenCV encoder.")
+        options = {}
+    return OpenCVEncoder(output_file, fps, frame_size, **options)
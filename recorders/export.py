@@ -0,0 +1,283 @@
+"""
+Export recorded sessions as training shards: aligned fixed-length windows of every stream, in compressed .npz files.
+
+A ShardExporter cuts a session (data/<timestamp>/) into windows of `window` seconds, every `stride` seconds from the
+start of the session, and gathers for every window:
+- video streams (screens, webcam_0, ...): the frame shown at `video_fps` evenly spaced times, decoded through the
+    session's indexes (see Session.frames_at), optionally resized to `frame_size`.
+- audio streams (microphone, ...): the int16 samples of the window, zero-padded where nothing was recorded.
+- mouse and keyboard: the events of the window (variable length, see below).
+
+`windows_per_shard` consecutive windows make one shard, <output_dir>/<session>/shard_<number>_<windows>.npz:
+    window_start     (n,) float64, seconds since the epoch
+    <video>          (n, frames, height, width, 3) uint8, and <video>_mask (n, frames) bool: False where there was no frame
+    <audio>          (n, samples, channels) int16, and <audio>_rate: the sample rate
+    mouse            all mouse events of the shard (MOUSE_EVENT_DTYPE), and mouse_offsets (n + 1,):
+                     the events of window i are mouse[mouse_offsets[i]:mouse_offsets[i + 1]]
+    keyboard_event, keyboard_key, keyboard_time, keyboard_offsets: the same for the key events, with the key names
+
+The shards are exported in parallel by a process pool, across shards and sessions; every worker opens the session
+itself and decodes only its own time range. A shard is written to a temporary file and renamed when complete,
+so a re-run skips the shards that exist and picks up where an interrupted export stopped. Only windows that
+every stream has already covered are exported: the closed segments in manifest.jsonl (see recorders/segments.py),
+so a stream recorded without segmentation only counts once its recorder has stopped and finalized the file.
+Sessions recorded before the manifest existed have no entries at all: export them with finished=True (--finished).
+Exporting a session that is still being recorded in segments works too; a later run adds the new windows, replacing
+the last shard if it grew (the number of windows is part of its name). The parameters of the export are kept in
+<output_dir>/<session>/export.json, and an export with other parameters (window, stride, windows_per_shard,
+video_fps, frame_size, streams) into the same directory raises a ValueError instead of mixing or reusing shards.
+
+Usage:
+    exporter = ShardExporter('shards', window=2.0, video_fps=4, frame_size=(320, 180))
+    shards = exporter.export(['data/20240101-120000', 'data/20240102-090000'])
+
+    shard = np.load('shards/20240101-120000/shard_00000_0064.npz')
+    screens = shard['screens']  # (64, 8, 180, 320, 3)
+
+    python -m recorders.export data/* --output shards --window 2 --video-fps 4 --frame-size 320 180
+
+Parameters:
+- output_dir: directory of the shards, one subdirectory per session.
+- window: length of the windows in seconds. Default is 2.0.
+- stride: seconds between the starts of consecutive windows. Default is None, meaning `window` (no overlap).
+- windows_per_shard: number of windows per shard file. Default is 64.
+- video_fps: number of frames per second of window taken from every video stream. Default is 4.
+- frame_size: (width, height) every frame is resized to. Default is None, meaning the recorded size.
+- streams: names of the streams to export, e.g. ['screens', 'microphone', 'mouse']. Default is None, meaning all.
+- max_workers: number of worker processes. Default is None, meaning one per CPU.
+- finished: treat streams missing from the manifest as complete, for sessions recorded before manifest.jsonl existed.
+    Default is False.
+
+Methods:
+- plan(session_dir): The shards of a session that still have to be exported (writes or checks its export.json).
+- export_shard(task): Export one planned shard; returns its path.
+- export(session_dirs): Plan and export the shards of the given sessions in parallel; returns the paths written.
+"""
+
+import json
+import math
+import os
+import cv2
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+from .mouse_reader import MOUSE_EVENT_DTYPE
+from .segments import read_manifest
+from .session import Session
+
+
+PARAMETERS_NAME = 'export.json'  # the ShardExporter parameters of the shards in a session's output directory
+
+
+def _end_time(session, kind, name, finished=False):
+    # Time up to which a stream is complete; None if it has no data, -inf if nothing of it is complete yet
+    if kind in ('video', 'audio'):
+        closed = read_manifest(session.path, stream=name)
+        if closed:
+            return max(entry['end_time'] for entry in closed)
+        if not finished or not (session.path / f'{name}_timestamps.bin').exists():
+            # Still being recorded: a media file is only readable once it's finalized and listed in the manifest,
+            # even if its timestamps index is already on disk
+            return -math.inf
+        # finished: a session recorded before the manifest existed, every file is complete
+        index = session.frame_index(name) if kind == 'video' else session.audio_index(name)
+        return float(index['time'][-1]) if len(index) else None
+    times = session.mouse(-np.inf, np.inf)['time'] if kind == 'mouse' else session.keyboard(-np.inf, np.inf)['time']
+    return float(times[-1]) if len(times) else None
+
+
+def session_coverage(session, names=None, finished=False):
+    # The (kind, name) streams of a session that have data, and the time range every one of them has covered
+    streams = [('video', name) for name in session.video_streams()]
+    streams += [('audio', name) for name in session.audio_streams()]
+    streams += [(name, name) for name in session.input_streams()]
+    if names is not None:
+        streams = [(kind, name) for kind, name in streams if name in names]
+    covered, end_times, input_end_times = [], [], []
+    for kind, name in streams:
+        end_time = _end_time(session, kind, name, finished)
+        if end_time is not None:
+            covered.append((kind, name))
+            # The input logs are written as the events happen: their last event says nothing about coverage
+            (end_times if kind in ('video', 'audio') else input_end_times).append(end_time)
+    start_time = session.start_time()
+    if not covered or start_time is None:
+        return [], None, None
+    if not end_times:
+        return covered, start_time, max(input_end_times)
+    return covered, start_time, max(start_time, min(end_times))  # no windows while a stream has nothing complete
+
+
+def count_windows(start_time, end_time, window, stride):
+    if start_time is None:
+        return 0
+    return max(0, math.floor((end_time - start_time - window) / stride) + 1)
+
+
+class ShardExporter:
+    def __init__(self, output_dir, window=2.0, stride=None, windows_per_shard=64, video_fps=4, frame_size=None, streams=None, max_workers=None, finished=False):
+        self.output_dir = Path(output_dir)
+        self.window = window
+        self.stride = stride if stride is not None else window
+        self.windows_per_shard = windows_per_shard
+        self.video_fps = video_fps
+        self.frame_size = tuple(frame_size) if frame_size is not None else None
+        self.streams = streams
+        self.max_workers = max_workers
+        self.finished = finished
+
+    def plan(self, session_dir):
+        session = Session(session_dir)
+        try:
+            session.build_indexes()  # once here, instead of racing to write the caches in every worker
+            streams, start_time, end_time = session_coverage(session, self.streams, self.finished)
+        finally:
+            session.close()
+        if not streams:
+            return []
+
+        num_windows = count_windows(start_time, end_time, self.window, self.stride)
+        shard_dir = self.output_dir / Path(session_dir).name
+        self._check_parameters(shard_dir)
+        tasks = []
+        for shard in range(math.ceil(num_windows / self.windows_per_shard)):
+            first = shard * self.windows_per_shard
+            count = min(self.windows_per_shard, num_windows - first)
+            path = shard_dir / f'shard_{shard:05d}_{count:04d}.npz'
+            if not path.exists():
+                tasks.append({'session': str(session_dir), 'shard': shard, 'start_time': start_time + first * self.stride,
+                              'count': count, 'path': str(path), 'streams': streams})
+        return tasks
+
+    def parameters(self):
+        # What the shards of a session depend on, besides the recording
+        return {'window': self.window, 'stride': self.stride, 'windows_per_shard': self.windows_per_shard, 'video_fps': self.video_fps,
+                'frame_size': list(self.frame_size) if self.frame_size is not None else None,
+                'streams': sorted(self.streams) if self.streams is not None else None}
+
+    def _check_parameters(self, shard_dir):
+        # The existing shards are only reused by an export with the same parameters
+        path = shard_dir / PARAMETERS_NAME
+        if path.exists():
+            with path.open() as f:
+                previous = json.load(f)
+            if previous != self.parameters():
+                raise ValueError(f"{shard_dir} was exported with {previous}, not {self.parameters()}: "
+                                 f"use another output directory, or delete it to export again")
+            return
+        if any(shard_dir.glob('shard_*.npz')):
+            raise ValueError(f"{shard_dir} has shards without {PARAMETERS_NAME}, exported with unknown parameters: "
+                             f"use another output directory, or delete it to export again")
+        shard_dir.mkdir(parents=True, exist_ok=True)
+        temporary = path.with_suffix('.tmp')
+        with temporary.open('w') as f:
+            json.dump(self.parameters(), f)
+        os.replace(temporary, path)
+
+    def _video(self, session, name, starts):
+        offsets = np.arange(max(1, round(self.window * self.video_fps))) / self.video_fps
+        frames = None
+        mask = np.zeros((len(starts), len(offsets)), dtype=bool)
+        for i, start in enumerate(starts):
+            for j, frame in enumerate(session.frames_at(start + offsets, name)):
+                if frame is None:
+                    continue
+                if self.frame_size is not None and (frame.shape[1], frame.shape[0]) != self.frame_size:
+                    frame = cv2.resize(frame, self.frame_size, interpolation=cv2.INTER_AREA)
+                if frames is None:
+                    frames = np.zeros((len(starts), len(offsets), *frame.shape), dtype=np.uint8)
+                elif frame.shape != frames.shape[2:]:
+                    frame = cv2.resize(frame, (frames.shape[3], frames.shape[2]), interpolation=cv2.INTER_AREA)  # the resolution was adapted during the recording
+                frames[i, j] = frame
+                mask[i, j] = True
+        if frames is None:
+            width, height = self.frame_size if self.frame_size is not None else (0, 0)
+            frames = np.zeros((len(starts), len(offsets), height, width, 3), dtype=np.uint8)
+        return {name: frames, f'{name}_mask': mask}
+
+    def _audio(self, session, name, starts):
+        sample_rate, channels = session.audio_format(name)
+        window_samples = round(self.window * sample_rate)
+        audio = np.zeros((len(starts), window_samples, channels), dtype=np.int16)
+        for i, start in enumerate(starts):
+            first_sample = session.sample_at(start, name)  # the same rounding as the SessionDataset
+            if first_sample is not None:
+                audio[i] = session.samples(first_sample, window_samples, name)
+        return {name: audio, f'{name}_rate': np.array(sample_rate)}
+
+    def _events(self, session, kind, starts):
+        windows = [session.mouse(start, start + self.window) if kind == 'mouse' else session.keyboard(start, start + self.window)
+                   for start in starts]
+        lengths = [len(events) if kind == 'mouse' else len(events['time']) for events in windows]
+        offsets = np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64)
+        if kind == 'mouse':
+            events = np.concatenate([np.asarray(events) for events in windows]) if windows else np.empty(0, dtype=MOUSE_EVENT_DTYPE)
+            return {'mouse': events, 'mouse_offsets': offsets}
+        arrays = {'keyboard_offsets': offsets}
+        for field in ('event', 'key', 'time'):
+            arrays[f'keyboard_{field}'] = np.concatenate([np.asarray(events[field]) for events in windows])
+        return arrays
+
+    def export_shard(self, task):
+        starts = task['start_time'] + np.arange(task['count']) * self.stride
+        arrays = {'window_start': starts}
+        session = Session(task['session'])
+        try:
+            for kind, name in task['streams']:
+                if kind == 'video':
+                    arrays.update(self._video(session, name, starts))
+                elif kind == 'audio':
+                    arrays.update(self._audio(session, name, starts))
+                else:
+                    arrays.update(self._events(session, kind, starts))
+        finally:
+            session.close()
+
+        path = Path(task['path'])
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temporary = path.with_suffix('.tmp')
+        with open(temporary, 'wb') as f:
+            np.savez_compressed(f, **arrays)
+        os.replace(temporary, path)  # a shard file is always complete
+        for stale in path.parent.glob(f"shard_{task['shard']:05d}_*.npz"):
+            if stale != path:
+                stale.unlink()  # the same shard with fewer windows, from a run during the recording
+        return str(path)
+
+    def export(self, session_dirs, verbose=False):
+        tasks = [task for session_dir in session_dirs for task in self.plan(session_dir)]
+        paths = []
+        if not tasks:
+            return paths
+        with ProcessPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = [executor.submit(self.export_shard, task) for task in tasks]
+            for future in as_completed(futures):
+                paths.append(future.result())
+                if verbose:
+                    print(f"{len(paths)}/{len(tasks)} {paths[-1]}")
+        return sorted(paths)
+
+
+if __name__ == '__main__':
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description='Export recorded sessions as training shards (see recorders/export.py).')
+    parser.add_argument('sessions', nargs='+', help='session directories, e.g. data/*')
+    parser.add_argument('--output', default='shards')
+    parser.add_argument('--window', type=float, default=2.0)
+    parser.add_argument('--stride', type=float, default=None)
+    parser.add_argument('--windows-per-shard', type=int, default=64)
+    parser.add_argument('--video-fps', type=float, default=4)
+    parser.add_argument('--frame-size', type=int, nargs=2, default=None, metavar=('WIDTH', 'HEIGHT'))
+    parser.add_argument('--streams', nargs='+', default=None)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--finished', action='store_true', help='sessions recorded before manifest.jsonl existed')
+    args = parser.parse_args()
+
+    exporter = ShardExporter(args.output, args.window, args.stride, args.windows_per_shard, args.video_fps,
+                             args.frame_size, args.streams, args.workers, args.finished)
+    start = time.perf_counter()
+    paths = exporter.export(args.sessions, verbose=True)
+    print(f"{len(paths)} shards written in {time.perf_counter() - start:.1f} s")
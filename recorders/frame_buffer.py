@@ -0,0 +1,103 @@
+"""
+A FrameRingBuffer object keeps the most recent video frames (and the time each one was captured)
+in a single preallocated NumPy array, so a capture thread can keep history in memory
+without allocating a new array or rebuilding a list on every frame.
+
+The storage is allocated lazily from the first frame that is pushed (so the recorder doesn't have to know
+the capture resolution up front) and re-allocated only if the frame shape or dtype changes.
+
+Usage:
+    buffer = FrameRingBuffer(capacity=100)
+    buffer.push(frame, time.time())  # from the capture thread
+
+    # from the consumer
+    frames, timestamps = buffer.fetch()  # everything pushed since the previous fetch
+
+Parameters:
+- capacity: maximum number of frames kept in memory. Default is 100.
+
+Methods:
+- push(frame, timestamp): Copy the frame into the next slot of the ring.
+- fetch(copy=False): Return (frames, timestamps) pushed since the previous call, as stacked arrays.
+    When the unread frames are contiguous in the ring the returned arrays are views (zero-copy),
+    which stay valid until the writer wraps around to those slots again; pass copy=True to keep them longer.
+    If the consumer fell behind by more than `capacity` frames, the oldest ones are lost and counted in `overruns`.
+- latest(n): Return (frames, timestamps) of the last n frames, oldest first (same view semantics as fetch).
+
+Example:
+    At the bottom of this file is a simple example of how to use this class.
+"""
+
+import threading
+import numpy as np
+
+
+class FrameRingBuffer:
+    def __init__(self, capacity=100):
+        self.capacity = capacity
+        self.frames = None  # (capacity, *frame_shape), allocated on the first push
+        self.timestamps = np.zeros(capacity, dtype=np.float64)
+        self.write_count = 0  # total number of frames pushed so far
+        self.read_count = 0  # total number of frames handed out by fetch()
+        self.overruns = 0  # frames that were overwritten before fetch() could return them
+        self.lock = threading.Lock()
+
+    def _allocate(self, shape, dtype):
+        self.frames = np.empty((self.capacity, *shape), dtype=dtype)
+        self.write_count = 0
+        self.read_count = 0
+
+    def push(self, frame, timestamp):
+        with self.lock:
+            if self.frames is None or self.frames.shape[1:] != frame.shape or self.frames.dtype != frame.dtype:
+                self._allocate(frame.shape, frame.dtype)
+            slot = self.write_count % self.capacity
+            np.copyto(self.frames[slot], frame)
+            self.timestamps[slot] = timestamp
+            self.write_count += 1
+
+    def _range(self, start, stop, copy):
+        # Frames [start, stop) in push order, as views when they don't wrap around the end of the ring
+        if self.frames is None or stop <= start:
+            shape = self.frames.shape[1:] if self.frames is not None else (0,)
+            dtype = self.frames.dtype if self.frames is not None else np.uint8
+            return np.empty((0, *shape), dtype=dtype), np.empty(0, dtype=np.float64)
+        first, last = start % self.capacity, (stop - 1) % self.capacity
+        if first <= last:
+            frames, timestamps = self.frames[first:last + 1], self.timestamps[first:last + 1]
+            if copy:
+                frames, timestamps = frames.copy(), timestamps.copy()
+        else:
+            frames = np.concatenate((self.frames[first:], self.frames[:last + 1]))
+            timestamps = np.concatenate((self.timestamps[first:], self.timestamps[:last + 1]))
+        return frames, timestamps
+
+    def fetch(self, copy=False):
+        with self.lock:
+            start = max(self.read_count, self.write_count - self.capacity)
+            self.overruns += start - self.read_count
+            self.read_count = self.write_count
+            return self._range(start, self.write_count, copy)
+
+    def latest(self, n, copy=False):
+        with self.lock:
+            start = max(0, self.write_count - min(n, self.capacity))
+            return self._range(start, self.write_count, copy)
+
+    def __len__(self):
+        return min(self.write_count, self.capacity)
+
+
+if __name__ == '__main__':
+    import time
+
+    buffer = FrameRingBuffer(capacity=4)
+    for i in range(6):
+        buffer.push(np.full((2, 3, 3), i, dtype=np.uint8), time.time())
+
+    frames, timestamps = buffer.fetch()
+    print(frames[:, 0, 0, 0], buffer.overruns)  # [2 3 4 5] 2
+
+    buffer.push(np.full((2, 3, 3), 6, dtype=np.uint8), time.time())
+    frames, timestamps = buffer.fetch()
+    print(frames[:, 0, 0, 0])  # [6]
@@ -0,0 +1,157 @@
+"""
+A shared-memory frame bus, so processes other than the recording one (a model, a viewer, ...) can read
+the live screen or webcam frames without re-capturing them or pickling them through a pipe.
+
+A FrameBusPublisher (owned by the recorder) creates a multiprocessing.shared_memory block holding
+a small header, `slots` frame slots and, per slot, the sequence number and timestamp of the frame in it.
+Frames are published round-robin; sequence numbers start at 1 and increase by one per frame.
+Each slot's sequence number is set to 0 while the slot is being written, so a reader never mistakes a half-written
+frame for a complete one.
+
+A FrameBusSubscriber attaches to the block by name from any local process and returns NumPy views straight into
+the shared memory (zero-copy). Since the publisher keeps going, a view is only valid until its slot is reused:
+check is_valid(seqs) after using the frames (or pass copy=True). A reader that falls more than `slots` frames behind
+misses frames; read_new() counts them in `overruns`, so slow readers can be detected.
+
+Usage:
+    # recording process
+    recorder = ScreenRecorder(..., frame_bus='screen')
+
+    # any other local process
+    bus = FrameBusSubscriber('screen')
+    frames, timestamps, seqs = bus.latest(4)  # the last 4 frames, oldest first
+    ... use the frames ...
+    if not bus.is_valid(seqs):
+        ...  # the publisher overwrote some of them in the meantime
+    frames, timestamps, seqs = bus.read_new()  # everything since the previous read_new()
+    print(bus.overruns)
+
+Parameters (FrameBusPublisher):
+- name: name of the shared memory block.
+- shape: shape of one frame, e.g. (height, width, 3).
+- dtype: frame dtype. Default is np.uint8.
+- slots: number of frames kept. Default is 8.
+"""
+
+import struct
+import numpy as np
+from multiprocessing import shared_memory, resource_tracker
+
+
+BUS_MAGIC = b'UIOBUS01'
+BUS_HEADER = struct.Struct('<8sII3I8s')  # magic, slots, ndim, shape (up to 3 dimensions, 0 padded), dtype string
+BUS_ALIGNMENT = 64
+
+
+def _layout(slots, frame_bytes):
+    # offsets of the write sequence number, the per-slot metadata and the frame data
+    write_seq_offset = BUS_ALIGNMENT
+    meta_offset = write_seq_offset + 8
+    data_offset = -(-(meta_offset + slots * 16) // BUS_ALIGNMENT) * BUS_ALIGNMENT
+    return write_seq_offset, meta_offset, data_offset, data_offset + slots * frame_bytes
+
+
+class _FrameBus:
+    def _map(self, slots, shape, dtype):
+        self.slots = slots
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        frame_bytes = int(np.prod(self.shape)) * self.dtype.itemsize
+        write_seq_offset, meta_offset, data_offset, _ = _layout(slots, frame_bytes)
+        buf = self.shm.buf
+        self.write_seq = np.ndarray((1,), dtype=np.uint64, buffer=buf, offset=write_seq_offset)
+        self.slot_seqs = np.ndarray((slots,), dtype=np.uint64, buffer=buf, offset=meta_offset, strides=(16,))
+        self.slot_times = np.ndarray((slots,), dtype=np.float64, buffer=buf, offset=meta_offset + 8, strides=(16,))
+        self.data = np.ndarray((slots, *self.shape), dtype=self.dtype, buffer=buf, offset=data_offset)
+
+    def _unmap(self):
+        self.write_seq = self.slot_seqs = self.slot_times = self.data = None  # views must go before the buffer can close
+
+
+class FrameBusPublisher(_FrameBus):
+    def __init__(self, name, shape, dtype=np.uint8, slots=8):
+        if len(shape) > 3:
+            raise ValueError(f"Frames can have at most 3 dimensions, got shape {shape}")
+        frame_bytes = int(np.prod(shape)) * np.dtype(dtype).itemsize
+        size = _layout(slots, frame_bytes)[3]
+        try:
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        except FileExistsError:
+            # Left over from a recorder that crashed: replace it
+            stale = shared_memory.SharedMemory(name=name)
+            stale.close()
+            stale.unlink()
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        self.name = name
+        padded_shape = (*shape, *(0,) * (3 - len(shape)))
+        BUS_HEADER.pack_into(self.shm.buf, 0, BUS_MAGIC, slots, len(shape), *padded_shape, np.dtype(dtype).str.encode())
+        self._map(slots, shape, dtype)
+        self.write_seq[0] = 0
+        self.slot_seqs[:] = 0
+
+    def publish(self, frame, timestamp):
+        if frame.shape != self.shape:
+            raise ValueError(f"Frame shape {frame.shape} doesn't match the bus shape {self.shape}")
+        seq = int(self.write_seq[0]) + 1
+        slot = (seq - 1) % self.slots
+        self.slot_seqs[slot] = 0  # being written
+        self.data[slot] = frame
+        self.slot_times[slot] = timestamp
+        self.slot_seqs[slot] = seq
+        self.write_seq[0] = seq
+
+    def close(self):
+        self._unmap()
+        self.shm.close()
+        self.shm.unlink()
+
+
+class FrameBusSubscriber(_FrameBus):
+    def __init__(self, name):
+        # Only the publisher may unlink the block, so don't let the resource tracker clean it up when this process exits
+        try:
+            self.shm = shared_memory.SharedMemory(name=name, track=False)  # Python 3.13+
+        except TypeError:
+            self.shm = shared_memory.SharedMemory(name=name)
+            resource_tracker.unregister(self.shm._name, 'shared_memory')
+        magic, slots, ndim, d0, d1, d2, dtype = BUS_HEADER.unpack_from(self.shm.buf, 0)
+        if magic != BUS_MAGIC:
+            raise ValueError(f"Shared memory block {name} is not a frame bus")
+        self._map(slots, (d0, d1, d2)[:ndim], dtype.rstrip(b'\0').decode())
+        self.last_seq = int(self.write_seq[0])  # read_new() starts with the frames published after attaching
+        self.overruns = 0
+
+    def _read(self, first_seq, last_seq, copy):
+        # Frames first_seq..last_seq (inclusive) that are still intact, oldest first
+        seqs = np.arange(max(first_seq, 1, last_seq - self.slots + 1), last_seq + 1, dtype=np.uint64)
+        slots = ((seqs - 1) % self.slots).astype(np.intp)
+        valid = self.slot_seqs[slots] == seqs
+        seqs, slots = seqs[valid], slots[valid]
+        if len(slots) and np.all(np.diff(slots) == 1):
+            frames, timestamps = self.data[slots[0]:slots[-1] + 1], self.slot_times[slots[0]:slots[-1] + 1]
+            if copy:
+                frames = frames.copy()
+            timestamps = timestamps.copy()
+        else:
+            frames, timestamps = self.data[slots], self.slot_times[slots]  # fancy indexing copies
+        return frames, timestamps, seqs
+
+    def latest(self, n=1, copy=False):
+        last_seq = int(self.write_seq[0])
+        return self._read(last_seq - n + 1, last_seq, copy)
+
+    def read_new(self, copy=False):
+        last_seq = int(self.write_seq[0])
+        frames, timestamps, seqs = self._read(self.last_seq + 1, last_seq, copy)
+        self.overruns += (last_seq - self.last_seq) - len(seqs)
+        self.last_seq = last_seq
+        return frames, timestamps, seqs
+
+    def is_valid(self, seqs):
+        # True if none of the frames with these sequence numbers has been overwritten yet
+        seqs = np.asarray(seqs, dtype=np.uint64)
+        return bool(np.all(self.slot_seqs[((seqs - 1) % self.slots).astype(np.intp)] == seqs))
+
+    def close(self):
+        self._unmap()
+        self.shm.close()
@@ -1,38 +1,79 @@
+"""
+A KeyboardListener object records key presses and releases to a binary log (see recorders/keyboard_log.py
+for the format and KeyboardLogReader), written in batches by a background thread (see BatchWriter).
+
+Usage:
+    listener = KeyboardListener(bin_file='data/keyboard.bin')
+    listener.start()
+    events = listener.fetch_events()  # [event, key name, time] rows since the last call
+    listener.stop()
+
+Parameters:
+- bin_file: path of the log; the key names go to <stem>_keys.txt next to it.
+- memory_limit: number of events kept for fetch_events(). Default is 100.
+- flush_interval: maximum time in seconds an event is kept in memory before it's written to the file. Default is 0.5.
+- clock: the SessionClock shared by all recorders of the session. Default is None, meaning a new one.
+- hook: replacement for pyxhook's HookManager, e.g. SyntheticInputStorm.keyboard_hook(). Default is None, meaning the real keyboard.
+
+stats() returns runtime metrics (see recorders/metrics.py): events written (rate and interval), write_latency
+(time a callback spends writing an event) and bytes_written.
+Key presses are also published as 'key' events on `listener.activity` (see recorders/activity.py).
+"""
+
 import time
 import atexit
+from time import perf_counter  # write_row's `time` argument shadows the module
+import struct
 import threading
-import csv
-import pyxhook
+from collections import deque
+try:
+    import pyxhook
+except ImportError:  # only needed for the real keyboard, see recorders/sources.py for the synthetic one
+    pyxhook = None
+
+from .batch_writer import BatchWriter
+from .keyboard_log import KEY_EVENT_FORMAT, KeyNameTable, keys_path
+from .session_clock import SessionClock
+from .metrics import RecorderMetrics
+from .activity import ActivityPublisher
 
 class KeyboardListener:
-    def __init__(self, csv_file='data/keyboard_events.csv', memory_limit=100):
-        self.keyboard = pyxhook.HookManager()
+    def __init__(self, bin_file='data/keyboard.bin', memory_limit=100, flush_interval=0.5, clock=None, hook=None):
+        self.keyboard = hook if hook is not None else pyxhook.HookManager()  # or e.g. SyntheticInputStorm.keyboard_hook()
+        self.clock = clock if clock is not None else SessionClock()  # shared session timeline for the event times
         self.start_time = time.time()
 
-        self.csv_file = open(csv_file, 'w', newline='', buffering=1)
-        self.writer = csv.writer(self.csv_file)
-        self.writer.writerow(['event', 'key', 'time'])  # write header
-        atexit.register(self.csv_file.close)
+        self.record = struct.Struct(KEY_EVENT_FORMAT)
+        self.key_names = KeyNameTable(keys_path(bin_file))
+        self.bin_file = BatchWriter(bin_file, flush_interval=flush_interval)
+        atexit.register(self.bin_file.close)
+        atexit.register(self.key_names.close)
 
-        self.events = []
+        self.events = deque(maxlen=memory_limit)
         self.memory_limit = memory_limit
         self.lock = threading.Lock()
         self.pressed_keys = set()
+        self.metrics = RecorderMetrics('keyboard')
+        self.activity = ActivityPublisher()  # 'key' events for other recorders
+        self.thread = None
 
     def write_row(self, event, key_name, time):
-        row = [event, key_name, time]
-        self.writer.writerow(row)
-        self.events.append(row)
-        self.events = self.events[-self.memory_limit:]
+        write_start = perf_counter()
+        with self.lock:
+            self.bin_file.write(self.record.pack(event, self.key_names.id(key_name), time))
+            self.events.append([event, key_name, time])
+        self.metrics.tick('events')
+        self.metrics.observe('write_latency', perf_counter() - write_start)
 
     def get_time(self):
-        return time.time()
+        return self.clock.time()
 
     def on_press(self, event):
         current_time = self.get_time()
         if event.Key in self.pressed_keys:
             return
         self.pressed_keys.add(event.Key)
+        self.activity.publish('key', current_time)
         self.write_row(0, event.Key, current_time)
 
     def on_release(self, event):
@@ -51,12 +92,18 @@ class KeyboardListener:
         if self.thread is not None:
             self.keyboard.cancel()
             self.thread.join()
+            self.bin_file.flush()
             print('Keyboard listener stopped.')
         else:
             print('Keyboard listener not running.')
 
+    def stats(self):
+        stats = self.metrics.snapshot()
+        stats['bytes_written'] = self.bin_file.bytes_written
+        return stats
+
     def fetch_events(self):
         with self.lock:
-            events_copy = self.events.copy()
+            events_copy = list(self.events)
             self.events.clear()
         return events_copy
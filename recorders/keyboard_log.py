@@ -0,0 +1,134 @@
+"""
+The binary keyboard log written by KeyboardListener, and a memory-mapped reader for it.
+
+keyboard.bin holds one fixed-width little-endian record per event (KEY_EVENT_DTYPE, 16 bytes):
+- event (int8): 0 for a key press, 1 for a key release.
+- key_id (uint16): index of the key name in the string table.
+- time (float64): seconds since the epoch on the session timeline, at offset 8.
+
+The string table keyboard_keys.txt (next to the log, `<stem>_keys.txt`) has one key name per line, in the order
+the keys were first seen, so key_id is the line number. A name is always written (and flushed) to the table before
+the first event that uses it, so after a crash every recorded event can still be resolved.
+
+KeyboardLogReader maps the log with np.memmap (a truncated trailing record is ignored) and reads the string table
+when it's opened, and again when events refer to a key_id beyond it, e.g. a log that is still being written.
+key_rows() turns the events into plot rows with one lookup per distinct key instead of per event.
+
+Usage:
+    reader = KeyboardLogReader('data/<timestamp>/keyboard.bin')
+    events = reader.events  # structured array with fields event, key_id, time
+    names = reader.keys[events['key_id']]  # key name of every event
+    window = reader.time_range(t0, t1)
+
+    rows, labels = key_rows(reader, lowercase=True)  # row of every event, name of every row
+
+    # one-off conversion of a session recorded with the old csv log
+    convert_keyboard_csv('data/<timestamp>/keyboard.csv')  # writes keyboard.bin and keyboard_keys.txt next to it
+
+Methods (KeyboardLogReader):
+- time_range(start_time, end_time): Return the events with start_time <= time < end_time (binary search).
+- key_names(events): Key names of the given events.
+- __len__(), __getitem__(index): Number of complete records / direct indexing into the events.
+"""
+
+import csv
+import struct
+import numpy as np
+from pathlib import Path
+
+
+KEY_EVENT_FORMAT = '<bxH4xd'
+KEY_EVENT_DTYPE = np.dtype({'names': ['event', 'key_id', 'time'],
+                            'formats': ['i1', '<u2', '<f8'],
+                            'offsets': [0, 2, 8],
+                            'itemsize': struct.calcsize(KEY_EVENT_FORMAT)})
+
+
+def keys_path(bin_file):
+    bin_file = Path(bin_file)
+    return bin_file.with_name(bin_file.stem + '_keys.txt')
+
+
+class KeyNameTable:
+    # Interns key names for a log being written: new names are appended to the string table right away
+    def __init__(self, path):
+        self.file = open(path, 'w', encoding='utf-8', buffering=1)
+        self.ids = {}
+
+    def id(self, name):
+        key_id = self.ids.get(name)
+        if key_id is None:
+            key_id = len(self.ids)
+            self.file.write(name + '\n')  # line buffered, so it's on disk before any event refers to it
+            self.ids[name] = key_id
+        return key_id
+
+    def close(self):
+        self.file.close()
+
+
+class KeyboardLogReader:
+    def __init__(self, bin_file):
+        self.bin_file = Path(bin_file)
+        num_records = self.bin_file.stat().st_size // KEY_EVENT_DTYPE.itemsize
+        if num_records > 0:
+            self.events = np.memmap(self.bin_file, dtype=KEY_EVENT_DTYPE, mode='r', shape=(num_records,))
+        else:
+            self.events = np.empty(0, dtype=KEY_EVENT_DTYPE)
+        self._load_keys()
+
+    def _load_keys(self):
+        self.keys = np.array(keys_path(self.bin_file).read_text(encoding='utf-8').split('\n')[:-1], dtype=str)
+
+    def _check_keys(self, key_ids):
+        # The table read so far may end before the newest keys of a log that is still being written
+        if len(key_ids) and key_ids.max() >= len(self.keys):
+            self._load_keys()
+
+    def __len__(self):
+        return len(self.events)
+
+    def __getitem__(self, index):
+        return self.events[index]
+
+    def time_range(self, start_time, end_time):
+        start, end = np.searchsorted(self.events['time'], [start_time, end_time], side='left')
+        return self.events[start:end]
+
+    def key_names(self, events):
+        self._check_keys(events['key_id'])
+        return self.keys[events['key_id']]
+
+
+def key_rows(reader, lowercase=True):
+    # Plot row of every event and the label of every row, with keys differing only in case merged if lowercase
+    reader._check_keys(reader.events['key_id'])
+    names = np.char.lower(reader.keys) if lowercase else reader.keys
+    labels, key_rows = np.unique(names, return_inverse=True)  # row of every key id
+    return key_rows[reader.events['key_id']], labels
+
+
+def convert_keyboard_csv(csv_file, bin_file=None):
+    # event,key,time -> keyboard.bin + keyboard_keys.txt
+    csv_file = Path(csv_file)
+    bin_file = Path(bin_file) if bin_file is not None else csv_file.with_suffix('.bin')
+    with csv_file.open(newline='') as f:
+        rows = list(csv.DictReader(f))
+    keys = KeyNameTable(keys_path(bin_file))
+    events = np.empty(len(rows), dtype=KEY_EVENT_DTYPE)
+    events['event'] = [int(row['event']) for row in rows]
+    events['key_id'] = [keys.id(row['key']) for row in rows]
+    events['time'] = [float(row['time']) for row in rows]
+    keys.close()
+    events.tofile(bin_file)
+    return bin_file
+
+
+if __name__ == '__main__':
+    import sys
+
+    # Convert the csv keyboard logs given on the command line, e.g. data/*/keyboard.csv
+    for csv_file in sys.argv[1:]:
+        bin_file = convert_keyboard_csv(csv_file)
+        reader = KeyboardLogReader(bin_file)
+        print(f"{csv_file} -> {bin_file} ({len(reader)} events, {len(reader.keys)} keys)")
@@ -0,0 +1,169 @@
+"""
+Runtime metrics of the recorders: counters, gauges and latency histograms, kept cheap enough for the capture loops.
+
+Every recorder has a RecorderMetrics object (`recorder.metrics`) that its threads update as they go, and a stats()
+method returning a snapshot, e.g. for ScreenRecorder:
+    {'recorder': 'screen', 'elapsed': 12.0, 'captures': 120, 'captures_rate': 10.0,
+     'captures_interval': {'count': 119, 'mean': 0.1, 'std': 0.0004, 'min': ..., 'max': ..., 'p50': ..., 'p90': ..., 'p99': ...},
+     'grab_latency': {...}, 'convert_latency': {...}, 'encode_latency.screens': {...}, 'capture_queue_depth': {...},
+     'dropped_frames': 0, 'bytes_written': 1234567, ...}
+Times are in seconds; `<name>_rate` is the achieved rate of a ticked stream of items (frames, chunks, events) since
+the start, and the std of its `<name>_interval` histogram is the jitter.
+
+A metric update is a dict lookup plus an integer increment or a bisect into fixed bucket bounds, without locks:
+every metric is only updated by one thread, and snapshots read the values as they are (a snapshot can be one update
+behind). Histograms keep counts in exponential buckets (8 per doubling, so percentiles are within ~9%) instead of
+the values, so they take constant memory however long the recording runs.
+
+A MetricsLogger appends the stats of a set of recorders to a JSONL file every `interval` seconds, one line per
+recorder, with the per-second rates of every counter over the interval added as `<counter>_per_s`.
+
+Usage:
+    logger = MetricsLogger('data/<timestamp>/metrics.jsonl', [screen_recorder, microphone_recorder, mouse_listener], interval=10)
+    logger.start()
+    print(screen_recorder.stats()['captures_rate'])
+    logger.stop()  # writes a last line per recorder
+
+Methods (RecorderMetrics):
+- count(name, n=1): Add to a counter.
+- gauge(name, value): Set the current value of a gauge.
+- observe(name, value): Add a value to a histogram.
+- tick(name, now=None): Count an item of a stream and observe its interval to the previous one (`<name>_interval`).
+- snapshot(): The current values, as a JSON-serializable dict.
+"""
+
+import bisect
+import json
+import math
+import threading
+import time
+
+
+class Histogram:
+    def __init__(self, lowest=1e-6, highest=1e4, buckets_per_doubling=8):
+        num_bounds = int(math.ceil(math.log2(highest / lowest) * buckets_per_doubling)) + 1
+        self.bounds = [lowest * 2 ** (i / buckets_per_doubling) for i in range(num_bounds)]
+        self.counts = [0] * (num_bounds + 1)  # counts[i]: bounds[i - 1] < value <= bounds[i]
+        self.count = 0
+        self.total = 0.0
+        self.total_squares = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        self.total_squares += value * value
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, q):
+        # Upper bound of the bucket holding the q-th percentile, clamped to the observed range
+        if self.count == 0:
+            return None
+        rank = q / 100 * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count:
+                bound = self.bounds[i] if i < len(self.bounds) else self.max
+                return min(max(bound, self.min), self.max)
+        return self.max
+
+    def summary(self):
+        if self.count == 0:
+            return {'count': 0}
+        mean = self.total / self.count
+        variance = max(0.0, self.total_squares / self.count - mean * mean)
+        return {'count': self.count, 'mean': mean, 'std': math.sqrt(variance), 'min': self.min, 'max': self.max,
+                'p50': self.percentile(50), 'p90': self.percentile(90), 'p99': self.percentile(99)}
+
+
+class RecorderMetrics:
+    def __init__(self, name):
+        self.name = name
+        self.start_time = time.monotonic()
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+        self.last_ticks = {}
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def gauge(self, name, value):
+        self.gauges[name] = value
+
+    def observe(self, name, value):
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = Histogram()
+        histogram.add(value)
+
+    def tick(self, name, now=None):
+        now = time.monotonic() if now is None else now
+        self.counters[name] = self.counters.get(name, 0) + 1
+        last = self.last_ticks.get(name)
+        self.last_ticks[name] = now
+        if last is not None:
+            self.observe(name + '_interval', now - last)
+
+    def snapshot(self):
+        elapsed = time.monotonic() - self.start_time
+        stats = {'recorder': self.name, 'elapsed': elapsed}
+        stats.update(list(self.counters.items()))  # list(): other threads may add keys meanwhile
+        stats.update(list(self.gauges.items()))
+        for name in list(self.last_ticks):
+            stats[name + '_rate'] = self.counters.get(name, 0) / elapsed if elapsed > 0 else 0.0
+        for name, histogram in list(self.histograms.items()):
+            stats[name] = histogram.summary()
+        return stats
+
+
+class MetricsLogger:
+    def __init__(self, path, recorders, interval=10.0):
+        self.path = path
+        self.recorders = list(recorders)
+        self.interval = interval
+        self.previous = {}  # recorder number -> (time, counters) of the last line
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def start(self):
+        self.stop_event.clear()
+        self.file = open(self.path, 'a')
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        if self.thread is None:
+            return
+        self.stop_event.set()
+        self.thread.join()
+        self.thread = None
+        self.log()
+        self.file.close()
+
+    def _run(self):
+        while not self.stop_event.wait(self.interval):
+            self.log()
+
+    def log(self):
+        now = time.time()
+        for number, recorder in enumerate(self.recorders):
+            try:
+                stats = recorder.stats()
+            except Exception as e:  # e.g. a recorder process that died, see recorders/process.py
+                stats = {'error': repr(e)}
+            counters = {name: value for name, value in stats.items() if isinstance(value, int) and not isinstance(value, bool)}
+            if number in self.previous:
+                previous_time, previous_counters = self.previous[number]
+                for name, value in counters.items():
+                    if name in previous_counters and now > previous_time:
+                        stats[name + '_per_s'] = (value - previous_counters[name]) / (now - previous_time)
+            self.previous[number] = (now, counters)
+            self.file.write(json.dumps({'time': now, **stats}) + '\n')
+        self.file.flush()
@@ -26,6 +26,15 @@ Parameters:
 - rate: sample rate in Hz. Default is 16000.
 - chunk_size: size of audio chunks to read at a time. Default is 1024. Smaller values 
     may result in smoother audio, but too small values can cause performance issues.
+- memory_limit: number of chunks kept in memory for the consumers (see AudioRingBuffer). Default is 100.
+- clock: the SessionClock shared by all recorders of the session. Default is None, meaning a new one.
+- audio: a pyaudio.PyAudio-like object to record from, e.g. SyntheticAudio (see recorders/sources.py). Default is None, meaning pyaudio.
+- segment_duration, segment_size: start a new WAV file every segment_duration seconds and/or segment_size bytes,
+    finalizing the previous one, and list it in the session's manifest.jsonl (see recorders/segments.py). Default is None (one file).
+
+Every chunk gets a record in <name>_timestamps.bin (see AUDIO_INDEX_DTYPE in recorders/timestamp_index.py) that maps
+its sample offset in the WAV file to session time, computed from the sample count and the measured drift of the device
+against the session clock (see SampleClock), not from the jittery time the chunk happened to be read.
 
 Methods:
 - start(): Start recording audio.
@@ -33,42 +42,68 @@ Methods:
 - fetch_audio_data(): Returns the raw audio data recorded since the last call to this method 
     and clears the internal buffer. This can be useful if you want to process the audio data 
     while you're recording. The data is returned as a bytes object.
+- time_at(sample_index): Session timeline time (seconds since the epoch) of the given sample, e.g. a cursor's start_index.
+- stats(): Runtime metrics (see recorders/metrics.py): chunks (rate and interval, i.e. read jitter), write latency,
+    samples, the measured sample rate, input_overflows and lost_samples (input the device dropped because the reads fell
+    behind; written as silence, see SampleClock), overruns of the consumers' cursors and bytes_written.
+- cursor(): Returns a new AudioCursor on the in-memory ring buffer, for consumers that need their own
+    independent position (ASR, streaming, VAD). cursor.read() returns an int16 view of everything since the last read,
+    and cursor.overruns counts the samples that consumer lost by falling more than memory_limit chunks behind.
+    fetch_audio_data() uses its own cursor, `fetch_cursor`.
 
 Example:
     At the bottom of this file is a simple example of how to use this class.
 """
 
 import atexit
-import pyaudio
+import numpy as np
 import threading
-import wave
 import time
 
 from pathlib import Path
 
+try:
+    import pyaudio
+except ImportError:  # only needed for the real audio devices, see recorders/sources.py for the synthetic ones
+    pyaudio = None
+
+from .audio_buffer import AudioRingBuffer
+from .session_clock import SessionClock, SampleClock
+from .segments import AudioSegmentWriter, segment_path, timestamps_path
+from .metrics import RecorderMetrics
+
 
 class MircophoneRecorder:
-    def __init__(self, output_file='data/microphone.wav', channels=1, sample_rate=16000, chunk_size=1024, memory_limit=100):
+    def __init__(self, output_file='data/microphone.wav', channels=1, sample_rate=16000, chunk_size=1024, memory_limit=100, clock=None, audio=None,
+                 segment_duration=None, segment_size=None):
         self.CHUNK = chunk_size
-        self.FORMAT = pyaudio.paInt16
+        self.FORMAT = pyaudio.paInt16 if pyaudio is not None else 8  # 8 == paInt16
         self.CHANNELS = channels
         self.SAMPLERATE = sample_rate
 
-        self.audio = pyaudio.PyAudio()
+        self.audio = audio if audio is not None else pyaudio.PyAudio()
         self.stream = None
 
-        self.frames = []
         self.memory_limit = memory_limit
+        self.buffer = AudioRingBuffer(capacity=memory_limit * chunk_size, channels=channels)
+        self.fetch_cursor = self.buffer.cursor()  # used by fetch_audio_data()
         self.output_file = Path(output_file)
-        self.wave_file = wave.open(output_file, 'wb')
-        self.wave_file.setnchannels(self.CHANNELS)
-        self.wave_file.setsampwidth(self.audio.get_sample_size(self.FORMAT))
-        self.wave_file.setframerate(self.SAMPLERATE)
+        # The WAV file(s) and the chunk timestamps, see recorders/segments.py
+        self.writer = AudioSegmentWriter(self.output_file, self.CHANNELS, self.audio.get_sample_size(self.FORMAT), self.SAMPLERATE,
+                                         segment_duration, segment_size)
+        self.timestamps_path = timestamps_path(segment_path(self.output_file, 0 if self.writer.segmented else None))  # of the first segment
         atexit.register(self.stop)
 
+        self.clock = clock if clock is not None else SessionClock()
+        self.sample_clock = SampleClock(self.clock, self.SAMPLERATE)
+        self.metrics = RecorderMetrics('microphone')  # see stats()
+        self.sample_count = 0  # number of samples (per channel) recorded so far
+        self.input_overflows = 0  # times the device dropped input because the reads fell behind
+        self.lost_samples = 0  # samples (per channel) dropped by the device, written as silence
+
         self.recording = False
         self.thread = None
-        self.last_timestamp = time.time()
+        self.last_timestamp = self.clock.time()
 
     def start(self):
         if self.stream is None:
@@ -79,6 +114,7 @@ class MircophoneRecorder:
                                           frames_per_buffer=self.CHUNK)
         self.stream.start_stream()
         self.recording = True
+        self.metrics = RecorderMetrics('microphone')
 
         self.thread = threading.Thread(target=self.record)
         self.thread.start()
@@ -90,7 +126,7 @@ class MircophoneRecorder:
         if self.stream is not None:
             self.stream.stop_stream()
             self.stream.close()
-        self.wave_file.close
+        self.writer.close()  # finalizes the WAV header
         self.audio.terminate()
         self.thread = None
         output_path = Path(self.output_file)
@@ -99,16 +135,49 @@ class MircophoneRecorder:
     def record(self):
         while self.recording:
             if self.stream is not None:
-                data = self.stream.read(self.CHUNK)
-                self.last_timestamp = time.time()
-                self.frames.append(data)
-                self.wave_file.writeframes(data)
-                self.frames = self.frames[-self.memory_limit:]
+                # No exception on an input overflow: the lost input is detected from the arrival times instead
+                data = self.stream.read(self.CHUNK, exception_on_overflow=False)
+                arrival_time = self.clock.now()
+                self.metrics.tick('chunks', arrival_time)
+                lost = self.sample_clock.lost_samples(self.sample_count + len(data) // (2 * self.CHANNELS), arrival_time, self.CHUNK)
+                if lost > 0:
+                    # Silence in place of the lost input keeps the file on the session timeline. It is detected a few chunks
+                    # after the overflow (see SampleClock), so those chunks are stamped early by the lost duration.
+                    self.input_overflows += 1
+                    self.lost_samples += lost
+                    self._write(bytes(lost * 2 * self.CHANNELS), arrival_time, measured=False)
+                self._write(data, arrival_time)
+
+    def _write(self, data, arrival_time, measured=True):
+        start_sample = self.sample_count
+        self.sample_count += len(data) // (2 * self.CHANNELS)
+        if measured:  # not the silence, which didn't arrive
+            self.sample_clock.update(self.sample_count, arrival_time)
+        write_start = time.perf_counter()
+        self.writer.write(data, start_sample, self.sample_clock.time_at(start_sample), self.clock.to_wall(arrival_time))
+        self.metrics.observe('write_latency', time.perf_counter() - write_start)
+        self.last_timestamp = self.sample_clock.time_at(self.sample_count)
+        self.buffer.write(np.frombuffer(data, dtype=np.int16))
+
+    def stats(self):
+        stats = self.metrics.snapshot()
+        stats['samples'] = self.sample_count
+        stats['sample_rate_estimate'] = self.sample_clock.sample_rate_estimate()
+        stats['input_overflows'] = self.input_overflows
+        stats['lost_samples'] = self.lost_samples
+        stats['overruns'] = self.buffer.overruns()
+        stats['bytes_written'] = self.writer.bytes_written
+        return stats
+
+    def time_at(self, sample_index):
+        return self.sample_clock.time_at(sample_index)
+
+    def cursor(self):
+        return self.buffer.cursor()
 
     def fetch_audio_data(self):
-        audio_data = b''.join(self.frames)
-        self.frames = []
-        return audio_data
+        samples, _ = self.fetch_cursor.read()
+        return samples.tobytes()
 
 
 
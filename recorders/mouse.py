@@ -1,6 +1,7 @@
 """
 A MouseListener object is used to monitor mouse events, including movements, clicks and scroll events.
-These events are continuously written to a binary file.
+These events are continuously written to a binary file, in batches by a background thread (see BatchWriter),
+so the pynput callbacks never wait for a write() syscall.
 The class also provides a fetch_events method which can be used to
 access all the mouse event data that has been accumulated since the previous call to this function.
 
@@ -21,10 +22,23 @@ Usage:
 Parameters:
 - delta_time: Minimum time in seconds between two consecutive mouse movement events.
     Default is None, meaning that every single movement event will be recorded.
+- max_error: record only the movement events needed to reconstruct the trajectory (by linear interpolation in time)
+    within max_error pixels, see TrajectorySimplifier. Clicks and scrolls are always recorded.
+    Default is None, meaning no simplification.
+- flush_interval: maximum time in seconds an event is kept in memory before it's written to the file,
+    i.e. how much data can be lost if the program crashes. Default is 0.5.
+- clock: the SessionClock shared by all recorders of the session. Default is None, meaning a new one.
+- buffer_size: size in bytes of the batches written to the file. Default is 64 KiB.
+- controller, listener: replacements for pynput's mouse Controller and Listener,
+    e.g. from a SyntheticInputStorm (see recorders/sources.py). Default is None, meaning the real mouse.
 
 Methods:
 - start(): Start listening to mouse events.
 - stop(): Stop listening to mouse events.
+- stats(): Runtime metrics (see recorders/metrics.py): events written (rate and interval), moves_received
+    (before delta_time/max_error), write_latency (time a callback spends writing an event) and bytes_written.
+- activity: ActivityPublisher of the moves (after delta_time), clicks and scrolls, e.g. for a ScreenRecorder
+    that captures right after a click (see recorders/activity.py).
 - fetch_events(): Returns the raw mouse event data recorded since the last call to this method and clears the internal buffer.
     This can be useful if you want to process the mouse event data while you're still recording. The data is returned as a bytes object.
 
@@ -35,7 +49,7 @@ Mouse events are recorded as follows:
     5 for scroll event.
 - x and y (2 bytes each): The x and y coordinates of the mouse pointer for movement and click events.
     For scroll events, these are the x and y distances scrolled.
-- time (8 bytes): The time at which the event occurred, as returned by time.time().
+- time (8 bytes): The time at which the event occurred, in seconds since the epoch on the session timeline (SessionClock.time()).
 
 Example:
     At the bottom of this file is a simple example of how to use this class.
@@ -46,19 +60,35 @@ import atexit
 import struct
 import time
 import threading
-from pynput.mouse import Controller, Listener, Button
+from time import perf_counter  # write_row's `time` argument shadows the module
+from collections import deque
+try:
+    from pynput.mouse import Controller, Listener, Button
+except ImportError:  # only needed for the real mouse, see recorders/sources.py for the synthetic one
+    Controller = Listener = Button = None
+
+from .batch_writer import BatchWriter
+from .session_clock import SessionClock
+from .trajectory import TrajectorySimplifier
+from .metrics import RecorderMetrics
+from .activity import ActivityPublisher
 
 
 class MouseListener:
-    def __init__(self, delta_time=None, bin_file='data/mouse_events.bin', memory_limit=100):
-        self.mouse = Controller()
+    def __init__(self, delta_time=None, bin_file='data/mouse_events.bin', memory_limit=100, flush_interval=0.5, buffer_size=64 * 1024, clock=None,
+                 controller=None, listener=None, max_error=None):
+        self.mouse = controller if controller is not None else Controller()
+        self.listener_class = listener if listener is not None else Listener  # called with the on_move/on_click/on_scroll callbacks
+        self.clock = clock if clock is not None else SessionClock()
         self.prev_position = self.mouse.position
         self.delta_time = delta_time
         self.start_time = time.time()
         self.prev_time = self.start_time  # used to check if the mouse has moved more than delta_time
+        self.simplifier = TrajectorySimplifier(max_error) if max_error is not None else None
 
-        self.bin_file = open(bin_file, 'wb', 0)
-        atexit.register(self.bin_file.close)  # make sure the file is being closed when the program exits
+        self.record = struct.Struct('bhhd')  # b: byte, h: short, d: double; for unsigned use B, H
+        self.bin_file = BatchWriter(bin_file, buffer_size=buffer_size, flush_interval=flush_interval)
+        atexit.register(self.bin_file.close)  # make sure the last batch is written when the program exits
 
         self.event2id = {'move':0,
                          'click_left_press':1,
@@ -67,36 +97,58 @@ class MouseListener:
                          'click_right_release':4,
                          'scroll':5}
 
-        self.events = []  # store the events
+        self.events = deque(maxlen=memory_limit)  # store the latest events
         self.memory_limit = memory_limit
         self.lock = threading.Lock()  # for thread-safe operations
+        self.metrics = RecorderMetrics('mouse')
+        self.metrics.count('moves_received', 0)
+        self.activity = ActivityPublisher()  # 'move', 'click' and 'scroll' events for other recorders
 
     def write_row(self, event_id, x, y, time):
-        binary_data = struct.pack('bhhd', event_id, x, y, time)  # b: byte, h: short, d: double; for unsigned use B, H
+        write_start = perf_counter()
+        binary_data = self.record.pack(event_id, x, y, time)
         self.bin_file.write(binary_data)
-        self.events.append(binary_data)
-        self.events = self.events[-self.memory_limit:]
+        with self.lock:
+            self.events.append(binary_data)
+        self.metrics.tick('events')
+        self.metrics.observe('write_latency', perf_counter() - write_start)
 
     def get_time(self):
-        return time.time() # - self.start_time
+        return self.clock.time() # - self.start_time
 
     def on_move(self, x, y):
         current_time = self.get_time()
+        self.metrics.count('moves_received')
 
         # only record if the mouse has moved more than delta_time
         if self.delta_time is not None:
             if (current_time - self.prev_time) < self.delta_time:
                 return
             self.prev_time = current_time
+        self.activity.publish('move', current_time)
         
         current_position = (x, y)
         if self.prev_position != current_position:
             self.prev_position = current_position
             event_id = self.event2id['move']
-            self.write_row(event_id, x, y, current_time)
+            if self.simplifier is None:
+                self.write_row(event_id, x, y, current_time)
+            else:
+                kept = self.simplifier.add(x, y, current_time)
+                if kept is not None:
+                    self.write_row(event_id, *kept[:3])
+
+    def flush_moves(self):
+        # Write the pending simplified move, so the trajectory is complete up to now
+        if self.simplifier is not None:
+            kept = self.simplifier.flush()
+            if kept is not None:
+                self.write_row(self.event2id['move'], *kept[:3])
 
     def on_click(self, x, y, button, pressed):
         current_time = self.get_time()
+        self.activity.publish('click', current_time)
+        self.flush_moves()
         event_id = -1  # default value : unknown event
         if button == button.left:
             if pressed:
@@ -112,11 +164,13 @@ class MouseListener:
 
     def on_scroll(self, x, y, dx, dy):
         current_time = self.get_time()
+        self.activity.publish('scroll', current_time)
+        self.flush_moves()
         event_id = self.event2id['scroll']
         self.write_row(event_id, dx, dy, current_time)
 
     def start(self):
-        self.listener = Listener(on_move=self.on_move, on_click=self.on_click, on_scroll=self.on_scroll)
+        self.listener = self.listener_class(on_move=self.on_move, on_click=self.on_click, on_scroll=self.on_scroll)
         self.thread = threading.Thread(target=self.listener.start)
         self.thread.start()
     
@@ -125,14 +179,21 @@ class MouseListener:
         if self.thread is not None:
             self.listener.stop()  # Stop the listener
             self.thread.join()  # Wait for listener thread to finish
+            self.flush_moves()
+            self.bin_file.flush()
             print('Mouse listener stopped.')
         else:
             print('Mouse listener not running.')
     
+    def stats(self):
+        stats = self.metrics.snapshot()
+        stats['bytes_written'] = self.bin_file.bytes_written
+        return stats
+
     def fetch_events(self):
         with self.lock:
             events_data = b''.join(self.events)
-            self.events = []
+            self.events.clear()
         return events_data
     
     def execute_event(self, event_id, x, y):
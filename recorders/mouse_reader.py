@@ -0,0 +1,80 @@
+"""
+A MouseLogReader object gives vectorized, memory-mapped access to a binary mouse log written by MouseListener.
+
+The file is mapped with np.memmap using a structured dtype that matches the native struct layout 'bhhd'
+(including its padding: 1 byte after the event id and 2 bytes before the time, 16 bytes per record),
+so opening a multi-GB log is instant and only the pages that are actually touched are read from disk.
+A truncated trailing record (for example when the program was killed while recording) is ignored.
+
+Usage:
+    reader = MouseLogReader('data/<timestamp>/mouse.bin')
+    events = reader.events  # structured array with fields event_id, x, y, time
+    xs, times = events['x'], events['time']
+
+    # only the events between t0 and t1
+    window = reader.time_range(t0, t1)
+
+    # constant memory processing of the whole log
+    for chunk in reader.iter_chunks(chunk_size=1_000_000):
+        ...
+
+Parameters:
+- bin_file: path of the binary mouse log.
+
+Methods:
+- time_range(start_time, end_time): Return the events with start_time <= time < end_time (binary search, assumes the log is time ordered).
+- iter_chunks(chunk_size): Yield consecutive slices of at most chunk_size events.
+- __len__(), __getitem__(index): Number of complete records / direct indexing into the events.
+
+Example:
+    At the bottom of this file is a simple example of how to use this class.
+"""
+
+import struct
+import numpy as np
+from pathlib import Path
+
+
+MOUSE_EVENT_FORMAT = 'bhhd'  # as written by MouseListener.write_row, native byte order and alignment
+MOUSE_EVENT_DTYPE = np.dtype({'names': ['event_id', 'x', 'y', 'time'],
+                              'formats': ['i1', '=i2', '=i2', '=f8'],
+                              'offsets': [0, 2, 4, 8],
+                              'itemsize': struct.calcsize(MOUSE_EVENT_FORMAT)})
+
+
+class MouseLogReader:
+    def __init__(self, bin_file):
+        self.bin_file = Path(bin_file)
+        record_size = MOUSE_EVENT_DTYPE.itemsize
+        num_records = self.bin_file.stat().st_size // record_size  # drop the last incomplete record if there is one
+        if num_records > 0:
+            self.events = np.memmap(self.bin_file, dtype=MOUSE_EVENT_DTYPE, mode='r', shape=(num_records,))
+        else:
+            self.events = np.empty(0, dtype=MOUSE_EVENT_DTYPE)  # np.memmap can't map an empty file
+
+    def __len__(self):
+        return len(self.events)
+
+    def __getitem__(self, index):
+        return self.events[index]
+
+    def time_range(self, start_time, end_time):
+        times = self.events['time']
+        start = np.searchsorted(times, start_time, side='left')
+        end = np.searchsorted(times, end_time, side='left')
+        return self.events[start:end]
+
+    def iter_chunks(self, chunk_size=1_000_000):
+        for start in range(0, len(self.events), chunk_size):
+            yield self.events[start:start + chunk_size]
+
+
+if __name__ == '__main__':
+    import sys
+
+    reader = MouseLogReader(sys.argv[1] if len(sys.argv) > 1 else 'data/mouse_events.bin')
+    print(len(reader), 'events')
+    if len(reader) > 0:
+        t0 = reader[0]['time']
+        print(reader.time_range(t0, t0 + 1.0))  # the first second of the recording
+        print(sum(len(chunk) for chunk in reader.iter_chunks(chunk_size=1000)))
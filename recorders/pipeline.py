@@ -0,0 +1,66 @@
+"""
+Small building blocks for running a recorder as a chain of threads (e.g. capture -> convert -> encode)
+connected by bounded queues, so a slow stage doesn't stall the ones before it.
+
+A BoundedQueue has an explicit policy for what happens when the consumer can't keep up:
+- 'drop_oldest': put() never blocks; the oldest queued item is discarded (and counted in `dropped`)
+    to make room, so the producer keeps its cadence and the consumer always works on the freshest data.
+- 'block': put() waits for free space, so nothing is lost but the producer is slowed down to the consumer's pace.
+
+The producer ends the stream with close(), after which the consumer's get() returns STOP once the queue is drained.
+
+Usage:
+    frames = BoundedQueue(maxsize=8, drop_policy='drop_oldest')
+
+    # producer thread
+    frames.put(frame)
+    frames.close()
+
+    # consumer thread
+    while True:
+        frame = frames.get()
+        if frame is STOP:
+            break
+        ...
+"""
+
+import queue
+
+STOP = object()  # end of stream marker, returned by get() after close()
+DROP_POLICIES = ('drop_oldest', 'block')
+
+
+class BoundedQueue:
+    def __init__(self, maxsize=8, drop_policy='drop_oldest'):
+        if drop_policy not in DROP_POLICIES:
+            raise ValueError(f"Unknown drop policy: {drop_policy} (expected one of {DROP_POLICIES})")
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.drop_policy = drop_policy
+        self.dropped = 0  # number of items discarded because the queue was full
+
+    def put(self, item):
+        """Queue the item; returns True if an older item had to be dropped to make room for it."""
+        if self.drop_policy == 'block':
+            self.queue.put(item)
+            return False
+        dropped = False
+        while True:
+            try:
+                self.queue.put_nowait(item)
+                return dropped
+            except queue.Full:
+                try:
+                    self.queue.get_nowait()
+                    self.dropped += 1
+                    dropped = True
+                except queue.Empty:
+                    pass
+
+    def get(self, timeout=None):
+        return self.queue.get(timeout=timeout)
+
+    def close(self):
+        self.queue.put(STOP)  # always blocking, so the end of stream marker itself is never dropped
+
+    def qsize(self):
+        return self.queue.qsize()
@@ -0,0 +1,212 @@
+"""
+Run recorders in their own processes instead of as threads of one Python process.
+
+With every recorder in the same process, the GIL makes them compete: NumPy slicing, the Python side of the
+capture loops and the ASR bookkeeping all take turns, and e.g. the webcam frame rate collapses when ASR is busy.
+A RecorderProcess constructs the recorder inside a child process (spawned, so no threads are forked)
+and proxies method calls to it over a pipe, so the usual start()/stop()/fetch_*() API keeps working;
+return values (e.g. the frames of fetch_frames()) are pickled back to the caller.
+
+A Supervisor owns a group of RecorderProcesses: it starts them, checks in the background that every process is
+alive and still answering, and shuts them all down cleanly (stop() first, then terminate if a process hangs).
+A failed recorder is reported but not restarted automatically, since a new recorder would overwrite its output file.
+
+Usage:
+    supervisor = Supervisor()
+    screen_recorder = supervisor.add(ScreenRecorder, output_file='data/screens.mp4', fps=4, clock=clock)
+    microphone_recorder = supervisor.add(MircophoneRecorder, 'data/microphone.wav', clock=clock)
+    supervisor.start()
+
+    raw_audio = microphone_recorder.fetch_audio_data()  # runs in the microphone's process
+
+    supervisor.shutdown()
+
+RecorderProcess methods:
+- call(method, *args, **kwargs): Call a method of the recorder in the child process and return its result.
+- start(), stop(), fetch_*(), ...: Any other attribute is a proxy for call().
+- ping(timeout): True if the child process answers within timeout seconds.
+- shutdown(timeout): Stop the recorder and end the process.
+
+Supervisor methods:
+- add(recorder_class, *args, name=None, **kwargs): Create a recorder in a new process and return its RecorderProcess.
+- start(), stop(): Start/stop all recorders.
+- start_monitoring(): Start the background health checks (done by start()).
+- health(): {name: 'ok' | 'unresponsive' | 'dead'} of the last health check.
+- shutdown(timeout): Stop all recorders and end their processes.
+"""
+
+import multiprocessing
+import signal
+import threading
+
+
+class RecorderProcessError(RuntimeError):
+    pass
+
+
+def _serve(connection, recorder_class, args, kwargs):
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # Ctrl+C goes to the whole process group; the supervisor decides when to stop
+    try:
+        recorder = recorder_class(*args, **kwargs)
+    except Exception as e:
+        connection.send((0, False, f'{type(e).__name__}: {e}'))
+        return
+    connection.send((0, True, None))
+
+    while True:
+        try:
+            request_id, method, args, kwargs = connection.recv()
+        except EOFError:
+            break  # the parent process is gone (e.g. killed by stop.sh), stop the recorder so its files are finalized
+        if method == '__shutdown__':
+            break
+        if method == '__ping__':
+            connection.send((request_id, True, None))
+            continue
+        try:
+            connection.send((request_id, True, getattr(recorder, method)(*args, **kwargs)))
+        except Exception as e:
+            connection.send((request_id, False, f'{type(e).__name__}: {e}'))
+
+    try:
+        recorder.stop()
+    except Exception as e:
+        print(f'Error stopping {recorder_class.__name__}: {e}')
+    connection.close()
+
+
+class RecorderProcess:
+    def __init__(self, recorder_class, *args, name=None, **kwargs):
+        self.name = name or recorder_class.__name__
+        context = multiprocessing.get_context('spawn')
+        self.connection, child_connection = context.Pipe()
+        self.process = context.Process(target=_serve, args=(child_connection, recorder_class, args, kwargs), name=self.name, daemon=True)
+        self.process.start()
+        child_connection.close()
+        self.lock = threading.Lock()  # one request at a time on the pipe
+        self.request_id = 0
+        self._receive(0)  # wait until the recorder is constructed
+
+    def _receive(self, request_id, timeout=None):
+        while True:
+            if not self.connection.poll(timeout):
+                raise TimeoutError(f'{self.name} did not answer within {timeout} s')
+            try:
+                answer_id, ok, value = self.connection.recv()
+            except EOFError:
+                raise RecorderProcessError(f'{self.name} process exited (exit code {self.process.exitcode})')
+            if answer_id == request_id:
+                break  # otherwise it's the late answer to a request that timed out
+        if not ok:
+            raise RecorderProcessError(f'{self.name}: {value}')
+        return value
+
+    def call(self, method, *args, timeout=None, **kwargs):
+        with self.lock:
+            self.request_id += 1
+            self.connection.send((self.request_id, method, args, kwargs))
+            return self._receive(self.request_id, timeout)
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return lambda *args, **kwargs: self.call(name, *args, **kwargs)
+
+    def start(self):
+        return self.call('start')
+
+    def stop(self):
+        return self.call('stop')
+
+    def is_alive(self):
+        return self.process.is_alive()
+
+    def ping(self, timeout=1.0):
+        if not self.process.is_alive():
+            return False
+        try:
+            self.call('__ping__', timeout=timeout)
+            return True
+        except (TimeoutError, RecorderProcessError, OSError):
+            return False
+
+    def shutdown(self, timeout=10.0):
+        if self.process.is_alive():
+            try:
+                with self.lock:
+                    self.connection.send((-1, '__shutdown__', (), {}))
+            except OSError:
+                pass
+            self.process.join(timeout)
+        if self.process.is_alive():
+            print(f'{self.name} did not stop within {timeout} s, terminating it.')
+            self.process.terminate()
+            self.process.join()
+        self.connection.close()
+
+
+class Supervisor:
+    def __init__(self, health_interval=2.0, ping_timeout=5.0):
+        self.recorders = {}  # name -> RecorderProcess, in start order
+        self.health_interval = health_interval
+        self.ping_timeout = ping_timeout
+        self.status = {}
+        self.stopping = threading.Event()
+        self.thread = None
+
+    def add(self, recorder_class, *args, name=None, **kwargs):
+        name = name or recorder_class.__name__
+        base_name, i = name, 1
+        while name in self.recorders:
+            name, i = f'{base_name}_{i}', i + 1
+        self.recorders[name] = RecorderProcess(recorder_class, *args, name=name, **kwargs)
+        self.status[name] = 'ok'
+        return self.recorders[name]
+
+    def __getitem__(self, name):
+        return self.recorders[name]
+
+    def start(self):
+        for recorder in self.recorders.values():
+            recorder.start()
+        self.start_monitoring()
+
+    def start_monitoring(self):
+        # Start the health checks (start() does this too; use it directly if the recorders were started one by one)
+        if self.thread is None:
+            self.stopping.clear()
+            self.thread = threading.Thread(target=self._monitor, daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        for name, recorder in reversed(self.recorders.items()):
+            if recorder.is_alive():
+                try:
+                    recorder.stop()
+                except RecorderProcessError as e:
+                    print(f'Error stopping {name}: {e}')
+
+    def _monitor(self):
+        while not self.stopping.wait(self.health_interval):
+            for name, recorder in list(self.recorders.items()):
+                if not recorder.is_alive():
+                    status = 'dead'
+                elif not recorder.ping(timeout=self.ping_timeout):
+                    status = 'unresponsive'
+                else:
+                    status = 'ok'
+                if status != self.status.get(name):
+                    print(f'Recorder {name} is {status}.')
+                self.status[name] = status
+
+    def health(self):
+        return dict(self.status)
+
+    def shutdown(self, timeout=10.0):
+        self.stopping.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        self.stop()
+        for recorder in reversed(list(self.recorders.values())):
+            recorder.shutdown(timeout)
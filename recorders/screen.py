@@ -1,8 +1,11 @@
 """
 A ScreenRecorder Object is a class that can be used to record the screen continuously to a video file.
-The recording if chosen will only include frames where the screen content changes (in a structural similarity more than a certain threshold).
+The recording if chosen will only include frames where the screen content changes (see FrameChangeDetector),
+so the video has a variable frame rate: every captured frame still gets a record in the timestamps index
+(<name>_timestamps.bin, see recorders/timestamp_index.py), whose video_frame is the index of the frame in the video file
+that shows the screen at that time. Unchanged frames repeat the video_frame of the last encoded one.
 
-It uses the opencv-python module to capture the screen and the ffmpeg-python module to encode the video.
+It uses the mss module to capture the screen and cv2.VideoWriter or an ffmpeg subprocess to encode the video.
 
 Usage:
     To record the screen continuously to a video file:
@@ -16,11 +19,75 @@ Usage:
 Parameters:
 - output_file: path of the file where the recorded video will be saved. Default is 'data/video.mp4'.
 - fps: frames per second. Default is 30.
+- clock: the SessionClock shared by all recorders of the session, used for the frame timestamps. Default is None, meaning a new one.
+- encoder: 'opencv' (cv2.VideoWriter with mp4v, default), 'ffmpeg' (H.264 through an ffmpeg subprocess) or 'tiles'.
+- encoder_options: keyword arguments for the encoder backend, e.g. {'preset': 'veryfast', 'crf': 23}. See recorders/encoders.py.
+    encoder='tiles' writes a lossless tile-delta recording instead of a video (see recorders/tile_codec.py), e.g. to
+    'data/screens.tiles'; use it with change_threshold=None, since the tile encoder detects changes exactly itself.
+- frame_bus: name of a shared memory frame bus to publish the frames on, for consumers in other processes
+    (see recorders/frame_bus.py). Default is None, meaning no bus.
+- frame_bus_slots: number of frames kept on the frame bus. Default is 8.
+- source: where the frames come from: MSSScreenSource (the real screen, default) or SyntheticScreenSource (see recorders/sources.py).
+- queue_size: capacity of the queues between the capture, convert and encode threads. Default is 8.
+- drop_policy: what to do when a later stage can't keep up: 'drop_oldest' (default, keeps the capture cadence)
+    or 'block' (never loses frames, but capture slows down to the encoding speed). See BoundedQueue.
+- change_threshold: grayscale difference a downsampled pixel needs to count as a change (see FrameChangeDetector).
+    Frames without any change are not encoded. Default is 2.0; None encodes every frame.
+- segment_duration, segment_size: start a new output file every segment_duration seconds and/or segment_size bytes,
+    finalizing the previous one, and list it in the session's manifest.jsonl (see recorders/segments.py). Default is None (one file).
+- activity: list of ActivityPublishers to follow, e.g. [mouse_listener.activity, keyboard_listener.activity]
+    (see recorders/activity.py). Default is None: a fixed frame rate. See "Input-triggered capture" below.
+- trigger_on: the activity kinds that trigger an immediate grab. Default is ('click', 'scroll', 'key'); moves only count as activity.
+- min_trigger_interval: minimum seconds between a grab and a triggered one, which bounds the grab rate while typing. Default is 0.05.
+- burst_fps, burst_duration: after a trigger, every stream captures at least at burst_fps for burst_duration seconds.
+    Default burst_fps is None (only the immediate grab), burst_duration 1.0.
+- idle_fps, idle_after: without any activity (moves included) for idle_after seconds, every stream captures at most at idle_fps.
+    Default idle_fps is None (no idle rate), idle_after 5.0.
+- streams: list of ScreenStreams to record from the same grabs, each with its own output file, fps, downscale_factor
+    and capture_radius (plus memory_limit, change_threshold, encoder, encoder_options, frame_bus, frame_bus_slots).
+    Default is None, meaning one stream made of the parameters above. A stream can also be given as a dict of ScreenStream
+    arguments, which is what to use with RecorderProcess (the arguments are pickled to the child process).
+
+Multiple streams (foveated capture):
+    The screen is grabbed once per tick at the highest fps of the streams, and only the part the streams due at that tick
+    need (the union of their regions); every stream crops its own region out of that single grab. A stream whose fps
+    doesn't divide the capture fps takes the nearest tick, so its frame interval varies by up to one tick.
+    E.g. the whole screen at 2 fps, downscaled 4x, plus a 400x200 crop around the cursor at 15 fps at native resolution:
+
+    recorder = ScreenRecorder(streams=[ScreenStream('data/screens.mp4', fps=2, downscale_factor=4),
+                                       ScreenStream('data/mouseview.mp4', fps=15, capture_radius=(200, 100))])
+    screen_frames = recorder.streams[0].fetch_frames()
+    mouseview_frames = recorder.streams[1].fetch_frames()
+
+Input-triggered capture:
+    The screen mostly changes right after a click or a key press. With `activity`, such an input event wakes the capture
+    thread, which grabs all streams at once (no sooner than min_trigger_interval after the previous grab) and
+    restarts its schedule from there; with burst_fps it keeps capturing fast for a moment, and with idle_fps it slows
+    down while the user is away. The change detector still skips the unchanged grabs.
+    trigger_latency in stats() is the time from the input event to the end of the grab that followed it.
+
+    recorder = ScreenRecorder(output_file='data/screens.mp4', fps=4, activity=[mouse_listener.activity, keyboard_listener.activity],
+                              burst_fps=15, burst_duration=1.0, idle_fps=0.5, idle_after=5.0)
+
+The recording runs as threads connected by bounded queues: capture (one persistent mss context, steady cadence)
+-> convert (crop, BGRA to BGR, downscale, change detection) -> encode (video writer and timestamps index, one thread per stream),
+so a slow encode doesn't lower the capture frame rate.
 
 Methods:
 - start(): Start recording the screen.
 - stop(): Stop recording the screen.
-- fetch_frames(): Return all the frames that were captured since the previous call to this method.
+- fetch_frames(return_timestamps=False): Return the frames (of the first stream) that were captured since the previous call to this method,
+    stacked into one (n, height, width, 3) array (a zero-copy view of the in-memory ring buffer when possible, see FrameRingBuffer).
+    At most `memory_limit` frames are kept; with return_timestamps=True a (frames, timestamps) tuple is returned.
+- stats(): Runtime metrics (see recorders/metrics.py): captures (rate and interval), grab, convert and encode latency,
+    frame_latency (capture to written, per stream), queue depths, late_captures (ticks that overran their slot),
+    encoded/skipped frames per stream, dropped_frames and bytes_written; with activity also capture_fps (the current
+    capture rate), triggered_captures and trigger_latency.
+- set_quality(fps=None, downscale_factor=None, stream=None): Change the fps and/or downscale_factor of a stream (default the first)
+    while recording. Every stream logs its settings to <name>_settings.bin, at the start and at every change.
+    A new downscale_factor needs a segmented recording: its frames go to a new segment (see recorders/segments.py).
+- stream_cost(stream=None), missed_frames(): Seconds spent converting and encoding a stream's frames, and the number of
+    late captures and dropped frames, since the start; what an AdaptiveController watches (see recorders/adaptive.py).
 
 Example:
     At the bottom of this file is a simple example of how to use this class.
@@ -31,115 +98,364 @@ import numpy as np
 import threading
 import time
 import cv2
-from skimage.metrics import structural_similarity as ssim
 from pathlib import Path
-import pyautogui
-
-import mss
-import mss.tools
 
-from pynput.mouse import Controller as MouseController
+from .frame_buffer import FrameRingBuffer
+from .change_detector import FrameChangeDetector
+from .pipeline import BoundedQueue, STOP
+from .segments import VideoSegmentWriter, segment_path, timestamps_path, settings_path
+from .timestamp_index import TimestampIndexWriter, SETTINGS_INDEX_FORMAT
+from .session_clock import SessionClock
+from .frame_bus import FrameBusPublisher
+from .metrics import RecorderMetrics
+from .sources import MSSScreenSource
 
 
 
-class ScreenRecorder:
-    def __init__(self, output_file='data/screen.mp4', fps=30, downscale_factor=1,capture_radius=(5000,3000), memory_limit=100):
+class ScreenStream:
+    def __init__(self, output_file, fps=30, downscale_factor=1, capture_radius=None, memory_limit=100, change_threshold=2.0,
+                 encoder=None, encoder_options=None, frame_bus=None, frame_bus_slots=8):
         self.output_file = Path(output_file)
+        self.name = self.output_file.stem
         self.fps = fps
-        self.recording = False
-        self.frames = []  # Queue for storing the screen frames
+        self.downscale_factor = downscale_factor
+        self.capture_radius = capture_radius  # None: the whole screen
         self.memory_limit = memory_limit
-        self.thread = None
-        self.last_frame = None
-        self.downscale_factor = downscale_factor  # Downscale the image to reduce the size of the output video
-        self.capture_radius = capture_radius
-        self.mouse = MouseController()
+        self.frames = FrameRingBuffer(capacity=memory_limit)  # Preallocated ring of the latest frames of this stream
+        self.change_detector = FrameChangeDetector(threshold=change_threshold) if change_threshold is not None else None
+        self.encoder = encoder  # None: the recorder's
+        self.encoder_options = encoder_options
+        self.frame_bus = frame_bus
+        self.frame_bus_slots = frame_bus_slots
+        self.bus = None  # FrameBusPublisher, created from the first frame
+        self.writer = None  # VideoSegmentWriter
+        self.settings = None  # TimestampIndexWriter of the fps and downscale_factor changes, while recording
+        self.encode_queue = None  # convert -> encode
+        self.frame_count = 0  # number of frames this stream took (the frame_number in its timestamps index)
+        self.last_time = None  # when this stream was scheduled to take its last frame
+        self.timestamps_path = timestamps_path(self.output_file)  # of the first segment if the recording is segmented
+
+    def region(self, screen_width, screen_height, mouse_x, mouse_y):
+        # The screen part of this stream: everything, or the capture_radius around the mouse (kept inside the screen)
+        if self.capture_radius is None:
+            return 0, 0, screen_width, screen_height
+        capture_radius_x, capture_radius_y = self.capture_radius
+        center_x = min(screen_width-capture_radius_x, max(capture_radius_x, mouse_x))
+        center_y = min(screen_height-capture_radius_y, max(capture_radius_y, mouse_y))
+        left = max(0, center_x - capture_radius_x)
+        top = max(0, center_y - capture_radius_y)
+        right = min(screen_width, center_x + capture_radius_x)
+        bottom = min(screen_height, center_y + capture_radius_y)
+        return left, top, right, bottom
+
+    def frame_size(self, screen_width, screen_height):
+        left, top, right, bottom = self.region(screen_width, screen_height, 0, 0)
+        return (right - left)//self.downscale_factor, (bottom - top)//self.downscale_factor
 
-        # Timestamps of the frames
-        csv_path = Path(self.output_file).with_suffix('.csv')
-        self.csv_path = csv_path.parent / f'{csv_path.stem}_timestamps.csv'
-        self.csv_path.write_text('frame_number,timestamp\n')
+    def fetch_frames(self, return_timestamps=False):
+        frames, timestamps = self.frames.fetch()
+        if return_timestamps:
+            return frames, timestamps
+        return frames
+
+
+class ScreenRecorder:
+    def __init__(self, output_file='data/screen.mp4', fps=30, downscale_factor=1,capture_radius=(5000,3000), memory_limit=100, change_threshold=2.0,
+                 queue_size=8, drop_policy='drop_oldest', encoder='opencv', encoder_options=None, clock=None,
+                 frame_bus=None, frame_bus_slots=8, source=None, streams=None, segment_duration=None, segment_size=None,
+                 activity=None, trigger_on=('click', 'scroll', 'key'), min_trigger_interval=0.05, burst_fps=None, burst_duration=1.0, idle_fps=None, idle_after=5.0):
+        if streams is None:
+            streams = [ScreenStream(output_file, fps, downscale_factor, capture_radius, memory_limit, change_threshold,
+                                    frame_bus=frame_bus, frame_bus_slots=frame_bus_slots)]
+        self.streams = [ScreenStream(**stream) if isinstance(stream, dict) else stream for stream in streams]
+        streams = self.streams
+        self.fps = max(stream.fps for stream in streams)  # the capture cadence
+        self.recording = False
+        self.threads = []
+        self.source = source if source is not None else MSSScreenSource()  # the screen, or a synthetic one (see recorders/sources.py)
+        self.queue_size = queue_size
+        self.drop_policy = drop_policy
+        self.encoder = encoder
+        self.encoder_options = encoder_options or {}
+        self.clock = clock if clock is not None else SessionClock()
+        self.segment_duration = segment_duration
+        self.segment_size = segment_size
+        self.segmented = segment_duration is not None or segment_size is not None
+        self.settings_lock = threading.Lock()  # the capture thread reads a consistent fps, downscale_factor and frame_count
+        self.capture_queue = None  # capture -> convert
+        self.metrics = RecorderMetrics('screen')
+        self.activity = list(activity) if activity is not None else []  # ActivityPublishers, see recorders/activity.py
+        self.trigger_on = set(trigger_on)
+        self.min_trigger_interval = min_trigger_interval
+        self.burst_fps = burst_fps
+        self.burst_duration = burst_duration
+        self.idle_fps = idle_fps
+        self.idle_after = idle_after
+        self.trigger_time = None  # perf_counter() of the first trigger since the last grab
+        self.trigger_lock = threading.Lock()
+        self.last_activity = self.burst_until = 0.0
+        self.wake = threading.Event()  # set by a trigger (or stop()) to end the capture thread's sleep early
+        if self.segmented:
+            for stream in streams:
+                stream.timestamps_path = timestamps_path(segment_path(stream.output_file, 0))
+
+        # The first stream is also reachable through the recorder, like with a single stream
+        self.output_file = streams[0].output_file
+        self.frames = streams[0].frames
+        self.timestamps_path = streams[0].timestamps_path
 
     def start(self):
         if self.recording:
             return
         self.recording = True
-        self.thread = threading.Thread(target=self._record)
-        self.thread.start()
+        screen_width, screen_height = self.source.size()
+        for stream in self.streams:
+            encoder = stream.encoder if stream.encoder is not None else self.encoder
+            encoder_options = stream.encoder_options if stream.encoder_options is not None else self.encoder_options
+            stream.writer = VideoSegmentWriter(stream.output_file, stream.fps, stream.frame_size(screen_width, screen_height),
+                                               encoder, encoder_options, self.segment_duration, self.segment_size)
+            stream.encode_queue = BoundedQueue(maxsize=self.queue_size, drop_policy=self.drop_policy)
+            stream.frame_count = 0
+            stream.last_time = None
+            stream.settings = TimestampIndexWriter(settings_path(stream.output_file), record_format=SETTINGS_INDEX_FORMAT)
+            stream.settings.write(0, self.clock.time(), stream.fps, stream.downscale_factor)
+            stream.settings.flush()
+
+        self.capture_queue = BoundedQueue(maxsize=self.queue_size, drop_policy=self.drop_policy)
+        self.metrics = RecorderMetrics('screen')
+        self.metrics.count('late_captures', 0)
+        self.trigger_time = None
+        self.last_activity = time.time()
+        self.burst_until = 0.0
+        for publisher in self.activity:
+            publisher.subscribe(self._on_activity)
+        self.threads = [threading.Thread(target=self._capture, args=(screen_width, screen_height)),
+                        threading.Thread(target=self._convert)]
+        self.threads += [threading.Thread(target=self._encode, args=(stream,)) for stream in self.streams]
+        for thread in self.threads:
+            thread.start()
 
     def stop(self):
         if not self.recording:
             return
         self.recording = False
-        self.thread.join()
-        self.out.release()
-        self.thread = None
-
-    def fetch_frames(self):
-        # Get the current list of frames and clear the list
-        frames = self.frames
-        self.frames = []
-        return frames
-    
-    def _record(self):
-        # TODO: OpenCV with(!) FFMPEG installation to be able to use 'H264' codec isntead of 'MP4V'
-        capture_radius_x, capture_radius_y = self.capture_radius
-        screen_width, screen_height = pyautogui.size()
-        capture_width, capture_height = min(screen_width, capture_radius_x*2), min(screen_height, capture_radius_y*2)
-        self.out = cv2.VideoWriter(str(self.output_file), cv2.VideoWriter_fourcc(*'mp4v'), self.fps, (capture_width//self.downscale_factor, capture_height//self.downscale_factor))
-        frame_duration = 1 / self.fps
-        start_time = time.time()
-        frame_count = 0
+        for publisher in self.activity:
+            publisher.unsubscribe(self._on_activity)
+        self.wake.set()
+        for thread in self.threads:  # in pipeline order, each stage drains its input queue before exiting
+            thread.join()
+        for stream in self.streams:
+            stream.writer.close()
+            with self.settings_lock:
+                stream.settings.close()
+                stream.settings = None
+            if stream.bus is not None:
+                stream.bus.close()
+                stream.bus = None
+        self.threads = []
 
-        while self.recording:
-            #img = pyautogui.screenshot()
-            # Get the mouse's current position
-            mouse_x, mouse_y = self.mouse.position
-
-            # Calculate the region to capture
-            center_x = min(screen_width-capture_radius_x, max(capture_radius_x, mouse_x))
-            center_y = min(screen_height-capture_radius_y, max(capture_radius_y, mouse_y))
-            left = max(0, center_x - capture_radius_x)
-            top = max(0, center_y - capture_radius_y)
-            right = min(screen_width, center_x + capture_radius_x)
-            bottom = min(screen_height, center_y + capture_radius_y)
-            width = right - left
-            height = bottom - top
-
-            with mss.mss() as sct:
-                # The screen part to capture
-                region = {'top': top, 'left': left, 'width': width, 'height': height}
-                # Grab the data
-                img = sct.grab(region)
-            
-            # Add timestamp to the csv file
-            with self.csv_path.open('a') as f:
-                f.write(f"{frame_count},{time.time()}\n")
-
-
-            frame = np.array(img)[:,:,:3]
-            frame = cv2.resize(frame, (width//self.downscale_factor, height//self.downscale_factor))  # Downscale the image to reduce the size of the video
-            if self.last_frame is not None:
-                #score, diff = ssim(self.last_frame, frame, full=True, multichannel=True, channel_axis=2)
-                if True:#score < 0.50:  # 0.99 was by default  # Threshold for similarity
-                    self.out.write(frame)
-                    self.frames.append(frame)
-                    self.frames = self.frames[-self.memory_limit:]  # Remove old frames to limit memory usage
+    @property
+    def dropped_frames(self):
+        # Frames lost because a later stage couldn't keep up (always 0 with drop_policy='block')
+        queues = [self.capture_queue] + [stream.encode_queue for stream in self.streams]
+        return sum(q.dropped for q in queues if q is not None)
+
+    def stats(self):
+        stats = self.metrics.snapshot()
+        stats['dropped_frames'] = self.dropped_frames
+        stats['bytes_written'] = sum(stream.writer.bytes_written for stream in self.streams if stream.writer is not None)
+        return stats
+
+    def set_quality(self, fps=None, downscale_factor=None, stream=None):
+        stream = stream if stream is not None else self.streams[0]
+        with self.settings_lock:
+            if downscale_factor is not None and downscale_factor != stream.downscale_factor and self.recording and not self.segmented:
+                raise ValueError(f"Changing the downscale_factor of {stream.name} while recording needs segment_duration or segment_size")
+            if fps is not None:
+                stream.fps = fps
+                self.fps = max(s.fps for s in self.streams)
+                if stream.writer is not None:
+                    stream.writer.fps = fps  # the nominal frame rate of the next segments
+            if downscale_factor is not None:
+                stream.downscale_factor = downscale_factor  # applies from the next capture on
+            if stream.settings is not None:
+                stream.settings.write(stream.frame_count, self.clock.time(), stream.fps, stream.downscale_factor)
+                stream.settings.flush()
+
+    def stream_cost(self, stream=None):
+        stream = stream if stream is not None else self.streams[0]
+        histograms = self.metrics.histograms
+        keys = (f'convert_latency.{stream.name}', f'encode_latency.{stream.name}')
+        return sum(histograms[key].total for key in keys if key in histograms)
+
+    def missed_frames(self):
+        return self.metrics.counters.get('late_captures', 0) + self.dropped_frames
+
+    def fetch_frames(self, return_timestamps=False):
+        # Get the frames of the first stream captured since the previous call (see ScreenStream.fetch_frames for the others)
+        return self.streams[0].fetch_frames(return_timestamps)
+
+    def _on_activity(self, kind, timestamp, perf_time):
+        # Called in the input listeners' threads: only note the activity and wake the capture thread
+        now = time.time()
+        self.last_activity = now
+        if kind not in self.trigger_on:
+            return
+        if self.burst_fps is not None:
+            self.burst_until = now + self.burst_duration
+        with self.trigger_lock:
+            if self.trigger_time is None:
+                self.trigger_time = perf_time
+        self.wake.set()
+
+    def _take_trigger(self):
+        with self.trigger_lock:
+            trigger_time, self.trigger_time = self.trigger_time, None
+        return trigger_time
+
+    def _stream_fps(self, stream, now):
+        # The rate of a stream at the moment: its fps, raised during a burst, lowered while the user is idle
+        if self.burst_fps is not None and now < self.burst_until:
+            return max(stream.fps, self.burst_fps)
+        if self.idle_fps is not None and now - self.last_activity > self.idle_after:
+            return min(stream.fps, self.idle_fps)
+        return stream.fps
+
+    def _due_streams(self, now, fps, everyone=False):
+        # The streams that take a frame at this tick, each at its own rate (all of them for a triggered grab)
+        due = []
+        for stream in self.streams:
+            period = 1 / self._stream_fps(stream, now)
+            if everyone or stream.last_time is None or now >= stream.last_time + period - 0.5 / fps:
+                due.append(stream)
+                if everyone or stream.last_time is None or now - stream.last_time > 2 * period:
+                    stream.last_time = now  # too far behind (or the first frame): don't catch up in a burst
                 else:
-                    out.write(self.last_frame)
-                    #self.frames.append(self.last_frame)
-            else:
-                self.out.write(frame)
-                self.frames.append(frame)
-            self.last_frame = frame
-
-            frame_count += 1
-            next_frame_time = start_time + frame_count * frame_duration
-            sleep_time = next_frame_time - time.time()
-            if sleep_time > 0:
-                time.sleep(sleep_time)  # Sleep to limit the frame rate up to fps
-
-        self.out.release()
+                    stream.last_time += period
+        return due
+
+    def _wait(self, until, earliest):
+        # Sleep until the next tick, or until a trigger asks for a grab, but not before `earliest`
+        while self.recording:
+            self.wake.clear()
+            now = time.time()
+            if self.trigger_time is not None:
+                until = min(until, max(now, earliest))
+            if now >= until:
+                return
+            self.wake.wait(until - now)
+
+    def _capture(self, screen_width, screen_height):
+        # Stage 1: one grab per tick at the highest fps of the streams, of the screen part the due streams need together.
+        # Every tick is scheduled one period of the current fps after the previous one, so fps changes apply right away,
+        # and a triggered grab (see _on_activity) restarts the schedule.
+        next_frame_time = time.time()
+        metrics = self.metrics
+
+        try:
+            with self.source.grabber() as sct:
+                while self.recording:
+                    now = time.time()
+                    trigger_time = self._take_trigger()
+                    fps = max(self._stream_fps(stream, now) for stream in self.streams)
+                    with self.settings_lock:
+                        due = self._due_streams(now, fps, everyone=trigger_time is not None)
+                        taken = [(stream.frame_count, stream.downscale_factor) for stream in due]
+                        for stream in due:
+                            stream.frame_count += 1
+                    if not due:
+                        # The streams were rescheduled after a late grab (or slowed down): nothing to grab at this tick
+                        next_frame_time += 1 / fps
+                        self._wait(next_frame_time, now)
+                        continue
+                    # Get the mouse's current position
+                    mouse_x, mouse_y = self.source.cursor_position()
+
+                    # The union of the regions of the due streams
+                    regions = [stream.region(screen_width, screen_height, mouse_x, mouse_y) for stream in due]
+                    left, top = min(r[0] for r in regions), min(r[1] for r in regions)
+                    right, bottom = max(r[2] for r in regions), max(r[3] for r in regions)
+
+                    # The screen part to capture
+                    region = {'top': top, 'left': left, 'width': right - left, 'height': bottom - top}
+                    grab_start = time.perf_counter()
+                    img = sct.grab(region)
+                    metrics.observe('grab_latency', time.perf_counter() - grab_start)
+                    timestamp = self.clock.time()
+                    metrics.tick('captures')
+                    if self.activity:
+                        metrics.gauge('capture_fps', fps)
+                    if trigger_time is not None:
+                        metrics.observe('trigger_latency', time.perf_counter() - trigger_time)
+                        metrics.count('triggered_captures')
+                        next_frame_time = now
+                    metrics.observe('capture_queue_depth', self.capture_queue.qsize())
+                    self.capture_queue.put((timestamp, img, (left, top), [(stream, stream_region, frame_number, downscale_factor)
+                                                                          for stream, stream_region, (frame_number, downscale_factor) in zip(due, regions, taken)]))
+
+                    next_frame_time += 1 / fps
+                    sleep_time = next_frame_time - time.time()
+                    if sleep_time <= 0:
+                        metrics.count('late_captures')
+                        if sleep_time < -1 / fps:
+                            next_frame_time = time.time()  # more than a tick behind: don't catch up in a burst
+                    self._wait(next_frame_time, now + self.min_trigger_interval)  # Sleep to limit the frame rate up to fps
+        finally:
+            self.capture_queue.close()  # also if the capture stage dies: the convert and encode stages must still finish
+
+    def _convert(self):
+        # Stage 2: BGRA screenshot -> each due stream's crop as a downscaled BGR frame, and whether it needs to be encoded
+        while True:
+            item = self.capture_queue.get()
+            if item is STOP:
+                break
+            timestamp, img, (left, top), due = item
+            convert_start = time.perf_counter()
+            screenshot = np.frombuffer(img.raw, dtype=np.uint8).reshape(img.height, img.width, 4)
+            for stream, (x0, y0, x1, y1), frame_number, downscale_factor in due:
+                stream_start = time.perf_counter()
+                frame = cv2.cvtColor(screenshot[y0 - top:y1 - top, x0 - left:x1 - left], cv2.COLOR_BGRA2BGR)
+                if downscale_factor != 1:
+                    frame = cv2.resize(frame, ((x1 - x0)//downscale_factor, (y1 - y0)//downscale_factor))  # Downscale the image to reduce the size of the video
+
+                # Only encode the frame if the screen content changed since the last encoded frame
+                changed = stream.change_detector is None or stream.change_detector.update(frame)
+                if changed:
+                    stream.frames.push(frame, timestamp)  # Old frames are overwritten in place to limit memory usage
+                    self._publish(stream, frame, timestamp)
+                if stream.encode_queue.put((frame_number, timestamp, frame if changed else None)) and stream.change_detector is not None:
+                    stream.change_detector.reset()  # a queued frame was dropped, so don't trust the reference frame anymore
+                self.metrics.observe(f'convert_latency.{stream.name}', time.perf_counter() - stream_start)
+            self.metrics.observe('convert_latency', time.perf_counter() - convert_start)
+        for stream in self.streams:
+            stream.encode_queue.close()
+
+    def _publish(self, stream, frame, timestamp):
+        # Make the frame available to other processes on the shared memory frame bus
+        if stream.frame_bus is None:
+            return
+        if stream.bus is None:
+            stream.bus = FrameBusPublisher(stream.frame_bus, frame.shape, frame.dtype, slots=stream.frame_bus_slots)
+        if frame.shape != stream.bus.shape:
+            frame = cv2.resize(frame, (stream.bus.shape[1], stream.bus.shape[0]), interpolation=cv2.INTER_AREA)  # the downscale_factor changed, the bus keeps its shape
+        stream.bus.publish(frame, timestamp)
+
+    def _encode(self, stream):
+        # Stage 3 (one thread per stream): write the changed frames to the video and every frame's timestamp to the index
+        # (also for skipped frames, pointing at the last encoded frame), in segments if the recording is segmented
+        metrics, name = self.metrics, stream.output_file.stem
+        while True:
+            metrics.observe(f'encode_queue_depth.{name}', stream.encode_queue.qsize())
+            item = stream.encode_queue.get()
+            if item is STOP:
+                break
+            frame_count, timestamp, frame = item
+            encode_start = time.perf_counter()
+            stream.writer.write(frame_count, timestamp, frame)
+            metrics.observe(f'encode_latency.{name}', time.perf_counter() - encode_start)
+            metrics.observe(f'frame_latency.{name}', self.clock.time() - timestamp)
+            metrics.count(f'encoded_frames.{name}' if frame is not None else f'skipped_frames.{name}')
+        stream.writer.close()
     
     def __del__(self):
         self.stop()
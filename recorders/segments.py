@@ -0,0 +1,215 @@
+"""
+Segmented output for the video and audio recorders, and the session manifest listing the segments.
+
+An mp4 is unreadable until the writer is released, and a WAV header only gets its sizes when the file is closed,
+so a recorder that is killed loses (or corrupts) everything since it started. With segment_duration (seconds)
+and/or segment_size (bytes) set, a recorder instead writes a series of files, <name>_00000.mp4, <name>_00001.mp4, ...,
+each with its own timestamps index (<name>_00000_timestamps.bin, ...), and finalizes every segment as soon as
+the next one starts. A crash then only affects the segment that was being written.
+
+Every finalized segment is appended as one JSON line to manifest.jsonl in the output directory:
+    {"stream": "screens", "segment": 3, "file": "screens_00003.mp4", "timestamps": "screens_00003_timestamps.bin",
+     "start_time": ..., "end_time": ..., "frames": 600, "bytes": 1234567}
+(audio segments have "samples" instead of "frames"). The manifest only lists closed segments, so a process
+that reads it can safely open and process those files in parallel while the recording continues.
+Lines are appended with a single write() in append mode, so recorders in different processes can share the manifest.
+Without segmentation the output file keeps its plain name and is listed in the manifest when the recorder stops.
+
+Usage:
+    recorder = ScreenRecorder(output_file='data/screens.mp4', segment_duration=600)  # 10 minute segments
+    recorder = MircophoneRecorder('data/microphone.wav', segment_duration=600)
+
+    for segment in read_manifest('data/<timestamp>', stream='screens'):
+        process(segment['file'])
+
+VideoSegmentWriter and AudioSegmentWriter do the work for the recorders:
+- write(...): Write one frame (or audio chunk) and its timestamp record, rotating to a new segment first when needed
+    (for video also when the frame size changes).
+- close(): Finalize the current segment.
+- bytes_written: Size of all segments so far, including the one being written.
+"""
+
+import json
+import os
+import wave
+from pathlib import Path
+
+from .encoders import create_encoder
+from .timestamp_index import TimestampIndexWriter, AUDIO_INDEX_FORMAT
+
+
+MANIFEST_NAME = 'manifest.jsonl'
+
+
+def segment_path(output_file, segment):
+    # Path of a segment, or of the whole recording if segment is None
+    output_file = Path(output_file)
+    if segment is None:
+        return output_file
+    return output_file.with_name(f'{output_file.stem}_{segment:05d}{output_file.suffix}')
+
+
+def timestamps_path(media_file):
+    media_file = Path(media_file)
+    return media_file.with_name(media_file.stem + '_timestamps.bin')
+
+
+def settings_path(output_file):
+    # The frame rate and resolution changes of a video stream, one file for all its segments (see recorders/adaptive.py)
+    output_file = Path(output_file)
+    return output_file.with_name(output_file.stem + '_settings.bin')
+
+
+def append_manifest(directory, entry):
+    line = (json.dumps(entry) + '\n').encode()
+    fd = os.open(Path(directory) / MANIFEST_NAME, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(fd, line)
+    finally:
+        os.close(fd)
+
+
+def read_manifest(directory, stream=None):
+    path = Path(directory) / MANIFEST_NAME
+    if not path.exists():
+        return []
+    segments = []
+    with path.open() as f:
+        for line in f:
+            if not line.endswith('\n'):
+                break  # a line still being written
+            entry = json.loads(line)
+            if stream is None or entry['stream'] == stream:
+                segments.append(entry)
+    return segments
+
+
+class _SegmentWriter:
+    # Rotation and manifest bookkeeping shared by the video and audio writers
+    def __init__(self, output_file, segment_duration=None, segment_size=None):
+        self.output_file = Path(output_file)
+        self.segmented = segment_duration is not None or segment_size is not None
+        self.segment_duration = segment_duration
+        self.segment_size = segment_size
+        self.segment = 0
+        self.path = None  # file of the current segment, None between segments
+        self.start_time = self.end_time = None
+        self.count = 0  # frames or samples in the current segment
+        self.closed_bytes = 0  # size of the finalized segments
+
+    def _due(self, timestamp):
+        if self.path is None:
+            return False
+        if self.segment_duration is not None and timestamp - self.start_time >= self.segment_duration:
+            return True
+        return self.segment_size is not None and self.path.exists() and self.path.stat().st_size >= self.segment_size
+
+    @property
+    def bytes_written(self):
+        path = self.path  # may be finalized by the recording thread meanwhile
+        return self.closed_bytes + (path.stat().st_size if path is not None and path.exists() else 0)
+
+    def _begin(self, timestamp):
+        self.path = segment_path(self.output_file, self.segment if self.segmented else None)
+        self.start_time = self.end_time = timestamp
+        self.count = 0
+
+    def _finish(self, count_name):
+        entry = {'stream': self.output_file.stem, 'segment': self.segment if self.segmented else None,
+                 'file': self.path.name, 'timestamps': timestamps_path(self.path).name,
+                 'start_time': self.start_time, 'end_time': self.end_time, count_name: self.count,
+                 'bytes': self.path.stat().st_size if self.path.exists() else 0}
+        append_manifest(self.output_file.parent, entry)
+        self.closed_bytes += entry['bytes']
+        self.segment += 1
+        self.path = None
+
+
+class VideoSegmentWriter(_SegmentWriter):
+    def __init__(self, output_file, fps, frame_size, encoder='opencv', encoder_options=None, segment_duration=None, segment_size=None):
+        super().__init__(output_file, segment_duration, segment_size)
+        self.fps = fps
+        self.frame_size = frame_size
+        self.encoder = encoder
+        self.encoder_options = encoder_options or {}
+        self.out = None
+        self.timestamps = None
+        self.video_frame_count = 0  # frames encoded in the current segment
+        self.last_frame = None  # the last encoded frame, to start a new segment with if its first frame is a skipped one
+
+    def _begin(self, timestamp):
+        super()._begin(timestamp)
+        self.out = create_encoder(self.path, self.fps, self.frame_size, backend=self.encoder, **self.encoder_options)
+        self.timestamps = TimestampIndexWriter(timestamps_path(self.path))
+        self.video_frame_count = 0
+
+    def write(self, frame_number, timestamp, frame, pts=float('nan')):
+        # frame is None for a capture that didn't change, shown by the last encoded frame
+        if self._due(timestamp):
+            self.close()
+        if frame is not None and (frame.shape[1], frame.shape[0]) != tuple(self.frame_size):
+            # The resolution changed (see recorders/adaptive.py): a video file has one frame size, so start a new segment
+            if not self.segmented:
+                raise ValueError(f"Frame size {frame.shape[1]}x{frame.shape[0]} doesn't match {self.output_file} "
+                                 f"({self.frame_size[0]}x{self.frame_size[1]}); changing it needs a segmented recording")
+            self.close()
+            self.frame_size = (frame.shape[1], frame.shape[0])
+            self.last_frame = None
+        if self.path is None:
+            self._begin(timestamp)
+            if not self.out.isOpened():
+                raise IOError(f"Could not open a video writer for {self.path}")
+        if frame is None and self.video_frame_count == 0 and self.last_frame is not None:
+            frame = self.last_frame  # every segment must be decodable on its own
+        if frame is not None:
+            self.out.write(frame)
+            self.video_frame_count += 1
+            self.last_frame = frame
+        self.timestamps.write(frame_number, timestamp, self.video_frame_count - 1, pts)
+        self.end_time = timestamp
+        self.count += 1
+
+    def close(self):
+        if self.path is None:
+            return
+        self.out.release()
+        self.timestamps.close()
+        self._finish('frames')
+
+
+class AudioSegmentWriter(_SegmentWriter):
+    def __init__(self, output_file, channels, sample_width, sample_rate, segment_duration=None, segment_size=None):
+        super().__init__(output_file, segment_duration, segment_size)
+        self.channels = channels
+        self.sample_width = sample_width
+        self.sample_rate = sample_rate
+        self.wave_file = None
+        self.timestamps = None
+        self.first_sample = 0  # sample index (of the whole recording) where the current segment starts
+
+    def _begin(self, timestamp):
+        super()._begin(timestamp)
+        self.wave_file = wave.open(str(self.path), 'wb')
+        self.wave_file.setnchannels(self.channels)
+        self.wave_file.setsampwidth(self.sample_width)
+        self.wave_file.setframerate(self.sample_rate)
+        self.timestamps = TimestampIndexWriter(timestamps_path(self.path), record_format=AUDIO_INDEX_FORMAT)
+
+    def write(self, data, start_sample, time, arrival_time):
+        if self._due(time):
+            self.close()
+        if self.path is None:
+            self._begin(time)
+            self.first_sample = start_sample
+        self.timestamps.write(start_sample - self.first_sample, time, arrival_time)  # sample offsets within the segment's WAV file
+        self.wave_file.writeframes(data)
+        num_samples = len(data) // (self.sample_width * self.channels)
+        self.end_time = time + num_samples / self.sample_rate
+        self.count += num_samples
+
+    def close(self):
+        if self.path is None:
+            return
+        self.wave_file.close()  # writes the final sizes into the WAV header
+        self.timestamps.close()
+        self._finish('samples')
@@ -0,0 +1,365 @@
+"""
+A Session object opens one recording directory (data/<timestamp>/) and answers time-range queries
+across all of its streams: "what was on screen, what did the user say and type between t0 and t1?".
+
+Every stream is reached through a time index, so a query costs a binary search plus reading the data
+in the window, not a scan from the start of the session:
+- mouse: mouse.bin is memory-mapped (MouseLogReader) and searched by its time column.
+- keyboard: keyboard.bin is memory-mapped (KeyboardLogReader). The keyboard.csv of older sessions is converted
+    to that format once, into <session>/.index/.
+- audio: <name>_timestamps.bin maps sample offsets to time (see MircophoneRecorder); the window is read with wave setpos().
+- video: <name>_timestamps.bin maps capture times to frames in <name>.mp4, and a keyframe index
+    (built once with ffprobe from the packet flags, cached in .index/) lets the decoder start at the closest
+    keyframe before the window instead of at the start of the file. Without ffprobe, OpenCV's own seeking is used.
+    Lossless <name>.tiles recordings (see recorders/tile_codec.py) are decoded with a TileDecoder and its own index.
+- Segmented recordings (<name>_00000.mp4, <name>_00001.mp4, ..., see recorders/segments.py) are queried as one stream:
+    every segment has its own indexes, and a query only reads the segments it overlaps.
+
+All times are seconds since the epoch on the session timeline (the values written by the recorders).
+
+Usage:
+    session = Session('data/20240101-120000')  # or Session.latest()
+    t0, t1 = session.start_time() + 60, session.start_time() + 65
+
+    mouse_events = session.mouse(t0, t1)  # structured array: event_id, x, y, time
+    key_events = session.keyboard(t0, t1)  # dict of arrays: event, key, time
+    samples, first_sample_time = session.audio(t0, t1)  # int16 (n, channels)
+    frames, frame_times = session.frames(t0, t1, name='screens')  # list of BGR frames, one per captured frame
+
+    session.close()
+
+Methods:
+- mouse(start_time, end_time), keyboard(start_time, end_time), audio(start_time, end_time, name='microphone'),
+    frames(start_time, end_time, name='screens', max_frames=None): The data of one stream in [start_time, end_time).
+- frames_at(times, name='screens'): The frame that was shown at each of the given sorted times, decoding only those.
+- audio_format(name='microphone'): (sample_rate, channels) of an audio stream.
+- sample_at(time, name='microphone'): Index of the sample recorded at `time`, counted from the first sample of the stream
+    across its segments, or None without audio. The one place a time is rounded to a sample: every reader that cuts
+    windows with it (the ShardExporter, the SessionDataset) gets the same samples.
+- samples(first_sample, num_samples, name='microphone'): num_samples int16 samples (num_samples, channels) from the
+    given index on, zero where nothing was recorded.
+- build_indexes(): Build the cached indexes in .index/ up front, e.g. before several processes read the session.
+- frame_index(name), audio_index(name), keyframes(name): The underlying indexes.
+- settings(name='screens'): The frame rate and resolution changes of a video stream (SETTINGS_INDEX_DTYPE, see recorders/adaptive.py);
+    segments of a stream whose resolution changed have different frame sizes.
+- video_streams(), audio_streams(), input_streams(): Names of the recorded streams ('mouse', 'keyboard' for the inputs).
+- start_time(): Earliest timestamp of any stream.
+- close(): Release the open video decoders.
+"""
+
+import re
+import shutil
+import subprocess
+import wave
+import cv2
+import numpy as np
+from pathlib import Path
+
+from .keyboard_log import KeyboardLogReader, convert_keyboard_csv, keys_path
+from .mouse_reader import MouseLogReader
+from .tile_codec import TileDecoder
+from .timestamp_index import load_timestamp_index, FRAME_INDEX_DTYPE, AUDIO_INDEX_DTYPE, SETTINGS_INDEX_DTYPE
+
+
+VIDEO_SUFFIXES = ('.mp4', '.tiles')
+SEGMENT_STEM = re.compile(r'(.+)_\d{5}$')  # <name>_00000, see segment_path() in recorders/segments.py
+
+
+class Session:
+    def __init__(self, path):
+        self.path = Path(path)
+        self.index_dir = self.path / '.index'  # indexes derived from the recorded files
+        self.indexes = {}  # loaded indexes, by stream
+        self.decoders = {}  # name -> [cv2.VideoCapture, position of the next frame it will decode], or a TileDecoder
+
+    @classmethod
+    def latest(cls, data_dir='data'):
+        return cls(sorted(Path(data_dir).iterdir())[-1])
+
+    def _index(self, key, build):
+        if key not in self.indexes:
+            self.indexes[key] = build()
+        return self.indexes[key]
+
+    def _is_fresh(self, cache_file, source_file):
+        return cache_file.exists() and cache_file.stat().st_mtime >= source_file.stat().st_mtime
+
+    def _parts(self, name, suffixes):
+        # File stems of a stream: its segments in order if it was recorded in segments, otherwise just the name
+        parts = {path.stem for suffix in suffixes for path in self.path.glob(f'{name}_[0-9][0-9][0-9][0-9][0-9]{suffix}')}
+        return sorted(parts) or [name]
+
+    def start_time(self):
+        starts = []
+        for name in self.video_streams():
+            index = self.frame_index(self._parts(name, VIDEO_SUFFIXES)[0])
+            if len(index):
+                starts.append(index['time'][0])
+        if (self.path / 'mouse.bin').exists() and len(self._mouse()):
+            starts.append(self._mouse()[0]['time'])
+        if self._keyboard_file() is not None and len(self._keyboard()):
+            starts.append(self._keyboard()[0]['time'])
+        return min(starts) if starts else None
+
+    # Mouse
+    def _mouse(self):
+        return self._index('mouse', lambda: MouseLogReader(self.path / 'mouse.bin'))
+
+    def mouse(self, start_time, end_time):
+        return self._mouse().time_range(start_time, end_time)
+
+    # Keyboard
+    def _keyboard_file(self):
+        bin_file = self.path / 'keyboard.bin'
+        if bin_file.exists():
+            return bin_file
+        csv_file = self.path / 'keyboard.csv'
+        if csv_file.exists():
+            cache_file = self.index_dir / 'keyboard.bin'
+            if not (self._is_fresh(cache_file, csv_file) and keys_path(cache_file).exists()):
+                self.index_dir.mkdir(exist_ok=True)
+                convert_keyboard_csv(csv_file, cache_file)
+            return cache_file
+        return None
+
+    def _keyboard(self):
+        return self._index('keyboard', lambda: KeyboardLogReader(self._keyboard_file()))
+
+    def keyboard(self, start_time, end_time):
+        reader = self._keyboard()
+        events = reader.time_range(start_time, end_time)
+        return {'event': events['event'], 'key': reader.key_names(events), 'time': events['time']}
+
+    def input_streams(self):
+        streams = []
+        if (self.path / 'mouse.bin').exists():
+            streams.append('mouse')
+        if self._keyboard_file() is not None:
+            streams.append('keyboard')
+        return streams
+
+    # Audio
+    def audio_streams(self):
+        names = set()
+        for path in self.path.glob('*.wav'):
+            if (self.path / f'{path.stem}_timestamps.bin').exists():
+                match = SEGMENT_STEM.match(path.stem)
+                names.add(match.group(1) if match else path.stem)
+        return sorted(names)
+
+    def audio_index(self, name='microphone'):
+        return self._index(('audio', name), lambda: load_timestamp_index(self.path / f'{name}_timestamps.bin', dtype=AUDIO_INDEX_DTYPE, mmap=True))
+
+    def _sample_at(self, index, time, sample_rate):
+        # Linear interpolation between the two chunk records around `time` (binary search), extrapolated at the nominal rate
+        times = index['time']
+        i = int(np.clip(np.searchsorted(times, time, side='right') - 1, 0, len(times) - 1))
+        if i + 1 < len(times) and times[i + 1] > times[i]:
+            rate = (index['sample_offset'][i + 1] - index['sample_offset'][i]) / (times[i + 1] - times[i])
+        else:
+            rate = sample_rate
+        return int(round(index['sample_offset'][i] + (time - times[i]) * rate))
+
+    def audio_format(self, name='microphone'):
+        with wave.open(str(self.path / f'{self._parts(name, (".wav",))[0]}.wav'), 'rb') as wav:
+            return wav.getframerate(), wav.getnchannels()
+
+    def audio(self, start_time, end_time, name='microphone'):
+        # The segments of a segmented recording are consecutive, so their windows are simply concatenated
+        chunks, first_sample_time, channels = [], None, 1
+        for part in self._parts(name, ('.wav',)):
+            index = self.audio_index(part)
+            with wave.open(str(self.path / f'{part}.wav'), 'rb') as wav:
+                sample_rate, channels, num_samples = wav.getframerate(), wav.getnchannels(), wav.getnframes()
+                if len(index) == 0:
+                    continue
+                start = min(max(0, self._sample_at(index, start_time, sample_rate)), num_samples)
+                end = min(max(start, self._sample_at(index, end_time, sample_rate)), num_samples)
+                if end == start:
+                    continue
+                wav.setpos(start)
+                chunks.append(np.frombuffer(wav.readframes(end - start), dtype=np.int16).reshape(-1, channels))
+            if first_sample_time is None:
+                first_sample_time = self._time_of_sample(index, start, sample_rate)
+        if not chunks:
+            return np.empty((0, channels), dtype=np.int16), None
+        return np.concatenate(chunks) if len(chunks) > 1 else chunks[0], first_sample_time
+
+    def _audio_parts(self, name):
+        # (stem, first sample, number of samples) of every segment of a stream; the segments are consecutive
+        parts, first_sample = [], 0
+        for part in self._parts(name, ('.wav',)):
+            with wave.open(str(self.path / f'{part}.wav'), 'rb') as wav:
+                num_samples = wav.getnframes()
+            parts.append((part, first_sample, num_samples))
+            first_sample += num_samples
+        return parts
+
+    def sample_at(self, time, name='microphone'):
+        sample_rate, _ = self.audio_format(name)
+        sample = None
+        for part, first_sample, _ in self._index(('audio_parts', name), lambda: self._audio_parts(name)):
+            index = self.audio_index(part)
+            # The last segment that started by `time`, or the first one if none did
+            if len(index) and (sample is None or index['time'][0] <= time):
+                sample = first_sample + self._sample_at(index, time, sample_rate)
+        return sample
+
+    def samples(self, first_sample, num_samples, name='microphone'):
+        _, channels = self.audio_format(name)
+        samples = np.zeros((num_samples, channels), dtype=np.int16)
+        for part, part_first, part_samples in self._index(('audio_parts', name), lambda: self._audio_parts(name)):
+            begin, end = max(first_sample, part_first), min(first_sample + num_samples, part_first + part_samples)
+            if begin >= end:
+                continue
+            with wave.open(str(self.path / f'{part}.wav'), 'rb') as wav:
+                wav.setpos(begin - part_first)
+                samples[begin - first_sample:end - first_sample] = np.frombuffer(wav.readframes(end - begin), dtype=np.int16).reshape(-1, channels)
+        return samples
+
+    def _time_of_sample(self, index, sample, sample_rate):
+        offsets, times = index['sample_offset'], index['time']
+        i = int(np.clip(np.searchsorted(offsets, sample, side='right') - 1, 0, len(offsets) - 1))
+        return times[i] + (sample - offsets[i]) / sample_rate
+
+    # Video
+    def video_streams(self):
+        videos = [path for suffix in VIDEO_SUFFIXES for path in self.path.glob(f'*{suffix}')]
+        names = set()
+        for path in videos:
+            if (self.path / f'{path.stem}_timestamps.bin').exists():
+                match = SEGMENT_STEM.match(path.stem)
+                names.add(match.group(1) if match else path.stem)
+        return sorted(names)
+
+    def frame_index(self, name='screens'):
+        return self._index(('frames', name), lambda: load_timestamp_index(self.path / f'{name}_timestamps.bin', dtype=FRAME_INDEX_DTYPE, mmap=True))
+
+    def settings(self, name='screens'):
+        path = self.path / f'{name}_settings.bin'
+        if not path.exists():
+            return np.empty(0, dtype=SETTINGS_INDEX_DTYPE)  # recorded before the settings were logged
+        return load_timestamp_index(path, dtype=SETTINGS_INDEX_DTYPE)
+
+    def keyframes(self, name='screens'):
+        return self._index(('keyframes', name), lambda: self._load_keyframes(name))
+
+    def _load_keyframes(self, name):
+        # Display-order indexes of the keyframes, from the packet flags (demuxing only, no decoding)
+        video_file = self.path / f'{name}.mp4'
+        cache_file = self.index_dir / f'{name}_keyframes.npy'
+        if self._is_fresh(cache_file, video_file):
+            return np.load(cache_file)
+        if shutil.which('ffprobe') is None:
+            return np.empty(0, dtype=np.int64)
+        result = subprocess.run(['ffprobe', '-v', 'error', '-select_streams', 'v:0', '-show_entries', 'packet=pts_time,flags',
+                                 '-of', 'csv=p=0', str(video_file)], capture_output=True, text=True)
+        packets = []
+        for line in result.stdout.splitlines():
+            pts, _, flags = line.partition(',')
+            if pts and pts != 'N/A':
+                packets.append((float(pts), 'K' in flags))
+        packets.sort()
+        keyframes = np.array([i for i, (_, is_key) in enumerate(packets) if is_key], dtype=np.int64)
+        self.index_dir.mkdir(exist_ok=True)
+        np.save(cache_file, keyframes)
+        return keyframes
+
+    def _decode(self, name, video_frames):
+        # Decode the given (sorted, unique) frame indexes; only seeks when the decoder can't just read forward
+        tiles_file = self.path / f'{name}.tiles'
+        if tiles_file.exists():
+            if name not in self.decoders:
+                self.decoders[name] = TileDecoder(tiles_file)  # lossless tile-delta recording, see recorders/tile_codec.py
+            decoder = self.decoders[name]
+            return {frame_index: decoder.frame(frame_index) for frame_index in video_frames if frame_index < len(decoder)}
+        if name not in self.decoders:
+            self.decoders[name] = [cv2.VideoCapture(str(self.path / f'{name}.mp4')), 0]
+        decoder = self.decoders[name]
+        capture = decoder[0]
+        keyframes = self.keyframes(name)
+        decoded = {}
+        for frame_index in video_frames:
+            if len(keyframes):
+                keyframe = keyframes[max(0, np.searchsorted(keyframes, frame_index, side='right') - 1)]
+            else:
+                keyframe = frame_index  # no keyframe index: let OpenCV seek
+            if not (keyframe <= decoder[1] <= frame_index):
+                capture.set(cv2.CAP_PROP_POS_FRAMES, keyframe)
+                decoder[1] = keyframe
+            while decoder[1] < frame_index:
+                capture.grab()  # decode without converting the skipped frames
+                decoder[1] += 1
+            ret, frame = capture.read()
+            decoder[1] += 1
+            if not ret:
+                break
+            decoded[frame_index] = frame
+        return decoded
+
+    def frames(self, start_time, end_time, name='screens', max_frames=None):
+        frames, times = [], []
+        for part in self._parts(name, VIDEO_SUFFIXES):
+            index = self.frame_index(part)
+            if len(index) == 0 or index['time'][0] >= end_time or index['time'][-1] < start_time:
+                continue  # a segment outside the window isn't opened
+            start, end = np.searchsorted(index['time'], [start_time, end_time], side='left')
+            if max_frames is not None:
+                end = min(end, start + max_frames - len(frames))
+            records = np.asarray(index[start:end])
+            decoded = self._decode(part, np.unique(records['video_frame'][records['video_frame'] >= 0]))
+            # One frame per captured frame; skipped (unchanged) frames share the decoded frame they point to
+            frames.extend(decoded.get(video_frame) for video_frame in records['video_frame'])
+            times.append(records['time'])
+            if max_frames is not None and len(frames) >= max_frames:
+                break
+        return frames, np.concatenate(times) if times else np.empty(0)
+
+    def frames_at(self, times, name='screens'):
+        # None for the times before the first frame
+        times = np.asarray(times)
+        frames = [None] * len(times)
+        parts = [part for part in self._parts(name, VIDEO_SUFFIXES) if len(self.frame_index(part))]
+        if not parts:
+            return frames
+        part_of = np.searchsorted([self.frame_index(part)['time'][0] for part in parts], times, side='right') - 1
+        for p, part in enumerate(parts):
+            selected = np.flatnonzero(part_of == p)
+            if len(selected) == 0:
+                continue
+            index = self.frame_index(part)
+            video_frames = index['video_frame'][np.searchsorted(index['time'], times[selected], side='right') - 1]
+            decoded = self._decode(part, np.unique(video_frames[video_frames >= 0]))
+            for i, video_frame in zip(selected, video_frames):
+                frames[i] = decoded.get(video_frame)
+        return frames
+
+    def build_indexes(self):
+        for name in self.video_streams():
+            for part in self._parts(name, ('.mp4',)):
+                if (self.path / f'{part}.mp4').exists():
+                    self.keyframes(part)
+        self._keyboard_file()
+
+    def close(self):
+        for decoder in self.decoders.values():
+            if isinstance(decoder, TileDecoder):
+                decoder.close()
+            else:
+                decoder[0].release()
+        self.decoders = {}
+
+
+if __name__ == '__main__':
+    import sys
+
+    session = Session(sys.argv[1]) if len(sys.argv) > 1 else Session.latest()
+    t0 = session.start_time()
+    print('start time:', t0)
+    if t0 is not None:
+        print('mouse events in the first 10 s:', len(session.mouse(t0, t0 + 10)))
+        print('video streams:', session.video_streams())
+        for name in session.video_streams():
+            frames, times = session.frames(t0 + 5, t0 + 6, name=name)
+            print(name, len(frames), 'frames between 5 and 6 s')
+    session.close()
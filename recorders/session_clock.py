@@ -0,0 +1,122 @@
+"""
+Clocks shared by the recorders of one session, so all streams are stamped on the same timeline.
+
+A SessionClock reads time.monotonic_ns() (which never jumps, unlike time.time() when NTP adjusts the wall clock)
+and anchors it to the wall clock exactly once, when the clock is created. Every recorder gets the same SessionClock,
+so timestamps from different streams are comparable without depending on wall-clock drift between the calls.
+clock.time() still returns seconds since the epoch, so the files keep the same units as before.
+
+A SampleClock timestamps audio from the sample count instead of from the time each chunk happened to be read:
+every chunk read gives a point (sample offset, session time), and a running least-squares line through those points
+estimates the real sample rate of the device (its drift against the session clock) and the start time.
+The constant part of the input latency (the time a sample spends in the device buffer before the read returns)
+is absorbed into the intercept, so it isn't corrected for.
+
+The same line detects lost input: when the device buffer overflows (the reader fell too far behind), the samples
+recorded meanwhile are dropped and every later chunk arrives late by their duration, as far as the sample count can tell.
+A chunk can also arrive late just because its read was, but then the reads catch up on the buffered input: the next
+chunks arrive right away, each one less late. So input counts as lost once the last LATE_CHUNKS chunks all arrived more
+than `tolerance` samples after the line expects them, without catching up by `tolerance` samples in between.
+Until then the late chunks are left out of the fit, so they can't bend the line towards themselves.
+
+Usage:
+    clock = SessionClock()
+    screen_recorder = ScreenRecorder(..., clock=clock)
+    microphone_recorder = MircophoneRecorder(..., clock=clock)
+
+    sample_clock = SampleClock(clock, sample_rate=16000)
+    sample_clock.update(end_sample, clock.now())  # after every chunk read
+    chunk_start_time = sample_clock.time_at(start_sample)  # epoch seconds on the session timeline
+
+SessionClock methods:
+- now(): Seconds since the session clock was created.
+- time(): Seconds since the epoch (wall clock at creation + monotonic time since then).
+- to_session(wall_time), to_wall(session_time): Convert between the two.
+
+SampleClock methods:
+- update(end_sample, session_time): Add a point: `end_sample` samples were available at `session_time`.
+- lost_samples(end_sample, session_time, tolerance): Before update(): number of samples lost before the chunk ending
+    at end_sample, 0 if none. The caller adds them to its sample count (e.g. as silence) so the line stays straight.
+- time_at(sample): Fitted epoch time of the sample (session timeline).
+- sample_rate_estimate(): The measured sample rate in samples per second of session time.
+"""
+
+import time
+from collections import deque
+
+
+class SessionClock:
+    def __init__(self):
+        self.monotonic_anchor_ns = time.monotonic_ns()
+        self.wall_anchor_ns = time.time_ns()
+
+    def now(self):
+        return (time.monotonic_ns() - self.monotonic_anchor_ns) / 1e9
+
+    def time(self):
+        return (self.wall_anchor_ns + time.monotonic_ns() - self.monotonic_anchor_ns) / 1e9
+
+    def to_session(self, wall_time):
+        return wall_time - self.wall_anchor_ns / 1e9
+
+    def to_wall(self, session_time):
+        return self.wall_anchor_ns / 1e9 + session_time
+
+
+class SampleClock:
+    LATE_CHUNKS = 4  # consecutive late chunks that make lost input
+
+    def __init__(self, clock, sample_rate):
+        self.clock = clock
+        self.sample_rate = sample_rate  # nominal rate, used until there are enough points for a fit
+        # Running sums for the least-squares fit session_time = intercept + slope * sample
+        self.n = 0
+        self.sum_x = 0.0
+        self.sum_y = 0.0
+        self.sum_xx = 0.0
+        self.sum_xy = 0.0
+        self.lateness = deque(maxlen=self.LATE_CHUNKS)  # in samples, of the last chunks
+        self.late = False  # the chunk passed to lost_samples() is late: its update() is skipped
+
+    def update(self, end_sample, session_time):
+        if self.late:
+            self.late = False
+            return
+        self.n += 1
+        self.sum_x += end_sample
+        self.sum_y += session_time
+        self.sum_xx += end_sample * end_sample
+        self.sum_xy += end_sample * session_time
+
+    def lost_samples(self, end_sample, session_time, tolerance):
+        if self.n == 0:
+            return 0
+        intercept, slope = self._fit()
+        self.lateness.append((session_time - intercept) / slope - end_sample)
+        self.late = self.lateness[-1] > tolerance
+        if len(self.lateness) < self.LATE_CHUNKS or min(self.lateness) <= tolerance or self.lateness[0] - self.lateness[-1] >= tolerance:
+            return 0
+        self.late = False  # on the line again once the caller added the lost samples
+        lost = int(round(min(self.lateness)))  # the least late chunk was late only because of the lost input
+        self.lateness.clear()
+        return lost
+
+    def _fit(self):
+        mean_x, mean_y = self.sum_x / self.n, self.sum_y / self.n
+        var_x = self.sum_xx / self.n - mean_x * mean_x
+        if self.n < 2 or var_x <= 0:
+            slope = 1 / self.sample_rate
+        else:
+            slope = (self.sum_xy / self.n - mean_x * mean_y) / var_x
+        return mean_y - slope * mean_x, slope
+
+    def time_at(self, sample):
+        if self.n == 0:
+            return self.clock.time()
+        intercept, slope = self._fit()
+        return self.clock.to_wall(intercept + slope * sample)
+
+    def sample_rate_estimate(self):
+        if self.n == 0:
+            return self.sample_rate
+        return 1 / self._fit()[1]
@@ -0,0 +1,292 @@
+"""
+Capture backends that can be injected into the recorders instead of the real hardware.
+
+The default backends talk to the devices (mss/pyautogui/pynput for the screen, cv2.VideoCapture for webcams,
+pyaudio for audio, pynput/pyxhook for the input hooks). The synthetic ones produce deterministic data
+at configurable rates, paced like the real devices, so the recorders can be measured and regression-tested
+on CI boxes and servers without a display, camera or sound card (see benchmarks/recorders.py).
+
+Backends and where they go:
+- ScreenRecorder(source=...): MSSScreenSource (default) or SyntheticScreenSource.
+    A screen source has size(), cursor_position() and grabber(), a context manager whose grab(region)
+    returns an mss-like screenshot (BGRA `raw` buffer, `width`, `height`).
+- WebcamRecorder(capture=...): cv2.VideoCapture (default) or SyntheticCamera (same interface: read, get, set, isOpened, release).
+- MircophoneRecorder(audio=...), SpeakerRecorder(audio=...): pyaudio.PyAudio (default) or SyntheticAudio
+    (same interface: open, get_sample_size, get_device_count, get_device_info_by_index, terminate).
+- MouseListener(controller=..., listener=...), KeyboardListener(hook=...): pynput/pyxhook (default) or
+    a SyntheticInputStorm's mouse_controller(), mouse_listener and keyboard_hook(), which fire the callbacks
+    from a background thread at the configured event rates.
+
+Usage:
+    screen_recorder = ScreenRecorder(output_file='out/screens.mp4', fps=30, source=SyntheticScreenSource(1920, 1080))
+    webcam_recorder = WebcamRecorder(output_file='out/webcam.mp4', capture=SyntheticCamera(640, 480, fps=30))
+    microphone_recorder = MircophoneRecorder('out/microphone.wav', audio=SyntheticAudio())
+
+    storm = SyntheticInputStorm(mouse_rate=1000, key_rate=20)
+    mouse_listener = MouseListener(bin_file='out/mouse.bin', controller=storm.mouse_controller(), listener=storm.mouse_listener)
+    keyboard_listener = KeyboardListener(bin_file='out/keyboard.bin', hook=storm.keyboard_hook())
+"""
+
+import threading
+import time
+from types import SimpleNamespace
+import cv2
+import numpy as np
+
+
+def _pace(start_time, count, rate):
+    # Sleep until the count-th item of a stream that started at start_time is due
+    sleep_time = start_time + count / rate - time.monotonic()
+    if sleep_time > 0:
+        time.sleep(sleep_time)
+
+
+# Screen
+class MSSScreenSource:
+    def __init__(self):
+        import pyautogui  # needs a display, so only imported for the real screen
+        from pynput.mouse import Controller as MouseController
+        self.pyautogui = pyautogui
+        self.mouse = MouseController()
+
+    def size(self):
+        return self.pyautogui.size()
+
+    def cursor_position(self):
+        return self.mouse.position
+
+    def grabber(self):
+        import mss
+        return mss.mss()
+
+
+class SyntheticScreenshot:
+    def __init__(self, frame):
+        self.height, self.width = frame.shape[:2]
+        self.raw = frame.reshape(-1)  # BGRA bytes, like mss.ScreenShot.raw
+
+
+class SyntheticScreenSource:
+    """A desktop-like image where a small block changes every `change_every` grabs (typing, a blinking cursor)."""
+    def __init__(self, width=1920, height=1080, block_size=64, change_every=1, seed=0):
+        self.width, self.height = width, height
+        self.block_size = block_size
+        self.change_every = change_every  # 0 never changes the screen (an idle user)
+        rng = np.random.default_rng(seed)
+        background = np.empty((height, width, 4), dtype=np.uint8)
+        background[:] = np.linspace(40, 220, width, dtype=np.uint8)[None, :, None]
+        background[::20] = 250  # "text lines"
+        background[:, :, :3] += rng.integers(0, 8, (height, width, 3), dtype=np.uint8)
+        background[:, :, 3] = 255
+        self.background = background
+        self.grab_count = 0
+        self.cursor_count = 0
+
+    def size(self):
+        return self.width, self.height
+
+    def cursor_position(self):
+        # Moves along a circle, one step per call
+        self.cursor_count += 1
+        angle = self.cursor_count * 0.05
+        return (int(self.width / 2 + self.width / 4 * np.cos(angle)), int(self.height / 2 + self.height / 4 * np.sin(angle)))
+
+    def grabber(self):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def grab(self, region):
+        n = self.grab_count
+        self.grab_count += 1
+        top, left, width, height = region['top'], region['left'], region['width'], region['height']
+        frame = self.background[top:top + height, left:left + width].copy()
+        if self.change_every and n % self.change_every == 0:
+            b = min(self.block_size, width, height)
+            y, x = (n * 37) % (height - b + 1), (n * 91) % (width - b + 1)
+            frame[y:y + b, x:x + b, :3] = (n * 13) % 256
+        return SyntheticScreenshot(frame)
+
+
+# Webcam
+class SyntheticCamera:
+    """cv2.VideoCapture look-alike: a moving noise pattern, delivered at the camera's frame rate."""
+    def __init__(self, width=640, height=480, fps=30, seed=0):
+        self.properties = {cv2.CAP_PROP_FRAME_WIDTH: width, cv2.CAP_PROP_FRAME_HEIGHT: height, cv2.CAP_PROP_FPS: fps}
+        rng = np.random.default_rng(seed)
+        self.pattern = rng.integers(0, 256, (height, width, 3), dtype=np.uint8)
+        self.opened = True
+        self.frame_count = 0
+        self.start_time = None
+
+    def isOpened(self):
+        return self.opened
+
+    def get(self, prop):
+        if prop == cv2.CAP_PROP_POS_MSEC:
+            return self.frame_count / self.properties[cv2.CAP_PROP_FPS] * 1000
+        return self.properties.get(prop, 0)
+
+    def set(self, prop, value):
+        if prop == cv2.CAP_PROP_FPS:
+            self.properties[prop] = value  # the resolution is fixed, like many real webcams
+        return True
+
+    def read(self):
+        if not self.opened:
+            return False, None
+        if self.start_time is None:
+            self.start_time = time.monotonic()
+        _pace(self.start_time, self.frame_count, self.properties[cv2.CAP_PROP_FPS])
+        frame = np.roll(self.pattern, self.frame_count * 4, axis=1)
+        self.frame_count += 1
+        return True, frame
+
+    def release(self):
+        self.opened = False
+
+
+# Audio
+class SyntheticAudioStream:
+    def __init__(self, audio, channels, rate, frames_per_buffer):
+        self.audio = audio
+        self.channels = channels
+        self.rate = rate
+        self.sample_count = 0
+        self.start_time = None
+        self.rng = np.random.default_rng(audio.seed)
+
+    def start_stream(self):
+        if self.start_time is None:
+            self.start_time = time.monotonic()
+
+    def stop_stream(self):
+        pass
+
+    def close(self):
+        pass
+
+    def read(self, num_frames, exception_on_overflow=True):
+        self.start_stream()
+        _pace(self.start_time, self.sample_count + num_frames, self.rate)  # a real device blocks until the chunk is recorded
+        t = (self.sample_count + np.arange(num_frames)) / self.rate
+        self.sample_count += num_frames
+        # "Speech": a tone for on_seconds, then silence for off_seconds, plus background noise
+        period = self.audio.on_seconds + self.audio.off_seconds
+        speaking = (t % period) < self.audio.on_seconds
+        signal = self.audio.amplitude * np.sin(2 * np.pi * self.audio.frequency * t) * speaking
+        signal = signal + self.rng.normal(0, self.audio.noise, num_frames)
+        samples = (np.clip(signal, -1, 1) * 32767).astype(np.int16)
+        return np.repeat(samples, self.channels).tobytes()
+
+
+class SyntheticAudio:
+    """pyaudio.PyAudio look-alike producing int16 audio in real time."""
+    def __init__(self, frequency=440.0, amplitude=0.3, noise=0.01, on_seconds=1.0, off_seconds=1.0, device_name='pulse', seed=0):
+        self.frequency = frequency
+        self.amplitude = amplitude
+        self.noise = noise
+        self.on_seconds = on_seconds
+        self.off_seconds = off_seconds
+        self.device_name = device_name
+        self.seed = seed
+
+    def get_sample_size(self, format):
+        return 2  # only paInt16 is produced
+
+    def get_device_count(self):
+        return 1
+
+    def get_device_info_by_index(self, index):
+        return {'index': index, 'name': self.device_name}
+
+    def open(self, format=None, channels=1, rate=16000, input=True, frames_per_buffer=1024, input_device_index=None, **kwargs):
+        return SyntheticAudioStream(self, channels, rate, frames_per_buffer)
+
+    def terminate(self):
+        pass
+
+
+# Mouse and keyboard
+class SyntheticButton:
+    def __init__(self, name):
+        self.name = name
+
+SyntheticButton.left = SyntheticButton('left')
+SyntheticButton.right = SyntheticButton('right')
+
+
+class _StormThread:
+    # Calls emit(i) for i = 0, 1, 2, ... at `rate` per second from a background thread, until stop()
+    def __init__(self, rate, emit):
+        self.rate = rate
+        self.emit = emit
+        self.running = threading.Event()
+        self.thread = None
+
+    def start(self):
+        self.running.set()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        start_time = time.monotonic()
+        count = 0
+        while self.running.is_set():
+            due = int((time.monotonic() - start_time) * self.rate)
+            while count < due and self.running.is_set():  # catch up in a burst, like a polling input device
+                self.emit(count)
+                count += 1
+            _pace(start_time, count + 1, self.rate)
+
+    def stop(self):
+        self.running.clear()
+        if self.thread is not None:
+            self.thread.join()
+
+
+class SyntheticInputStorm:
+    """Mouse moves at `mouse_rate` Hz (with a click every `click_every` and a scroll every `scroll_every` events),
+    and key presses/releases at `key_rate` Hz, fired into the recorders' callbacks."""
+    def __init__(self, mouse_rate=1000, key_rate=20, click_every=200, scroll_every=500, width=1920, height=1080):
+        self.mouse_rate = mouse_rate
+        self.key_rate = key_rate
+        self.click_every = click_every
+        self.scroll_every = scroll_every
+        self.width, self.height = width, height
+        self.keys = [chr(c) for c in range(ord('a'), ord('z') + 1)] + ['space', 'Return', 'BackSpace', 'Shift_L']
+        self.generated = {'mouse': 0, 'keyboard': 0}  # callbacks fired so far
+
+    def mouse_controller(self):
+        return SimpleNamespace(position=(self.width // 2, self.height // 2))
+
+    def mouse_listener(self, on_move=None, on_click=None, on_scroll=None):
+        def emit(i):
+            x, y = (i * 7) % self.width, (i * 3) % self.height
+            if on_click is not None and self.click_every and i % self.click_every == 0:
+                button = SyntheticButton.left if (i // self.click_every) % 4 < 2 else SyntheticButton.right
+                on_click(x, y, button, (i // self.click_every) % 2 == 0)
+            elif on_scroll is not None and self.scroll_every and i % self.scroll_every == 1:
+                on_scroll(x, y, 0, 1 if (i // self.scroll_every) % 2 else -1)
+            elif on_move is not None:
+                on_move(x, y)
+            self.generated['mouse'] += 1
+        return _StormThread(self.mouse_rate, emit)
+
+    def keyboard_hook(self):
+        hook = SimpleNamespace(KeyDown=None, KeyUp=None)
+
+        def emit(i):
+            key = self.keys[(i // 2) % len(self.keys)]
+            callback = hook.KeyDown if i % 2 == 0 else hook.KeyUp
+            if callback is not None:
+                callback(SimpleNamespace(Key=key))
+            self.generated['keyboard'] += 1
+
+        storm = _StormThread(self.key_rate, emit)
+        hook.start, hook.cancel = storm.start, storm.stop  # the pyxhook.HookManager methods KeyboardListener uses
+        return hook
@@ -1,29 +1,49 @@
 import atexit
-import pyaudio
+import numpy as np
 import threading
-import wave
+import time
 
 from pathlib import Path
 
+try:
+    import pyaudio
+except ImportError:  # only needed for the real audio devices, see recorders/sources.py for the synthetic ones
+    pyaudio = None
+
+from .audio_buffer import AudioRingBuffer
+from .session_clock import SessionClock, SampleClock
+from .segments import AudioSegmentWriter, segment_path, timestamps_path
+from .metrics import RecorderMetrics
+
 class SpeakerRecorder:
-    def __init__(self, output_file='data/speaker.wav', channels=1, sample_rate=44100, chunk_size=1024, memory_limit=100):
+    def __init__(self, output_file='data/speaker.wav', channels=1, sample_rate=44100, chunk_size=1024, memory_limit=100, clock=None, audio=None,
+                 segment_duration=None, segment_size=None):
         self.CHUNK = chunk_size
-        self.FORMAT = pyaudio.paInt16
+        self.FORMAT = pyaudio.paInt16 if pyaudio is not None else 8  # 8 == paInt16
         self.CHANNELS = channels
         self.RATE = sample_rate
         self.output_file = str(Path(output_file).absolute())
-        self.frames = []
         self.memory_limit = memory_limit
+        self.buffer = AudioRingBuffer(capacity=memory_limit * chunk_size, channels=channels)  # see MircophoneRecorder
+        self.fetch_cursor = self.buffer.cursor()
         self.recording = False
-        self.audio = pyaudio.PyAudio()
+        self.audio = audio if audio is not None else pyaudio.PyAudio()  # or e.g. SyntheticAudio from recorders/sources.py
         self.stream = None
 
         self.device_name = "pulse"
 
-        self.wave_file = wave.open(self.output_file, 'wb')
-        self.wave_file.setnchannels(self.CHANNELS)
-        self.wave_file.setsampwidth(self.audio.get_sample_size(self.FORMAT))
-        self.wave_file.setframerate(self.RATE)
+        # The WAV file(s) and the chunk timestamps, optionally in segments, see recorders/segments.py
+        self.writer = AudioSegmentWriter(self.output_file, self.CHANNELS, self.audio.get_sample_size(self.FORMAT), self.RATE,
+                                         segment_duration, segment_size)
+        self.timestamps_path = timestamps_path(segment_path(self.output_file, 0 if self.writer.segmented else None))  # of the first segment
+
+        # Sample-accurate chunk timestamps on the session timeline, see MircophoneRecorder
+        self.clock = clock if clock is not None else SessionClock()
+        self.sample_clock = SampleClock(self.clock, self.RATE)
+        self.metrics = RecorderMetrics('speaker')  # see stats()
+        self.sample_count = 0
+        self.input_overflows = 0  # see MircophoneRecorder
+        self.lost_samples = 0
         atexit.register(self.stop)
 
     def get_device_index(self, device_name):
@@ -35,6 +55,7 @@ class SpeakerRecorder:
 
     def start(self):
         self.recording = True
+        self.metrics = RecorderMetrics('speaker')
         device_index = self.get_device_index(self.device_name)
 
         self.stream = self.audio.open(format=self.FORMAT,
@@ -53,22 +74,53 @@ class SpeakerRecorder:
         if self.stream is not None:
             self.stream.stop_stream()
             self.stream.close()
-        self.wave_file.close()
+        self.writer.close()
         self.audio.terminate()
         self.thread = None
 
     def record(self):
         while self.recording:
             if self.stream is not None:
-                data = self.stream.read(self.CHUNK)
-                self.frames.append(data)
-                self.wave_file.writeframes(data)
-                self.frames = self.frames[-self.memory_limit:]
+                # No exception on an input overflow: the lost input is detected from the arrival times, see MircophoneRecorder
+                data = self.stream.read(self.CHUNK, exception_on_overflow=False)
+                arrival_time = self.clock.now()
+                self.metrics.tick('chunks', arrival_time)
+                lost = self.sample_clock.lost_samples(self.sample_count + len(data) // (2 * self.CHANNELS), arrival_time, self.CHUNK)
+                if lost > 0:
+                    self.input_overflows += 1
+                    self.lost_samples += lost
+                    self._write(bytes(lost * 2 * self.CHANNELS), arrival_time, measured=False)  # silence in place of the lost input
+                self._write(data, arrival_time)
+
+    def _write(self, data, arrival_time, measured=True):
+        start_sample = self.sample_count
+        self.sample_count += len(data) // (2 * self.CHANNELS)
+        if measured:  # not the silence, which didn't arrive
+            self.sample_clock.update(self.sample_count, arrival_time)
+        write_start = time.perf_counter()
+        self.writer.write(data, start_sample, self.sample_clock.time_at(start_sample), self.clock.to_wall(arrival_time))
+        self.metrics.observe('write_latency', time.perf_counter() - write_start)
+        self.buffer.write(np.frombuffer(data, dtype=np.int16))
+
+    def stats(self):
+        stats = self.metrics.snapshot()
+        stats['samples'] = self.sample_count
+        stats['sample_rate_estimate'] = self.sample_clock.sample_rate_estimate()
+        stats['input_overflows'] = self.input_overflows
+        stats['lost_samples'] = self.lost_samples
+        stats['overruns'] = self.buffer.overruns()
+        stats['bytes_written'] = self.writer.bytes_written
+        return stats
+
+    def time_at(self, sample_index):
+        return self.sample_clock.time_at(sample_index)
+
+    def cursor(self):
+        return self.buffer.cursor()
 
     def fetch_audio_data(self):
-        audio_data = b''.join(self.frames)
-        self.frames = []
-        return audio_data
+        samples, _ = self.fetch_cursor.read()
+        return samples.tobytes()
 
 if __name__ == '__main__':
     speaker_recorder = SpeakerRecorder()
@@ -0,0 +1,227 @@
+"""
+A lossless tile-delta storage format for screen recordings (ScreenRecorder(encoder='tiles')).
+
+Lossless full-frame video of a large desktop is huge, while usually only a few tiles change per frame
+(the cursor, a line of text being typed). A TileEncoder divides every frame into tile_size x tile_size tiles,
+finds the tiles that differ from the previous frame (an exact, vectorized comparison, so there are no hash collisions)
+and stores only those, compressed with zlib (or lz4 when it's installed and chosen). Every `keyframe_interval` frames,
+and whenever most of the tiles changed anyway, a full keyframe is stored instead, so decoding never has to go far back.
+
+Files:
+- <name>.tiles: a header (TILES_HEADER) followed by one record per frame: FRAME_RECORD (type, number of tiles,
+    compressed size), for delta frames the uint32 indexes of the stored tiles, then the compressed pixels
+    (the whole frame for a keyframe, the stored tiles one after the other for a delta frame).
+- <name>_tileindex.bin: a timestamp index file (see recorders/timestamp_index.py) with one TILE_INDEX_FORMAT record
+    per frame: offset and size of the frame record, and the number of the keyframe it depends on. It makes any frame
+    reachable with one seek to its keyframe. Index records pointing past the end of the data (the program was killed
+    before the data was flushed) are ignored.
+
+The frame numbers are the video_frame numbers of ScreenRecorder's <name>_timestamps.bin, so a TileDecoder can also
+return the frame that was on screen at a given time.
+
+Usage:
+    recorder = ScreenRecorder(output_file='data/screens.tiles', encoder='tiles', encoder_options={'tile_size': 64})
+
+    decoder = TileDecoder('data/screens.tiles')
+    frame = decoder.frame(100)  # the 101st stored frame, BGR uint8
+    frame = decoder.frame_at(time)  # what was on screen at that time (seconds since the epoch)
+
+Parameters (TileEncoder):
+- output_file, fps, frame_size: as for the other encoders (see recorders/encoders.py).
+- tile_size: width and height of the tiles in pixels. Default is 64.
+- keyframe_interval: maximum number of frames between two keyframes. Default is 300.
+- compression: 'zlib' (default) or 'lz4' (faster, needs the lz4 package).
+- level: compression level. Default is 1 (fastest).
+"""
+
+import struct
+import zlib
+import numpy as np
+from pathlib import Path
+
+try:
+    import lz4.frame
+except ImportError:  # optional, zlib is always available
+    lz4 = None
+
+from .timestamp_index import TimestampIndexWriter, load_timestamp_index, FRAME_INDEX_DTYPE
+
+
+TILES_MAGIC = b'UIOTILES'
+TILES_VERSION = 1
+TILES_HEADER = struct.Struct('<8sHIIIIdB')  # magic, version, width, height, channels, tile_size, fps, compression
+FRAME_RECORD = struct.Struct('<BII')  # frame type, number of tiles, compressed size
+KEYFRAME, DELTA_FRAME = 0, 1
+COMPRESSIONS = ('zlib', 'lz4')
+
+TILE_INDEX_FORMAT = '<qqq'
+TILE_INDEX_DTYPE = np.dtype([('offset', '<i8'), ('size', '<i8'), ('keyframe', '<i8')])
+
+
+def tile_index_path(path):
+    path = Path(path)
+    return path.with_name(path.stem + '_tileindex.bin')
+
+
+def _compress(data, compression, level):
+    if compression == 'lz4':
+        return lz4.frame.compress(data, compression_level=level)
+    return zlib.compress(data, level)
+
+
+def _decompress(data, compression):
+    if compression == 'lz4':
+        return lz4.frame.decompress(data)
+    return zlib.decompress(data)
+
+
+def _tiles(frame, tile_size):
+    # (rows, columns, tile_size, tile_size, channels) view of a frame whose size is a multiple of tile_size
+    height, width, channels = frame.shape
+    return frame.reshape(height // tile_size, tile_size, width // tile_size, tile_size, channels).swapaxes(1, 2)
+
+
+class TileEncoder:
+    def __init__(self, output_file, fps, frame_size, tile_size=64, keyframe_interval=300, compression='zlib', level=1):
+        if compression not in COMPRESSIONS:
+            raise ValueError(f"Unknown compression: {compression} (expected one of {COMPRESSIONS})")
+        if compression == 'lz4' and lz4 is None:
+            print("Warning: lz4 not installed, using zlib.")
+            compression = 'zlib'
+        self.frame_size = tuple(frame_size)
+        width, height = self.frame_size
+        self.tile_size = tile_size
+        self.keyframe_interval = keyframe_interval
+        self.compression = compression
+        self.level = level
+        self.padded_shape = (-(-height // tile_size) * tile_size, -(-width // tile_size) * tile_size, 3)
+        self.previous = None  # the last frame, padded to whole tiles
+        self.frame_count = 0
+        self.keyframe = 0  # number of the last keyframe
+
+        self.file = open(output_file, 'wb')
+        self.file.write(TILES_HEADER.pack(TILES_MAGIC, TILES_VERSION, width, height, 3, tile_size, fps, COMPRESSIONS.index(compression)))
+        self.offset = TILES_HEADER.size
+        self.index = TimestampIndexWriter(tile_index_path(output_file), record_format=TILE_INDEX_FORMAT)
+
+    def isOpened(self):
+        return not self.file.closed
+
+    def write(self, frame):
+        height, width = frame.shape[:2]
+        if (width, height) != self.frame_size:
+            raise ValueError(f"Frame size {(width, height)} doesn't match the encoder's frame size {self.frame_size}")
+        if frame.shape == self.padded_shape:
+            padded = np.ascontiguousarray(frame)
+        else:
+            padded = np.zeros(self.padded_shape, dtype=np.uint8)
+            padded[:height, :width] = frame
+
+        changed = None
+        if self.previous is not None and self.frame_count - self.keyframe < self.keyframe_interval:
+            changed = np.any(_tiles(padded, self.tile_size) != _tiles(self.previous, self.tile_size), axis=(2, 3, 4))
+            if np.count_nonzero(changed) > changed.size // 2:
+                changed = None  # a keyframe is about as large and makes seeking cheaper
+        if changed is None:
+            record_type, tile_ids, data = KEYFRAME, b'', padded.tobytes()
+            num_tiles = padded.shape[0] * padded.shape[1] // self.tile_size ** 2
+            self.keyframe = self.frame_count
+        else:
+            record_type, tile_ids = DELTA_FRAME, np.flatnonzero(changed).astype('<u4')
+            num_tiles = len(tile_ids)
+            data = np.ascontiguousarray(_tiles(padded, self.tile_size)[changed]).tobytes()
+            tile_ids = tile_ids.tobytes()
+        data = _compress(data, self.compression, self.level)
+
+        record = FRAME_RECORD.pack(record_type, num_tiles, len(data))
+        self.file.write(record)
+        self.file.write(tile_ids)
+        self.file.write(data)
+        size = len(record) + len(tile_ids) + len(data)
+        self.index.write(self.offset, size, self.keyframe)
+        self.offset += size
+        self.previous = padded
+        self.frame_count += 1
+
+    def release(self):
+        if self.file.closed:
+            return
+        self.file.close()
+        self.index.close()
+
+
+class TileDecoder:
+    def __init__(self, path, timestamps_path=None):
+        self.path = Path(path)
+        self.file = open(self.path, 'rb')
+        magic, version, self.width, self.height, self.channels, self.tile_size, self.fps, compression = TILES_HEADER.unpack(self.file.read(TILES_HEADER.size))
+        if magic != TILES_MAGIC:
+            raise ValueError(f"{self.path} is not a tile-delta recording")
+        self.compression = COMPRESSIONS[compression]
+        self.padded_shape = (-(-self.height // self.tile_size) * self.tile_size, -(-self.width // self.tile_size) * self.tile_size, self.channels)
+
+        index = load_timestamp_index(tile_index_path(self.path), dtype=TILE_INDEX_DTYPE)
+        data_size = self.path.stat().st_size
+        self.index = index[index['offset'] + index['size'] <= data_size]
+        timestamps_path = timestamps_path if timestamps_path is not None else self.path.with_name(self.path.stem + '_timestamps.bin')
+        self.timestamps = load_timestamp_index(timestamps_path, dtype=FRAME_INDEX_DTYPE) if Path(timestamps_path).exists() else None
+
+        self.current = None  # the last decoded frame (padded)
+        self.position = -1  # its number
+
+    def __len__(self):
+        return len(self.index)
+
+    def _apply(self, frame_number):
+        offset, size, _ = self.index[frame_number]
+        self.file.seek(offset)
+        record = self.file.read(size)
+        record_type, num_tiles, data_size = FRAME_RECORD.unpack_from(record)
+        data = _decompress(record[size - data_size:], self.compression)
+        if record_type == KEYFRAME:
+            self.current = np.frombuffer(data, dtype=np.uint8).reshape(self.padded_shape).copy()
+        else:
+            tile_ids = np.frombuffer(record, dtype='<u4', count=num_tiles, offset=FRAME_RECORD.size)
+            tiles = np.frombuffer(data, dtype=np.uint8).reshape(num_tiles, self.tile_size, self.tile_size, self.channels)
+            view = _tiles(self.current, self.tile_size)
+            rows, columns = np.divmod(tile_ids, view.shape[1])
+            view[rows, columns] = tiles
+        self.position = frame_number
+
+    def frame(self, frame_number):
+        if not 0 <= frame_number < len(self.index):
+            raise IndexError(f"Frame {frame_number} out of range (0..{len(self.index) - 1})")
+        keyframe = int(self.index['keyframe'][frame_number])
+        if not (keyframe <= self.position <= frame_number):
+            self._apply(keyframe)  # otherwise keep going from the frame decoded last
+        while self.position < frame_number:
+            self._apply(self.position + 1)
+        return self.current[:self.height, :self.width].copy()
+
+    def frame_at(self, time):
+        # The frame shown at `time` (seconds since the epoch), from the recorder's timestamps; None before the first frame
+        if self.timestamps is None:
+            raise ValueError(f"No timestamps found for {self.path}")
+        i = np.searchsorted(self.timestamps['time'], time, side='right') - 1
+        if i < 0 or self.timestamps['video_frame'][i] < 0:
+            return None
+        return self.frame(min(int(self.timestamps['video_frame'][i]), len(self.index) - 1))
+
+    def close(self):
+        self.file.close()
+
+
+if __name__ == '__main__':
+    import sys
+    import time
+
+    # Decode every frame of a recording, e.g. python -m recorders.tile_codec data/<timestamp>/screens.tiles
+    decoder = TileDecoder(sys.argv[1])
+    start = time.perf_counter()
+    for i in range(len(decoder)):
+        decoder.frame(i)
+    elapsed = time.perf_counter() - start
+    keyframes = np.count_nonzero(decoder.index['keyframe'] == np.arange(len(decoder)))
+    print(f"{len(decoder)} frames ({keyframes} keyframes) of {decoder.width}x{decoder.height}, "
+          f"{decoder.path.stat().st_size / max(1, len(decoder)) / 1024:.1f} KiB per frame, decoded at {len(decoder) / max(elapsed, 1e-9):.0f} fps")
+    decoder.close()
@@ -0,0 +1,130 @@
+"""
+A compact, append-only binary timestamp index for the recorders (the `<name>_timestamps.bin` sidecar files).
+
+The file is a 16 byte header followed by fixed-width little-endian records, one per captured frame:
+- frame_number (int64): index of the captured frame (counts every capture tick).
+- time (float64): capture time in seconds since the epoch.
+- video_frame (int64): index of the frame in the video file that shows this capture
+    (equal to frame_number unless unchanged frames were skipped, see ScreenRecorder).
+- pts (float64): presentation timestamp reported by the source in seconds (e.g. the webcam driver), NaN if unknown.
+
+The audio recorders write the same kind of file with one record per chunk read from the device (AUDIO_INDEX_FORMAT):
+- sample_offset (int64): index of the first sample of the chunk in the WAV file.
+- time (float64): time of that sample, from the sample count and the drift fit of a SampleClock (see recorders/session_clock.py).
+- arrival_time (float64): time (session clock, seconds since the epoch) at which the chunk was read, the raw data point of that fit.
+
+The video recorders also keep a settings index per stream, <name>_settings.bin (SETTINGS_INDEX_FORMAT), with one record
+when the recording starts and one for every change of its frame rate or resolution (see recorders/adaptive.py):
+- frame_number (int64): the first captured frame (frame_number in the timestamps) taken with these settings.
+- time (float64): time of the change in seconds since the epoch.
+- fps (float64): the frame rate the stream captures at.
+- downscale_factor (int64): the factor the captured frames are downscaled by.
+
+A TimestampIndexWriter writes records through a buffered file and only flushes every `flush_interval` seconds,
+so the capture loop doesn't pay an open/write/close per frame. A crash loses at most the last `flush_interval`
+seconds of timestamps, and a truncated trailing record is ignored by the loader.
+
+Usage:
+    index = TimestampIndexWriter('data/screens_timestamps.bin')
+    index.write(frame_number, time.time(), video_frame, float('nan'))
+    index.close()
+
+    timestamps = load_timestamp_index('data/screens_timestamps.bin')  # structured NumPy array
+    times = timestamps['time']
+    timestamps = load_timestamp_index('data/screens_timestamps.bin', mmap=True)  # np.memmap, for random access into long sessions
+
+    # one-off conversion of a session recorded with the old csv sidecars
+    convert_timestamps_csv('data/<timestamp>/screens_timestamps.csv')  # writes screens_timestamps.bin next to it
+
+Parameters (TimestampIndexWriter):
+- path: path of the index file (overwritten).
+- record_format: struct format of a record. Default is FRAME_INDEX_FORMAT.
+- flush_interval: maximum time in seconds between flushes to the OS. Default is 1.0.
+- buffer_size: size of the write buffer in bytes. Default is 64 KiB.
+"""
+
+import csv
+import struct
+import time
+import numpy as np
+from pathlib import Path
+
+
+INDEX_MAGIC = b'UIOIDX'
+INDEX_VERSION = 1
+INDEX_HEADER = struct.Struct('<6sHII')  # magic, version, record size, reserved
+
+FRAME_INDEX_FORMAT = '<qdqd'
+FRAME_INDEX_DTYPE = np.dtype([('frame_number', '<i8'), ('time', '<f8'), ('video_frame', '<i8'), ('pts', '<f8')])
+
+AUDIO_INDEX_FORMAT = '<qdd'
+AUDIO_INDEX_DTYPE = np.dtype([('sample_offset', '<i8'), ('time', '<f8'), ('arrival_time', '<f8')])
+
+SETTINGS_INDEX_FORMAT = '<qddq'
+SETTINGS_INDEX_DTYPE = np.dtype([('frame_number', '<i8'), ('time', '<f8'), ('fps', '<f8'), ('downscale_factor', '<i8')])
+
+
+class TimestampIndexWriter:
+    def __init__(self, path, record_format=FRAME_INDEX_FORMAT, flush_interval=1.0, buffer_size=64 * 1024):
+        self.path = Path(path)
+        self.record = struct.Struct(record_format)
+        self.flush_interval = flush_interval
+        self.file = open(self.path, 'wb', buffering=buffer_size)
+        self.file.write(INDEX_HEADER.pack(INDEX_MAGIC, INDEX_VERSION, self.record.size, 0))
+        self.file.flush()
+        self.last_flush = time.monotonic()
+
+    def write(self, *fields):
+        self.file.write(self.record.pack(*fields))
+        now = time.monotonic()
+        if now - self.last_flush >= self.flush_interval:
+            self.file.flush()
+            self.last_flush = now
+
+    def flush(self):
+        self.file.flush()
+        self.last_flush = time.monotonic()
+
+    def close(self):
+        if not self.file.closed:
+            self.file.close()
+
+
+def load_timestamp_index(path, dtype=FRAME_INDEX_DTYPE, mmap=False):
+    path = Path(path)
+    with path.open('rb') as f:
+        header = f.read(INDEX_HEADER.size)
+    if len(header) < INDEX_HEADER.size:
+        return np.empty(0, dtype=dtype)  # the recorder was killed before the header was flushed
+    magic, version, record_size, _ = INDEX_HEADER.unpack(header)
+    if magic != INDEX_MAGIC:
+        raise ValueError(f"{path} is not a timestamp index file")
+    if record_size != dtype.itemsize:
+        raise ValueError(f"{path} has {record_size} byte records, expected {dtype.itemsize} for {dtype}")
+    num_records = (path.stat().st_size - INDEX_HEADER.size) // record_size  # drop the last incomplete record if there is one
+    if mmap and num_records > 0:
+        return np.memmap(path, dtype=dtype, mode='r', offset=INDEX_HEADER.size, shape=(num_records,))
+    return np.fromfile(path, dtype=dtype, count=num_records, offset=INDEX_HEADER.size)
+
+
+def convert_timestamps_csv(csv_path, index_path=None):
+    # frame_number,timestamp[,video_frame] -> binary index (pts unknown)
+    csv_path = Path(csv_path)
+    index_path = Path(index_path) if index_path is not None else csv_path.with_suffix('.bin')
+    index = TimestampIndexWriter(index_path)
+    with csv_path.open(newline='') as f:
+        for row in csv.DictReader(f):
+            frame_number = int(row['frame_number'])
+            video_frame = int(row['video_frame']) if row.get('video_frame') else frame_number
+            index.write(frame_number, float(row['timestamp']), video_frame, float('nan'))
+    index.close()
+    return index_path
+
+
+if __name__ == '__main__':
+    import sys
+
+    # Convert the csv timestamp files given on the command line, e.g. data/*/*_timestamps.csv
+    for csv_file in sys.argv[1:]:
+        index_file = convert_timestamps_csv(csv_file)
+        print(f"{csv_file} -> {index_file} ({len(load_timestamp_index(index_file))} frames)")
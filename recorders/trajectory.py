@@ -0,0 +1,94 @@
+"""
+Online simplification of the mouse trajectory with a bounded error, for MouseListener(max_error=...).
+
+Instead of dropping moves by time (delta_time, which loses fast flicks and keeps every sample of slow drags),
+a TrajectorySimplifier keeps only the moves needed to reconstruct the trajectory by linear interpolation in time,
+such that every dropped sample is within `max_error` pixels of the reconstruction at its own timestamp
+(the synchronized Euclidean distance, SED, so pauses and speed changes are preserved too, not just the path).
+
+It's the opening-window algorithm: the points since the last kept point (the anchor) are buffered; a new point
+is accepted if the segment from the anchor to it passes within max_error of every buffered point at their times.
+Otherwise the previous point is kept and becomes the new anchor. A point is therefore written at most one move
+later than it happened. flush() keeps the pending point immediately; MouseListener calls it before every click
+and scroll (which are always written exactly) and on stop().
+
+Usage:
+    simplifier = TrajectorySimplifier(max_error=2.0)
+    for x, y, t in moves:
+        kept = simplifier.add(x, y, t)
+        if kept is not None:
+            write(kept)  # (x, y, t, n), n is the number of the point in the input
+    kept = simplifier.flush()
+
+    kept_indexes = simplify_trajectory(times, xs, ys, max_error=2.0)  # offline, e.g. on a recorded log
+
+Parameters:
+- max_error: maximum distance in pixels between a dropped sample and the reconstructed trajectory. Default is 2.0.
+- max_window: maximum number of buffered points; when full, a point is kept regardless. Default is 256.
+"""
+
+import numpy as np
+
+
+class TrajectorySimplifier:
+    def __init__(self, max_error=2.0, max_window=256):
+        self.max_error = max_error
+        self.max_window = max_window
+        self.window = np.empty((max_window, 4))  # t, x, y, n of the points since the anchor
+        self.size = 0
+        self.anchor = None  # t, x, y of the last kept point
+        self.count = 0  # number of points added
+
+    def _fits(self, t, x, y):
+        # True if the segment anchor -> (t, x, y) is within max_error of every buffered point, at their times
+        t0, x0, y0 = self.anchor
+        window = self.window[:self.size]
+        dt = t - t0
+        fraction = (window[:, 0] - t0) / dt if dt > 0 else np.ones(self.size)
+        dx = x0 + fraction * (x - x0) - window[:, 1]
+        dy = y0 + fraction * (y - y0) - window[:, 2]
+        return bool(np.all(dx * dx + dy * dy <= self.max_error * self.max_error))
+
+    def _keep(self, row):
+        t, x, y, n = row
+        self.anchor = (t, x, y)
+        return int(x), int(y), float(t), int(n)
+
+    def add(self, x, y, t):
+        n = self.count
+        self.count += 1
+        kept = None
+        if self.anchor is None:
+            kept = self._keep((t, x, y, n))  # the first point starts the trajectory
+        elif self.size and (self.size == self.max_window or not self._fits(t, x, y)):
+            kept = self._keep(self.window[self.size - 1])
+            self.size = 0
+        if kept is None or kept[3] != n:
+            self.window[self.size] = (t, x, y, n)
+            self.size += 1
+        return kept
+
+    def flush(self):
+        if self.size == 0:
+            return None
+        kept = self._keep(self.window[self.size - 1])
+        self.size = 0
+        return kept
+
+    def reset(self):
+        self.size = 0
+        self.anchor = None
+
+
+def simplify_trajectory(times, xs, ys, max_error=2.0, max_window=256):
+    # Indexes of the samples kept by a TrajectorySimplifier
+    simplifier = TrajectorySimplifier(max_error, max_window)
+    kept = []
+    for x, y, t in zip(xs, ys, times):
+        point = simplifier.add(x, y, t)
+        if point is not None:
+            kept.append(point[3])
+    point = simplifier.flush()
+    if point is not None:
+        kept.append(point[3])
+    return np.array(kept, dtype=np.int64)
@@ -1,24 +1,44 @@
 import cv2
 import threading
 import time
-from pathlib import Path
+
+from .frame_buffer import FrameRingBuffer
+from .segments import VideoSegmentWriter, segment_path, timestamps_path, settings_path
+from .timestamp_index import TimestampIndexWriter, SETTINGS_INDEX_FORMAT
+from .session_clock import SessionClock
+from .frame_bus import FrameBusPublisher
+from .metrics import RecorderMetrics
 
 class WebcamRecorder:
-    def __init__(self, output_file='data/webcam.mp4', fps=30, camera_index=0, memory_limit=100):
+    def __init__(self, output_file='data/webcam.mp4', fps=30, camera_index=0, memory_limit=100, encoder='opencv', encoder_options=None, clock=None,
+                 frame_bus=None, frame_bus_slots=8, capture=None, segment_duration=None, segment_size=None, downscale_factor=1):
         self.output_file = output_file
         self.fps = fps
+        self.downscale_factor = downscale_factor  # recorded frames are (width // downscale_factor, height // downscale_factor)
         self.recording = False
-        self.frames = []
         self.memory_limit = memory_limit
+        self.frames = FrameRingBuffer(capacity=memory_limit)  # Preallocated ring of the latest webcam frames
         self.thread = None
         self.camera_index = camera_index
-
-        # Open the webcam
-        self.cap = cv2.VideoCapture(self.camera_index)
-        # Timestamps of the frames
-        csv_path = Path(self.output_file).with_suffix('.csv')
-        self.csv_path = csv_path.parent / f'{csv_path.stem}_timestamps.csv'
-        self.csv_path.write_text('frame_number,timestamp\n')
+        self.encoder = encoder  # 'opencv' or 'ffmpeg', see recorders/encoders.py
+        self.encoder_options = encoder_options or {}
+        self.clock = clock if clock is not None else SessionClock()  # shared session timeline for the frame timestamps
+        self.out = None
+        self.frame_bus = frame_bus  # name of a shared memory frame bus for live consumers in other processes, see recorders/frame_bus.py
+        self.frame_bus_slots = frame_bus_slots
+        self.bus = None
+        self.segment_duration = segment_duration  # rotate the output file, see recorders/segments.py
+        self.segment_size = segment_size
+        self.segmented = segment_duration is not None or segment_size is not None
+        self.metrics = RecorderMetrics('webcam')  # see stats()
+        self.frame_count = 0  # frames taken (the frame_number in the timestamps index)
+        self.settings = None  # TimestampIndexWriter of the fps and downscale_factor changes, see set_quality()
+        self.settings_lock = threading.Lock()
+
+        # Open the webcam (or use the given cv2.VideoCapture-like object, e.g. a SyntheticCamera from recorders/sources.py)
+        self.cap = capture if capture is not None else cv2.VideoCapture(self.camera_index)
+        # Timestamps of the frames (see recorders/timestamp_index.py), of the first segment if the recording is segmented
+        self.timestamps_path = timestamps_path(segment_path(self.output_file, 0 if self.segmented else None))
 
         # Check if the webcam is opened properly
         if not self.cap.isOpened():
@@ -58,12 +78,10 @@ class WebcamRecorder:
         self.cap.set(cv2.CAP_PROP_FPS, self.fps)
         self.cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*'MJPG'))
 
-        # Define the codec and create a VideoWriter object
-        self.fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-        self.out = cv2.VideoWriter(self.output_file, self.fourcc, self.fps, (self.width, self.height))
-
     def start(self):
         self.recording = True
+        self.metrics = RecorderMetrics('webcam')
+        self.metrics.count('late_frames', 0)
         self.thread = threading.Thread(target=self._record)
         self.thread.start()
 
@@ -73,37 +91,115 @@ class WebcamRecorder:
             self.thread.join()
 
         self.cap.release()
-        self.out.release()
+        if self.out is not None:
+            self.out.close()
+        if self.bus is not None:
+            self.bus.close()
+            self.bus = None
 
         self.thread = None
 
-    def _record(self):
-        # OpenCV with(!) FFMPEG installation to be able to use 'H264' codec instead of 'MP4V'
-        self.out = cv2.VideoWriter(str(self.output_file), cv2.VideoWriter_fourcc(*'mp4v'), self.fps, (self.width, self.height))
-
-        if not self.out.isOpened():
-            print("Error: Video Writer could not be opened.")
-            return
+    def stats(self):
+        # Runtime metrics (see recorders/metrics.py): frames (rate and interval), read, resize and encode latency,
+        # late_frames (frames that overran their slot) and bytes_written
+        stats = self.metrics.snapshot()
+        stats['bytes_written'] = self.out.bytes_written if self.out is not None else 0
+        return stats
+
+    def set_quality(self, fps=None, downscale_factor=None, stream=None):
+        # Change the frame rate and/or resolution while recording, logged to <name>_settings.bin (see recorders/adaptive.py).
+        # The camera keeps delivering at its own rate, fewer of its frames are taken. A new resolution starts a new segment.
+        with self.settings_lock:
+            if downscale_factor is not None and downscale_factor != self.downscale_factor and self.recording and not self.segmented:
+                raise ValueError("Changing the downscale_factor while recording needs segment_duration or segment_size")
+            if fps is not None:
+                self.fps = fps
+                if self.out is not None:
+                    self.out.fps = fps  # the nominal frame rate of the next segments
+            if downscale_factor is not None:
+                self.downscale_factor = downscale_factor
+            if self.settings is not None:
+                self.settings.write(self.frame_count, self.clock.time(), self.fps, self.downscale_factor)
+                self.settings.flush()
+
+    def stream_cost(self, stream=None):
+        # Seconds spent resizing and encoding frames since the start (reading mostly waits for the camera)
+        histograms = self.metrics.histograms
+        return sum(histograms[key].total for key in ('resize_latency', 'encode_latency') if key in histograms)
+
+    def missed_frames(self):
+        return self.metrics.counters.get('late_frames', 0)
+
+    def fetch_frames(self, return_timestamps=False):
+        # Get the frames captured since the previous call, stacked into one array
+        frames, timestamps = self.frames.fetch()
+        if return_timestamps:
+            return frames, timestamps
+        return frames
 
-        frame_duration = 1 / self.fps
-        start_time = time.time()
-        frame_count = 0
+    def _record(self):
+        self.out = None  # created from the first frame: CAP_PROP_FRAME_WIDTH/HEIGHT can't be trusted (see __init__)
+        self.frame_count = 0
+        with self.settings_lock:
+            self.settings = TimestampIndexWriter(settings_path(self.output_file), record_format=SETTINGS_INDEX_FORMAT)
+            self.settings.write(0, self.clock.time(), self.fps, self.downscale_factor)
+            self.settings.flush()
+        try:
+            self._record_frames()
+        finally:
+            # Finalize the video and the settings also if the loop failed, so the recording so far stays readable
+            if self.out is not None:
+                self.out.close()
+            with self.settings_lock:
+                self.settings.close()
+                self.settings = None
+
+    def _record_frames(self):
+        # Every frame is scheduled one period of the current fps after the previous one, so fps changes apply right away
+        next_frame_time = time.time()
+        metrics = self.metrics
 
         while self.recording:
+            read_start = time.perf_counter()
             ret, frame = self.cap.read()
             if not ret:
                 print("Error: Could not read frame from webcam.")
                 break
-            with self.csv_path.open('a') as f:
-                f.write(f"{frame_count},{time.time()}\n")
-
-
-            self.out.write(frame)
-            self.frames.append(frame)
-            self.frames = self.frames[-self.memory_limit:]
-
-            print(f"Recording Frame: {frame_count}")
-
-            frame_count += 1
-            next_frame_time = start_time + frame_count * frame_duration
+            metrics.observe('read_latency', time.perf_counter() - read_start)
+            timestamp = self.clock.time()
+            metrics.tick('frames')
+            pts = self.cap.get(cv2.CAP_PROP_POS_MSEC) / 1000  # capture time reported by the camera driver
+            with self.settings_lock:
+                frame_number, downscale_factor = self.frame_count, self.downscale_factor
+                self.frame_count += 1
+            if downscale_factor != 1:
+                resize_start = time.perf_counter()
+                frame = cv2.resize(frame, (frame.shape[1] // downscale_factor, frame.shape[0] // downscale_factor), interpolation=cv2.INTER_AREA)
+                metrics.observe('resize_latency', time.perf_counter() - resize_start)
+            if self.out is None:
+                # encoder='ffmpeg' gives H264 without an OpenCV build with(!) FFMPEG
+                self.out = VideoSegmentWriter(self.output_file, self.fps, (frame.shape[1], frame.shape[0]), self.encoder, self.encoder_options,
+                                              self.segment_duration, self.segment_size)
+            encode_start = time.perf_counter()
+            try:
+                self.out.write(frame_number, timestamp, frame, pts)  # the frame and its timestamps index record
+            except (IOError, ValueError) as e:  # ValueError: the camera changed its resolution in an unsegmented recording
+                print(f"Error: {e}")
+                break
+            metrics.observe('encode_latency', time.perf_counter() - encode_start)
+            self.frames.push(frame, timestamp)
+            if self.frame_bus is not None:
+                if self.bus is None:
+                    self.bus = FrameBusPublisher(self.frame_bus, frame.shape, frame.dtype, slots=self.frame_bus_slots)
+                if frame.shape != self.bus.shape:
+                    frame = cv2.resize(frame, (self.bus.shape[1], self.bus.shape[0]), interpolation=cv2.INTER_AREA)  # the bus keeps its shape
+                self.bus.publish(frame, timestamp)
+
+            next_frame_time += 1 / self.fps
             sleep_time = next_frame_time - time.time()
+            if sleep_time > 0:
+                time.sleep(sleep_time)  # Sleep to limit the frame rate up to fps
+            else:
+                metrics.count('late_frames')
+                if sleep_time < -1 / self.fps:
+                    next_frame_time = time.time()  # more than a frame behind: don't catch up in a burst
@@ -9,7 +9,7 @@ pactl load-module module-loopback latency_msec=1
 # Start your Python script
 #python recorder_allinone.py
 #python recorder_copy2.py
-python recorder.py
+python recorder.py  # add --processes to run every recorder in its own process
 
 # Stop pulseaudio loopback
 pactl unload-module module-loopback